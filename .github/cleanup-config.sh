@@ -36,11 +36,11 @@ cleanup_old_date_dirs() {
         echo "当前日期: $current_date"
         echo "截止日期: $cutoff_date (此日期之前的目录将被删除)"
 
-        # 遍历所有日期目录（格式为YYYYMMDD）
+        # 遍历所有日期目录（格式为YYYYMMDD）和打包文件（YYYYMMDD.pack）
         for date_dir in "$base_dir"/*; do
-            if [ -d "$date_dir" ]; then
+            if [ -d "$date_dir" ] || [[ "$date_dir" == *.pack ]]; then
                 # 提取目录名中的日期部分
-                local dirname=$(basename "$date_dir")
+                local dirname=$(basename "$date_dir" .pack)
 
                 # 检查是否是有效的日期格式（8位数字）
                 if [[ "$dirname" =~ ^[0-9]{8}$ ]]; then
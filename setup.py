@@ -11,6 +11,9 @@ setup(
         "requests",
         "imgkit"
     ],
+    extras_require={
+        "s3": ["boto3"],
+    },
     entry_points={
         "console_scripts": [
             "weather-spider=weather_spider.daily_summary:main",
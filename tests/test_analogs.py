@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""历史相似预报检索的测试"""
+
+import random
+
+from weather_spider.analogs import AnalogIndex, BKTree, hamming
+
+
+def brute_force(items, query_hash, k, accept=None):
+    results = sorted((hamming(query_hash, value_hash), value) for value_hash, value in items
+                     if accept is None or accept(value))
+    return results[:k]
+
+
+def test_hamming():
+    assert hamming(0, 0) == 0
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(0, 2 ** 64 - 1) == 64
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(7)
+    items = [(rng.getrandbits(64), f"2025{index:04d}") for index in range(300)]
+    # 加入重复哈希和相近哈希，覆盖距离为0的节点
+    items.append((items[0][0], "20269999"))
+    items.append((items[1][0] ^ 0b101, "20269998"))
+    tree = BKTree()
+    for value_hash, value in items:
+        tree.add(value_hash, value)
+    assert tree.size == len(items)
+
+    for _ in range(20):
+        query_hash = rng.getrandbits(64)
+        assert tree.nearest(query_hash, 5) == brute_force(items, query_hash, 5)
+    for query_hash, _ in items[:3]:
+        assert tree.nearest(query_hash, 3) == brute_force(items, query_hash, 3)
+
+
+def test_nearest_with_accept_filter():
+    rng = random.Random(11)
+    items = [(rng.getrandbits(64), f"2025{index:04d}") for index in range(100)]
+    tree = BKTree()
+    for value_hash, value in items:
+        tree.add(value_hash, value)
+
+    accept = lambda value: value < "20250050"
+    query_hash = items[80][0]
+    results = tree.nearest(query_hash, 4, accept=accept)
+    assert results == brute_force(items, query_hash, 4, accept=accept)
+    assert all(value < "20250050" for _, value in results)
+
+
+def test_nearest_edge_cases():
+    tree = BKTree()
+    assert tree.nearest(0, 3) == []
+    tree.add(0b1111, "20250101")
+    assert tree.nearest(0, 0) == []
+    assert tree.nearest(0, 3) == [(4, "20250101")]
+
+
+def test_find_analogs_only_returns_earlier_dates(tmp_path):
+    index = AnalogIndex(str(tmp_path))
+    name = "pcp_soybeans_usa_iowa_forecast.png"
+    index.images[name] = {"20250101": 0b0000, "20250102": 0b0001, "20250103": 0b0011, "20250104": 0b0111}
+
+    assert index.find_analogs(name, "20250103", top=5) == [(1, "20250102"), (2, "20250101")]
+    assert index.find_analogs(name, "20250105") is None
+
+
+def test_index_survives_save_and_corruption(tmp_path):
+    index = AnalogIndex(str(tmp_path))
+    index.images["pcp_soybeans_usa_iowa_forecast.png"] = {"20250101": 2 ** 63 + 5}
+    index.save()
+    assert AnalogIndex(str(tmp_path)).images == index.images
+
+    with open(index.path, "w", encoding="utf-8") as f:
+        f.write('{"version": 1, "hash_')
+    assert AnalogIndex(str(tmp_path)).images == {}
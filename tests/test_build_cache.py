@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""增量构建缓存的测试"""
+
+import os
+
+from weather_spider.build_cache import BuildCache
+
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_pairs(tmp_path):
+    today_path = str(tmp_path / "today.png")
+    yesterday_path = str(tmp_path / "yesterday.png")
+    write_file(today_path, b"today")
+    write_file(yesterday_path, b"yesterday")
+    return [(today_path, yesterday_path, "usa", "iowa")]
+
+
+def test_fingerprint_is_stable_for_same_inputs(tmp_path):
+    pairs = make_pairs(tmp_path)
+    first = BuildCache(str(tmp_path / "out")).fingerprint(pairs, group={"name": "usa"}, scale=2.5)
+    second = BuildCache(str(tmp_path / "out")).fingerprint(pairs, scale=2.5, group={"name": "usa"})
+    assert first == second
+
+
+def test_fingerprint_changes_when_an_input_changes(tmp_path):
+    pairs = make_pairs(tmp_path)
+    before = BuildCache(str(tmp_path / "out")).fingerprint(pairs, scale=2.5)
+    write_file(pairs[0][0], b"today, updated")
+    # 摘要在同一个缓存实例内只计算一次，新的一次运行才能看到变化
+    after = BuildCache(str(tmp_path / "out")).fingerprint(pairs, scale=2.5)
+    assert before != after
+
+
+def test_fingerprint_changes_when_the_definition_changes(tmp_path):
+    pairs = make_pairs(tmp_path)
+    cache = BuildCache(str(tmp_path / "out"))
+    assert cache.fingerprint(pairs, scale=2.5) != cache.fingerprint(pairs, scale=3.0)
+    assert cache.fingerprint(pairs, group={"regions": ["usa"]}) != cache.fingerprint(pairs, group={"regions": ["brazil"]})
+    moved = [pairs[0][:2] + ("usa", "illinois")]
+    assert cache.fingerprint(pairs, scale=2.5) != cache.fingerprint(moved, scale=2.5)
+
+
+def test_missing_input_still_fingerprints(tmp_path):
+    cache = BuildCache(str(tmp_path / "out"))
+    pairs = [(str(tmp_path / "missing.png"), str(tmp_path / "also_missing.png"), "usa", "iowa")]
+    assert cache.input_digest(pairs[0][0]) is None
+    assert cache.fingerprint(pairs) == cache.fingerprint(pairs)
+
+
+def test_record_and_is_fresh(tmp_path):
+    output_dir = str(tmp_path / "out")
+    output_path = os.path.join(output_dir, "weather_summary_pcp_20260101.png")
+    pairs = make_pairs(tmp_path)
+    cache = BuildCache(output_dir)
+    fingerprint = cache.fingerprint(pairs)
+
+    # 输出文件不存在时不算最新
+    cache.record(output_path, fingerprint)
+    assert not cache.is_fresh(output_path, fingerprint)
+
+    write_file(output_path, b"png")
+    assert cache.is_fresh(output_path, fingerprint)
+    assert not cache.is_fresh(output_path, "other")
+
+    # 清单持久化，下一次运行可以读取
+    reloaded = BuildCache(output_dir)
+    assert reloaded.is_fresh(output_path, fingerprint)
+    assert not BuildCache(output_dir, enabled=False).is_fresh(output_path, fingerprint)
+
+
+def test_corrupt_manifest_is_ignored(tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    write_file(str(output_dir / ".build_cache.json"), b"{not json")
+    assert BuildCache(str(output_dir)).entries == {}
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""相邻两天图片差分编码的测试"""
+
+import io
+
+from PIL import Image
+
+from weather_spider import delta
+
+SIZE = (32, 24)
+PALETTE = [value for index in range(16) for value in (index * 16, 255 - index * 16, index * 8)]
+
+
+def reopen(image):
+    """经过一次PNG保存和读取，得到与下载图片一致的 mode 和 info"""
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def palette_image(shift, transparency=None):
+    image = Image.new("P", SIZE)
+    image.putpalette(PALETTE)
+    image.putdata([(x + y + shift) % 16 if x > 8 else 0 for y in range(SIZE[1]) for x in range(SIZE[0])])
+    if transparency is not None:
+        image.info["transparency"] = transparency
+    return reopen(image)
+
+
+def round_trip(image, base_image):
+    payload = delta.encode(image, base_image, "20260101", 1)
+    header, _ = delta.read_header(payload)
+    assert header["base"] == "20260101"
+    assert header["depth"] == 1
+    return header, delta.apply(base_image, payload)
+
+
+def test_palette_round_trip_is_pixel_exact():
+    base_image, image = palette_image(0), palette_image(3)
+    header, restored = round_trip(image, base_image)
+
+    assert header["mode"] == "P"
+    assert restored.mode == "P"
+    assert restored.tobytes() == image.tobytes()
+    assert restored.getpalette() == image.getpalette()
+
+
+def test_palette_round_trip_keeps_trns_alpha_per_index():
+    alpha = bytes([0] + [255] * 7 + [128] * 8)
+    base_image, image = palette_image(0, alpha), palette_image(5, alpha)
+    assert isinstance(image.info["transparency"], bytes)
+
+    header, restored = round_trip(image, base_image)
+
+    assert header["transparency"] == list(alpha)
+    assert restored.info["transparency"] == image.info["transparency"]
+    assert restored.convert("RGBA").tobytes() == image.convert("RGBA").tobytes()
+    # 还原后的图片可以再次保存为PNG，透明度不变
+    assert reopen(restored).convert("RGBA").tobytes() == image.convert("RGBA").tobytes()
+
+
+def test_palette_round_trip_keeps_single_transparent_index():
+    base_image, image = palette_image(0, 0), palette_image(2, 0)
+    header, restored = round_trip(image, base_image)
+
+    assert header["transparency"] == 0
+    assert restored.info["transparency"] == 0
+    assert restored.convert("RGBA").tobytes() == image.convert("RGBA").tobytes()
+
+
+def test_different_palettes_fall_back_to_rgb_pixels():
+    base_image = palette_image(0)
+    image = Image.new("P", SIZE)
+    image.putpalette(list(reversed(PALETTE)))
+    image.putdata([(x * y) % 16 for y in range(SIZE[1]) for x in range(SIZE[0])])
+    image = reopen(image)
+
+    header, restored = round_trip(image, base_image)
+
+    assert header["mode"] == "RGB"
+    assert restored.tobytes() == image.convert("RGB").tobytes()
+
+
+def test_rgb_and_grayscale_round_trip():
+    for mode, color in (("RGB", (10, 200, 30)), ("L", 90)):
+        base_image = Image.new(mode, SIZE, color)
+        image = base_image.copy()
+        image.paste(Image.new(mode, (8, 8), 250 if mode == "L" else (250, 5, 128)), (4, 4))
+
+        header, restored = round_trip(image, base_image)
+
+        assert header["mode"] == mode
+        assert restored.tobytes() == image.tobytes()
+
+
+def test_size_change_is_stored_as_keyframe():
+    assert delta.encode(Image.new("L", (4, 4)), Image.new("L", (5, 4)), "20260101", 1) is None
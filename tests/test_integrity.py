@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""下载图片完整性校验的测试"""
+
+import io
+import hashlib
+
+import pytest
+from PIL import Image
+
+from weather_spider.integrity import PNG_SIGNATURE, InvalidImageError, validate_png_bytes, validate_png_file
+
+
+def png_bytes(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (20, 120, 220)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_valid_png_returns_sha256():
+    content = png_bytes()
+    assert validate_png_bytes(content, placeholder_hashes=set()) == hashlib.sha256(content).hexdigest()
+
+
+def test_valid_png_fed_in_small_pieces(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(png_bytes())
+    assert validate_png_file(str(path), placeholder_hashes=set(), chunk_size=3)
+
+
+@pytest.mark.parametrize("length", [0, 5, len(PNG_SIGNATURE) + 10, -12, -1])
+def test_truncated_png_is_rejected(length):
+    content = png_bytes()
+    with pytest.raises(InvalidImageError):
+        validate_png_bytes(content[:length], placeholder_hashes=set())
+
+
+def test_crc_mismatch_is_rejected():
+    content = bytearray(png_bytes())
+    # IHDR 数据中的宽度字节（签名8字节 + 长度和类型8字节之后）
+    content[len(PNG_SIGNATURE) + 8] ^= 0xFF
+    with pytest.raises(InvalidImageError, match="CRC"):
+        validate_png_bytes(bytes(content), placeholder_hashes=set())
+
+
+def test_trailing_data_and_non_png_are_rejected():
+    with pytest.raises(InvalidImageError):
+        validate_png_bytes(png_bytes() + b"extra", placeholder_hashes=set())
+    with pytest.raises(InvalidImageError, match="不是PNG"):
+        validate_png_bytes(b"<html>not found</html>", placeholder_hashes=set())
+
+
+def test_placeholder_is_rejected():
+    content = png_bytes()
+    placeholder = hashlib.sha256(content).hexdigest()
+    with pytest.raises(InvalidImageError, match="占位图"):
+        validate_png_bytes(content, placeholder_hashes={placeholder})
+    assert validate_png_bytes(png_bytes((41, 30)), placeholder_hashes={placeholder})
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""报告分组的测试"""
+
+from weather_spider.config import DEFAULT_REPORT_GROUPS
+from weather_spider.reports import (ReportGroup, group_crops, load_groups, needed_by_groups,
+                                    parse_image_filename, partition_pairs)
+
+
+def make_pair(filename):
+    return {"filename": filename, "current": f"today/{filename}", "previous": f"yesterday/{filename}"}
+
+
+def subregions(rows):
+    return [(region, subregion) for _, _, region, subregion in rows]
+
+
+def test_parse_image_filename():
+    assert parse_image_filename("pcp_soybeans_usa_iowa_forecast.png") == {
+        "vrbl": "pcp", "crop": "soybeans", "region": "usa", "subregion": "iowa", "horizon": "forecast",
+    }
+    assert parse_image_filename("pcp_soybeans_usa.png") is None
+
+
+def test_partition_pairs_assigns_each_pair_to_every_matching_group():
+    pairs = [make_pair(name) for name in (
+        "pcp_soybeans_brazil_parana_forecast.png",
+        "pcp_soybeans_usa_iowa_forecast.png",
+        "pcp_soybeans_china_heilongjiang_forecast.png",
+        "not_a_download.png",
+    )]
+
+    partitions = partition_pairs(pairs, load_groups(DEFAULT_REPORT_GROUPS))
+
+    assert subregions(partitions["usa"]) == [("usa", "iowa")]
+    assert subregions(partitions["brazil"]) == [("brazil", "parana")]
+    assert partitions["argentina"] == []
+    assert subregions(partitions["others"]) == [("china", "heilongjiang")]
+    # "all" 包含所有图片，按网站列表顺序排列（美国在巴西之前）
+    assert subregions(partitions["all"]) == [("usa", "iowa"), ("brazil", "parana"), ("china", "heilongjiang")]
+    assert partitions["usa"][0][:2] == ("today/pcp_soybeans_usa_iowa_forecast.png",
+                                        "yesterday/pcp_soybeans_usa_iowa_forecast.png")
+
+
+def test_partition_pairs_orders_by_source_or_by_name():
+    pairs = [make_pair(name) for name in (
+        "pcp_soybeans_usa_minnesota_forecast.png",
+        "pcp_soybeans_usa_illinois_forecast.png",
+        "pcp_soybeans_usa_iowa_forecast.png",
+    )]
+    groups = [ReportGroup("source", regions=["usa"]), ReportGroup("name", regions=["usa"], order="name")]
+
+    partitions = partition_pairs(pairs, groups)
+
+    assert [subregion for _, subregion in subregions(partitions["source"])] == ["iowa", "illinois", "minnesota"]
+    assert [subregion for _, subregion in subregions(partitions["name"])] == ["illinois", "iowa", "minnesota"]
+
+
+def test_partition_pairs_respects_crop_and_subregion_filters():
+    pairs = [make_pair(name) for name in (
+        "tmp_corn_usa_iowa_forecast.png",
+        "tmp_soybeans_usa_iowa_forecast.png",
+        "tmp_soybeans_usa_illinois_forecast.png",
+    )]
+    groups = [ReportGroup("corn", crops=["corn"]), ReportGroup("iowa", subregions=["iowa"], exclude_regions=["brazil"])]
+
+    partitions = partition_pairs(pairs, groups)
+
+    assert [row[0] for row in partitions["corn"]] == ["today/tmp_corn_usa_iowa_forecast.png"]
+    assert len(partitions["iowa"]) == 2
+
+
+def test_group_crops_and_needed_by_groups():
+    groups = [ReportGroup("usa", regions=["usa"]), ReportGroup("wheat", crops=["wheat"], regions=["europe"])]
+
+    assert group_crops(groups, ["soybeans"]) == {"soybeans", "wheat"}
+    assert needed_by_groups(groups, ["soybeans"], "soybeans", "usa", "iowa")
+    assert needed_by_groups(groups, ["soybeans"], "wheat", "europe", "france")
+    # 未指定 crops 的分组只需要默认作物
+    assert not needed_by_groups(groups, ["soybeans"], "corn", "usa", "iowa")
+    assert not needed_by_groups(groups, ["soybeans"], "wheat", "usa", "iowa")
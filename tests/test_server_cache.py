@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""按需对比图服务的内存和磁盘LRU缓存测试"""
+
+import os
+import time
+
+from weather_spider.server import TMP_SUFFIX, DiskLRU, MemoryLRU
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = MemoryLRU(max_bytes=25)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    assert cache.get("a") == b"a" * 10  # a 变为最近使用
+
+    cache.put("c", b"c" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.size == 20
+
+
+def test_memory_lru_replaces_existing_key_and_skips_oversized_values():
+    cache = MemoryLRU(max_bytes=25)
+    cache.put("a", b"a" * 10)
+    cache.put("a", b"a" * 20)
+    assert cache.size == 20
+
+    cache.put("big", b"x" * 30)
+    assert cache.get("big") is None
+    assert cache.get("a") == b"a" * 20
+
+
+def commit_bytes(cache, key, data):
+    tmp_path = os.path.join(cache.directory, f"{key}{TMP_SUFFIX}")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    cache.commit(key, tmp_path)
+
+
+def test_disk_lru_evicts_least_recently_used_file(tmp_path):
+    cache = DiskLRU(str(tmp_path), max_bytes=25)
+    commit_bytes(cache, "a", b"a" * 10)
+    commit_bytes(cache, "b", b"b" * 10)
+    past = time.time() - 100
+    os.utime(cache.path_for("a"), (past, past))
+    os.utime(cache.path_for("b"), (past + 1, past + 1))
+    # 命中会更新修改时间，a 变为最近使用
+    assert cache.get("a") == b"a" * 10
+
+    commit_bytes(cache, "c", b"c" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 10
+    assert cache.get("c") == b"c" * 10
+
+
+def test_disk_lru_ignores_in_progress_renders(tmp_path):
+    cache = DiskLRU(str(tmp_path), max_bytes=15)
+    in_progress = tmp_path / f"other{TMP_SUFFIX}"
+    in_progress.write_bytes(b"x" * 100)
+
+    commit_bytes(cache, "a", b"a" * 10)
+
+    assert in_progress.exists()
+    assert cache.get("a") == b"a" * 10
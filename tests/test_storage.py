@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""下载目录打包和保留天数的测试"""
+
+import os
+import random
+
+from PIL import Image
+
+from weather_spider import storage
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_pack_day_reads_members_through_original_paths(tmp_path):
+    day_path = str(tmp_path / "pcp" / "20260101")
+    write_file(os.path.join(day_path, "a.png"), b"first")
+    write_file(os.path.join(day_path, "b.png"), b"second")
+
+    pack_path = storage.pack_day(day_path)
+
+    assert os.path.exists(pack_path)
+    assert not os.path.isdir(day_path)
+    assert storage.day_exists(day_path)
+    assert storage.list_day(day_path) == ["a.png", "b.png"]
+    assert storage.image_exists(os.path.join(day_path, "a.png"))
+    assert not storage.image_exists(os.path.join(day_path, "c.png"))
+    assert storage.read_bytes(os.path.join(day_path, "b.png")) == b"second"
+    assert storage.stat_signature(os.path.join(day_path, "c.png")) is None
+
+
+def test_pack_day_merges_new_files_into_existing_pack(tmp_path):
+    day_path = str(tmp_path / "pcp" / "20260101")
+    write_file(os.path.join(day_path, "a.png"), b"old")
+    write_file(os.path.join(day_path, "b.png"), b"kept")
+    storage.pack_day(day_path)
+
+    write_file(os.path.join(day_path, "a.png"), b"new")
+    write_file(os.path.join(day_path, "c.png"), b"added")
+    storage.pack_day(day_path)
+
+    assert storage.list_day(day_path) == ["a.png", "b.png", "c.png"]
+    assert storage.read_bytes(os.path.join(day_path, "a.png")) == b"new"
+    assert storage.read_bytes(os.path.join(day_path, "b.png")) == b"kept"
+    assert not os.path.exists(storage.pack_path_for(day_path) + ".tmp")
+
+
+def test_compact_downloads_packs_past_days_and_applies_retention(tmp_path):
+    save_root = str(tmp_path)
+    for date_str in ("20260101", "20260105", "20260109", "20260110"):
+        write_file(os.path.join(save_root, "tmp", date_str, "a.png"), date_str.encode())
+
+    stats = storage.compact_downloads(save_root, today_str="20260110", retention_days=7)
+
+    vrbl_path = os.path.join(save_root, "tmp")
+    assert stats == {"packed": 2, "removed": 1, "rekeyed": 0}
+    assert sorted(storage.iter_day_entries(vrbl_path)) == ["20260105", "20260109", "20260110"]
+    # 当天目录可能仍在写入，保持为普通目录
+    assert os.path.isdir(os.path.join(vrbl_path, "20260110"))
+    assert os.path.exists(os.path.join(vrbl_path, "20260109.pack"))
+    assert storage.read_bytes(os.path.join(vrbl_path, "20260105", "a.png")) == b"20260105"
+
+
+def test_compact_downloads_without_retention_keeps_everything(tmp_path):
+    save_root = str(tmp_path)
+    write_file(os.path.join(save_root, "pcp", "20200101", "a.png"), b"x")
+
+    stats = storage.compact_downloads(save_root, today_str="20260110", retention_days=0)
+
+    assert stats == {"packed": 1, "removed": 0, "rekeyed": 0}
+    assert storage.day_exists(os.path.join(save_root, "pcp", "20200101"))
+
+
+def write_noise_png(path, seed, patch=None):
+    """写入一张随机噪声PNG（PNG压缩效果差，相邻两天的差分明显更小），patch 处改为纯色"""
+    rng = random.Random(seed)
+    image = Image.frombytes("L", (64, 64), bytes(rng.randrange(256) for _ in range(64 * 64)))
+    if patch is not None:
+        image.paste(patch, (8, 8, 24, 24))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(path, "PNG")
+    return image.tobytes()
+
+
+def test_compact_downloads_stores_deltas_and_rekeyframes_before_retention(tmp_path):
+    save_root = str(tmp_path)
+    vrbl_path = os.path.join(save_root, "pcp")
+    expected = {}
+    for index, date_str in enumerate(("20260101", "20260102", "20260103")):
+        path = os.path.join(vrbl_path, date_str, "pcp_soybeans_usa_iowa_forecast.png")
+        expected[date_str] = write_noise_png(path, seed=1, patch=index * 40)
+
+    storage.compact_downloads(save_root, today_str="20260110", retention_days=0, keyframe_interval=3)
+
+    members = {date_str: storage._pack_members(os.path.join(vrbl_path, date_str)) for date_str in expected}
+    assert members["20260101"] == ["pcp_soybeans_usa_iowa_forecast.png"]
+    assert members["20260102"] == ["pcp_soybeans_usa_iowa_forecast.png.delta"]
+    assert members["20260103"] == ["pcp_soybeans_usa_iowa_forecast.png.delta"]
+    for date_str, pixels in expected.items():
+        path = os.path.join(vrbl_path, date_str, "pcp_soybeans_usa_iowa_forecast.png")
+        assert storage.list_day(os.path.dirname(path)) == ["pcp_soybeans_usa_iowa_forecast.png"]
+        assert storage.open_image(path).tobytes() == pixels
+
+    # 删除第一天前，保留下来的第一天依赖它的差分被还原为关键帧
+    stats = storage.compact_downloads(save_root, today_str="20260108", retention_days=6)
+
+    assert stats == {"packed": 0, "removed": 1, "rekeyed": 1}
+    assert storage._pack_members(os.path.join(vrbl_path, "20260102")) == ["pcp_soybeans_usa_iowa_forecast.png"]
+    for date_str in ("20260102", "20260103"):
+        path = os.path.join(vrbl_path, date_str, "pcp_soybeans_usa_iowa_forecast.png")
+        assert storage.open_image(path).tobytes() == expected[date_str]
@@ -4,7 +4,9 @@
 weather_spider包的主入口点
 """
 
+import sys
+
 from .daily_summary import main
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
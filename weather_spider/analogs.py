@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史相似预报检索
+为每张下载的地图计算64位差分哈希（dHash），保存在 downloads/.phash_index.json。
+查询时按子地区建立BK树，按汉明距离找出与某一天最相似的历史日期，不需要重新读取任何图片。
+
+dHash 在去掉空白边距的内容区域上计算：缩小为 9x8 灰度图，比较每行相邻像素的明暗，
+降水/温度分布的整体形态相似时哈希接近，颜色和细节的微小差异影响不大。
+"""
+
+import os
+import json
+
+from PIL import Image
+
+from . import storage
+from .reports import parse_image_filename
+
+INDEX_NAME = ".phash_index.json"
+INDEX_VERSION = 1
+HASH_SIZE = 8  # 哈希为 HASH_SIZE * HASH_SIZE 位
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """计算图片内容区域的差分哈希，返回整数"""
+    from .image_generator import content_bbox
+
+    gray = image.convert("L")
+    small = gray.resize((hash_size + 1, hash_size), Image.Resampling.BOX, box=content_bbox(image))
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] < pixels[offset + column + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的BK树，每个节点的子节点按与该节点的距离分组，查询时用三角不等式剪枝"""
+
+    def __init__(self):
+        self.root = None  # [哈希, 值列表, {距离: 子节点}]
+        self.size = 0
+
+    def add(self, value_hash, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [value_hash, [value], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value_hash, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value_hash, [value], {}]
+                return
+            node = child
+
+    def nearest(self, query_hash, k, accept=None):
+        """返回最近的k个值 [(距离, 值), ...]，按距离和值排序
+
+        Args:
+            query_hash: 查询哈希
+            k: 返回数量
+            accept: 过滤函数，只返回 accept(值) 为真的值
+        """
+        results = []
+        if self.root is None or k <= 0:
+            return results
+
+        def radius():
+            return results[-1][0] if len(results) >= k else float("inf")
+
+        stack = [self.root]
+        while stack:
+            node_hash, values, children = stack.pop()
+            distance = hamming(query_hash, node_hash)
+            if distance <= radius():
+                for value in values:
+                    if accept is None or accept(value):
+                        results.append((distance, value))
+                results.sort()
+                del results[k:]
+            # 子树中的点与查询的距离至少为 |d - 子节点边的距离|
+            limit = radius()
+            for edge, child in children.items():
+                if abs(edge - distance) <= limit:
+                    stack.append(child)
+        return results
+
+
+class AnalogIndex:
+    """感知哈希索引：图片文件名（不含日期）-> {日期: 哈希}
+
+    Args:
+        save_root: 下载根目录
+    """
+
+    def __init__(self, save_root="downloads"):
+        self.save_root = save_root
+        self.path = os.path.join(save_root, INDEX_NAME)
+        self.images = {}
+        self.trees = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION and data.get("hash_size") == HASH_SIZE:
+                    self.images = {name: {date_str: int(value, 16) for date_str, value in dates.items()}
+                                   for name, dates in data.get("images", {}).items()}
+            except (OSError, ValueError, AttributeError) as e:
+                # 索引损坏（例如写入时进程被终止）时从空索引开始，update 会重新计算所有哈希
+                print(f"警告: 相似预报索引无法读取，将重新建立 {self.path} - {e}")
+                self.images = {}
+
+    def save(self):
+        os.makedirs(self.save_root, exist_ok=True)
+        data = {
+            "version": INDEX_VERSION,
+            "hash_size": HASH_SIZE,
+            "images": {name: {date_str: f"{value:016x}" for date_str, value in sorted(dates.items())}
+                       for name, dates in sorted(self.images.items())},
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def update(self, vrbls=("pcp", "tmp"), dates=None):
+        """为尚未索引的图片计算哈希（只列目录，已索引的图片不会被读取）
+
+        Args:
+            vrbls: 天气变量
+            dates: 只更新这些日期，为None时更新所有日期
+
+        Returns:
+            int: 新增的哈希数量
+        """
+        added = 0
+        for vrbl in vrbls:
+            for date_str, day_path in sorted(storage.iter_day_entries(os.path.join(self.save_root, vrbl)).items()):
+                if dates is not None and date_str not in dates:
+                    continue
+                for name in storage.list_day(day_path):
+                    if date_str in self.images.get(name, {}):
+                        continue
+                    try:
+                        with storage.open_image(os.path.join(day_path, name)) as image:
+                            value = dhash(image)
+                    except Exception as e:
+                        print(f"警告: 计算哈希失败 {day_path}/{name} - {e}")
+                        continue
+                    self.images.setdefault(name, {})[date_str] = value
+                    self.trees.pop(name, None)
+                    added += 1
+        if added:
+            self.save()
+        return added
+
+    def merge(self, other):
+        """合并另一个索引（例如分片的索引）中的哈希，不会删除本索引已有的日期
+
+        Returns:
+            int: 新增的哈希数量
+        """
+        added = 0
+        for name, dates in other.images.items():
+            existing = self.images.setdefault(name, {})
+            new_dates = {date_str: value for date_str, value in dates.items() if date_str not in existing}
+            if new_dates:
+                existing.update(new_dates)
+                self.trees.pop(name, None)
+                added += len(new_dates)
+        return added
+
+    def tree(self, name):
+        """某个图片（子地区）的BK树，第一次查询时建立"""
+        if name not in self.trees:
+            tree = BKTree()
+            for date_str, value in self.images.get(name, {}).items():
+                tree.add(value, date_str)
+            self.trees[name] = tree
+        return self.trees[name]
+
+    def find_analogs(self, name, date_str, top=5):
+        """与 date_str 当天最相似的历史日期（只包含更早的日期）
+
+        Returns:
+            list: [(汉明距离, 日期), ...]，当天没有索引时返回None
+        """
+        query_hash = self.images.get(name, {}).get(date_str)
+        if query_hash is None:
+            return None
+        return self.tree(name).nearest(query_hash, top, accept=lambda value: value < date_str)
+
+    def names(self, vrbl=None, subregions=None):
+        """索引中的图片文件名，可按天气变量和子地区过滤"""
+        result = []
+        for name in sorted(self.images):
+            info = parse_image_filename(name)
+            if info is None:
+                continue
+            if vrbl and info["vrbl"] != vrbl:
+                continue
+            if subregions and info["subregion"] not in subregions:
+                continue
+            result.append(name)
+        return result
+
+    def latest_date(self, names):
+        dates = [date_str for name in names for date_str in self.images.get(name, {})]
+        return max(dates) if dates else None
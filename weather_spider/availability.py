@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片可用性探测
+并不是每个图片编号下所有 作物/子地区/天数 的图片都存在，部分发布的日子里每张缺失的图片都要花一次完整的
+GET 加上带等待的重试。下载前先并发发送只请求1个字节的 Range GET，得到可用性表，只下载存在的图片。
+
+可用性表按图片编号缓存在 downloads/.availability/{编号}.json：存在的图片之后一直存在，不再探测；
+不存在的图片可能稍后发布，超过 AVAILABILITY_RECHECK_MINUTES 后重新探测。
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .config import config
+from .downloader import select_image_number
+
+CACHE_DIR_NAME = ".availability"
+
+# 只请求第一个字节；不支持 Range 的服务器会返回完整内容（200），同样视为存在
+PROBE_HEADERS = {"Range": "bytes=0-0"}
+
+# 明确表示图片不存在的状态码，其他失败（超时、5xx）视为未知，仍然下载
+MISSING_STATUS = (404, 410)
+
+
+class AvailabilityMap:
+    """一个图片编号的可用性表：网站路径 -> {"available": bool, "checked_at": 时间戳}
+
+    Args:
+        path: 缓存文件路径
+        recheck_seconds: 不存在的结果的有效期（秒）
+    """
+
+    def __init__(self, path, recheck_seconds):
+        self.path = path
+        self.recheck_seconds = recheck_seconds
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, url_path):
+        """已知存在返回True，不存在且未过期返回False，需要探测时返回None"""
+        with self.lock:
+            entry = self.entries.get(url_path)
+        if entry is None:
+            return None
+        if entry["available"]:
+            return True
+        if time.time() - entry["checked_at"] < self.recheck_seconds:
+            return False
+        return None
+
+    def set(self, url_path, available):
+        with self.lock:
+            self.entries[url_path] = {"available": available, "checked_at": round(time.time(), 3)}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def probe_url(network, url):
+    """探测一个URL
+
+    Returns:
+        bool: 存在返回True，明确不存在返回False，无法确定（超时、服务器错误）返回None
+    """
+    try:
+        response = network._get(url, timeout=config.request_timeout, headers=PROBE_HEADERS)
+    except requests.RequestException:
+        return None
+    if response.status_code in (200, 206):
+        return True
+    if response.status_code in MISSING_STATUS:
+        return False
+    return None
+
+
+class AvailabilityProbe:
+    """下载前的批量可用性探测
+
+    Args:
+        network: NetworkRequest
+        parser: WeatherParser，用于构建图片URL
+        cache_root: 缓存目录，默认 downloads/.availability
+        workers: 并发探测数
+        recheck_minutes: 不存在的结果的有效期（分钟）
+    """
+
+    def __init__(self, network, parser, cache_root=None, workers=None, recheck_minutes=None):
+        self.network = network
+        self.parser = parser
+        self.cache_root = cache_root or os.path.join("downloads", CACHE_DIR_NAME)
+        self.workers = workers or config.availability_workers
+        recheck_minutes = config.availability_recheck_minutes if recheck_minutes is None else recheck_minutes
+        self.recheck_seconds = recheck_minutes * 60
+        self.maps = {}
+
+    def availability_map(self, img_number):
+        if img_number not in self.maps:
+            path = os.path.join(self.cache_root, f"{img_number}.json")
+            self.maps[img_number] = AvailabilityMap(path, self.recheck_seconds)
+        return self.maps[img_number]
+
+    def _task_url(self, task, img_numbers):
+        img_number = select_image_number(img_numbers, task.vrbl, task.nday)
+        url = self.parser.build_image_url(task.crop_index, task.region_index, task.subregion_index, task.vrbl,
+                                          task.nday, img_number, base_url=self.network.base_url)
+        return img_number, url
+
+    def filter_tasks(self, tasks, img_numbers):
+        """探测所有任务的图片，返回 (需要下载的任务, 确认不存在的任务, 发出的探测请求数)
+
+        缓存中已知的结果不再探测；无法确定的图片仍然下载，由下载的重试流程处理。
+        """
+        states = [None] * len(tasks)
+        pending = []
+        for index, task in enumerate(tasks):
+            img_number, url = self._task_url(task, img_numbers)
+            if not url:
+                continue
+            url_path = url[len(self.network.base_url):]
+            known = self.availability_map(img_number).get(url_path)
+            if known is None:
+                pending.append((index, img_number, url, url_path))
+            else:
+                states[index] = known
+
+        def probe(item):
+            index, img_number, url, url_path = item
+            available = probe_url(self.network, url)
+            if available is not None:
+                self.availability_map(img_number).set(url_path, available)
+            states[index] = available
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(probe, pending))
+            for availability_map in self.maps.values():
+                availability_map.save()
+
+        available = [task for task, state in zip(tasks, states) if state is not False]
+        unavailable = [task for task, state in zip(tasks, states) if state is False]
+        return available, unavailable, len(pending)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史数据回填
+缓存丢失后按日期范围补齐 downloads/ 中缺失的图片，多线程并发下载，
+所有线程共享同一个连接池和限速器
+"""
+
+import os
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .config import config
+from .downloader import select_image_number
+from .network import NetworkRequest, RateLimiter, create_session
+from .parser import WeatherParser
+from . import storage
+
+
+def _parse_date(date_str):
+    return datetime.datetime.strptime(date_str, "%Y%m%d").date()
+
+
+def parse_image_numbers(text):
+    """解析 "fcst|pastpcp|pasttmp" 格式的图片编号（与 getcropimglabs.pl 的响应格式相同）"""
+    numbers = text.strip().split("|")
+    if len(numbers) == 1:
+        numbers = numbers * 3
+    if len(numbers) != 3:
+        raise ValueError(f"图片编号格式不正确: {text}")
+    return {"forecast": numbers[0], "past_pcp": numbers[1], "past_tmp": numbers[2]}
+
+
+def image_numbers_for_date(date_str, anchor_date_str, anchor_numbers, step=1):
+    """根据锚点推算某一天的图片编号
+
+    网站每天发布一期新图片，编号按天递增 step，因此可以从一个已知日期的编号往前推算。
+
+    Args:
+        date_str: 目标日期（YYYYMMDD）
+        anchor_date_str: 锚点日期（YYYYMMDD）
+        anchor_numbers: 锚点日期的图片编号
+        step: 每天编号的增量
+
+    Returns:
+        dict: 目标日期的图片编号
+    """
+    offset = (_parse_date(anchor_date_str) - _parse_date(date_str)).days * step
+    return {key: str(int(value) - offset) for key, value in anchor_numbers.items()}
+
+
+def plan_backfill(start_date_str, end_date_str, anchor_date_str, anchor_numbers,
+                  crop_indices=(1,), vrbls=("pcp", "tmp"), ndays=(15,), step=1, save_root="downloads",
+                  base_url="http://www.worldagweather.com"):
+    """列出日期范围内所有缺失的图片
+
+    Returns:
+        list: (image_url, save_path) 列表，已存在的图片不会出现在列表中
+    """
+    parser = WeatherParser()
+    tasks = parser.iter_image_tasks(crop_indices, vrbls, ndays)
+
+    plan = []
+    date = _parse_date(start_date_str)
+    end_date = _parse_date(end_date_str)
+    while date <= end_date:
+        date_str = date.strftime("%Y%m%d")
+        img_numbers = image_numbers_for_date(date_str, anchor_date_str, anchor_numbers, step)
+        for task in tasks:
+            save_path = parser.generate_save_path(task.crop_index, task.region_index, task.subregion_index,
+                                                  task.vrbl, task.nday, save_root=save_root, date_str=date_str)
+            if not save_path or storage.image_exists(save_path):
+                continue
+            image_url = parser.build_image_url(task.crop_index, task.region_index, task.subregion_index,
+                                               task.vrbl, task.nday,
+                                               select_image_number(img_numbers, task.vrbl, task.nday),
+                                               base_url=base_url)
+            if image_url:
+                plan.append((image_url, save_path))
+        date += datetime.timedelta(days=1)
+    return plan
+
+
+def backfill(start_date_str, end_date_str, anchor_date_str=None, anchor_numbers=None,
+             crop_indices=(1,), vrbls=("pcp", "tmp"), ndays=(15,), step=1,
+             workers=None, rate=None, save_root="downloads"):
+    """并发回填日期范围内缺失的图片
+
+    Args:
+        start_date_str: 开始日期（YYYYMMDD）
+        end_date_str: 结束日期（YYYYMMDD，包含）
+        anchor_date_str: 锚点日期，默认今天
+        anchor_numbers: 锚点日期的图片编号，默认从网站获取当前编号
+        crop_indices: 作物索引列表
+        vrbls: 天气变量列表
+        ndays: 天数列表
+        step: 每天图片编号的增量
+        workers: 并发线程数，默认使用 BACKFILL_WORKERS
+        rate: 每秒请求数上限，默认使用 BACKFILL_RATE
+        save_root: 下载根目录
+
+    Returns:
+        dict: 下载结果，键为图片保存路径，值为布尔值表示下载是否成功
+    """
+    from .daily_summary import log
+
+    workers = workers or config.backfill_workers
+    rate = config.backfill_rate if rate is None else rate
+    network = NetworkRequest(session=create_session(pool_size=workers), rate_limiter=RateLimiter(rate))
+
+    if anchor_date_str is None:
+        anchor_date_str = config.get_current_time().strftime("%Y%m%d")
+    if anchor_numbers is None:
+        anchor_numbers = network.get_image_numbers()
+        if not anchor_numbers:
+            log("获取当前图片编号失败，无法推算历史编号", "ERROR")
+            return {}
+
+    plan = plan_backfill(start_date_str, end_date_str, anchor_date_str, anchor_numbers,
+                         crop_indices, vrbls, ndays, step, save_root, network.base_url)
+    log(f"回填 {start_date_str} - {end_date_str}: 缺失 {len(plan)} 张图片，并发 {workers}，限速 {rate}/秒")
+
+    def _download(image_url, save_path):
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        return network.download_image(image_url, save_path)
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_download, image_url, save_path): save_path
+                       for image_url, save_path in plan}
+            for future in as_completed(futures):
+                save_path = futures[future]
+                try:
+                    results[save_path] = future.result()
+                except Exception:
+                    results[save_path] = False
+    finally:
+        network.close()
+
+    success_count = sum(1 for success in results.values() if success)
+    log(f"回填完成: {success_count}/{len(plan)} 下载成功", "SUCCESS")
+    return results
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量构建缓存
+为每个输出文件记录其输入图片、分组定义和渲染参数的指纹，
+指纹未变化且输出文件仍存在时跳过重新生成
+"""
+
+import os
+import json
+import hashlib
+
+from . import storage
+
+MANIFEST_NAME = ".build_cache.json"
+
+
+class BuildCache:
+    """输出目录的构建缓存，清单保存在 output/{date}/.build_cache.json"""
+
+    def __init__(self, output_dir, enabled=True):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = self._load()
+        # 同一次运行中多个分组共用输入图片，摘要只计算一次
+        self._digests = {}
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 合并其他进程（例如按需对比图服务）在此期间写入的记录，临时文件按进程区分
+        entries = self._load()
+        entries.update(self.entries)
+        self.entries = entries
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def input_digest(self, path):
+        """计算输入图片内容的摘要（支持打包文件中的图片）"""
+        if path not in self._digests:
+            try:
+                self._digests[path] = hashlib.sha1(storage.read_bytes(path)).hexdigest()
+            except OSError:
+                self._digests[path] = None
+        return self._digests[path]
+
+    def fingerprint(self, image_pairs, **definition):
+        """计算输出指纹
+
+        Args:
+            image_pairs: 图片对列表，格式为[(today_path, yesterday_path, region, subregion), ...]
+            **definition: 分组定义、字体、渲染参数等其他影响输出的内容（需可JSON序列化）
+
+        Returns:
+            str: 指纹
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(definition, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        for today_path, yesterday_path, region, subregion in image_pairs:
+            entry = [region, subregion, self.input_digest(today_path), self.input_digest(yesterday_path)]
+            digest.update(json.dumps(entry).encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_fresh(self, output_path, fingerprint):
+        """输出文件存在且指纹与上次相同"""
+        if not self.enabled or not os.path.exists(output_path):
+            return False
+        return self.entries.get(os.path.basename(output_path)) == fingerprint
+
+    def record(self, output_path, fingerprint):
+        """记录成功生成的输出文件指纹"""
+        self.entries[os.path.basename(output_path)] = fingerprint
+        self._save()
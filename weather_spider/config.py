@@ -5,6 +5,7 @@
 """
 
 import os
+import json
 import datetime
 from typing import Optional
 
@@ -21,6 +22,31 @@ except (ImportError, Exception) as e:
         # 如果都没有，使用系统时间（不推荐，但作为备选）
         HAS_ZONEINFO = None
 
+# 默认报告分组，按顺序生成
+# 字段说明：
+#   name: 分组名，用于输出文件名 weather_summary_{vrbl}_{name}_{date}.png
+#   display_name: 图片标题中的分组名称
+#   regions / subregions / crops: 只包含这些地区/子地区/作物（省略表示不限制）
+#   exclude_regions: 排除这些地区
+#   order: 组内排序，"source" 按网站列表顺序，"name" 按地区和子地区名称
+#   in_filename: 是否把分组名写入文件名（"all" 为 false，保持原有文件名）
+DEFAULT_REPORT_GROUPS = [
+    {"name": "usa", "display_name": "美国", "regions": ["usa"]},
+    {"name": "brazil", "display_name": "巴西", "regions": ["brazil"]},
+    {"name": "argentina", "display_name": "阿根廷", "regions": ["argentina"]},
+    {"name": "others", "display_name": "其他国家", "exclude_regions": ["usa", "brazil", "argentina"]},
+    {"name": "all", "display_name": "所有国家", "in_filename": False},
+]
+
+
+def load_report_groups(path=None):
+    """加载报告分组定义，path 为 JSON 文件（分组列表），为空时使用默认分组"""
+    if not path:
+        return DEFAULT_REPORT_GROUPS
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 class WeatherSpiderConfig:
     """天气爬虫配置类"""
 
@@ -31,6 +57,71 @@ class WeatherSpiderConfig:
         self.request_timeout = int(os.getenv('REQUEST_TIMEOUT', '30'))
         self.max_retries = int(os.getenv('MAX_RETRIES', '3'))
         self.retry_delay = int(os.getenv('RETRY_DELAY', '5'))
+        # 监听模式轮询图片编号的间隔（秒）
+        self.watch_interval = int(os.getenv('WATCH_INTERVAL', '120'))
+        # 历史回填的并发数和限速（每秒请求数，0表示不限速）
+        self.backfill_workers = int(os.getenv('BACKFILL_WORKERS', '8'))
+        self.backfill_rate = float(os.getenv('BACKFILL_RATE', '5'))
+        # downloads/ 的保留天数，压缩时删除更早的日期（0表示不删除）
+        self.retention_days = int(os.getenv('DOWNLOADS_RETENTION_DAYS', '90'))
+        # 差分存储的关键帧间隔（天），打包时其余日期保存为相对前一天的差分，0 表示不使用差分
+        self.delta_keyframe_interval = int(os.getenv('DELTA_KEYFRAME_INTERVAL', '0'))
+        # 增量构建：输入和渲染参数未变化时跳过重新生成对比图
+        self.build_cache_enabled = os.getenv('BUILD_CACHE', '1') != '0'
+        # 瓦片金字塔输出（供网页查看器按需加载），默认关闭
+        self.tile_pyramid = os.getenv('TILE_PYRAMID', '0') == '1'
+        self.tile_size = int(os.getenv('TILE_SIZE', '256'))
+        self.tile_format = os.getenv('TILE_FORMAT', 'png')
+        # 数据源：主站地址，以及逗号分隔的镜像地址或本地缓存目录（按优先级排列）
+        self.base_url = os.getenv('WEATHER_SPIDER_BASE_URL', 'http://www.worldagweather.com')
+        self.mirrors = [item for item in os.getenv('WEATHER_SPIDER_MIRRORS', '').split(',') if item.strip()]
+        # 对冲请求：超过近期延迟的该百分位仍未返回时向下一个数据源补发请求
+        self.hedge_percentile = float(os.getenv('HEDGE_PERCENTILE', '95'))
+        self.hedge_initial_delay_ms = int(os.getenv('HEDGE_INITIAL_DELAY_MS', '2000'))
+        # 网络传输模式：live 直接访问，record 访问并记录响应，replay 离线回放
+        self.transport_mode = os.getenv('WEATHER_SPIDER_TRANSPORT', 'live')
+        self.cassette_dir = os.getenv('WEATHER_SPIDER_CASSETTE', os.path.join('cassettes', 'default'))
+        self.replay_latency_ms = int(os.getenv('REPLAY_LATENCY_MS', '0'))
+        self.replay_failure_rate = float(os.getenv('REPLAY_FAILURE_RATE', '0'))
+        replay_seed = os.getenv('REPLAY_SEED')
+        self.replay_seed = int(replay_seed) if replay_seed else None
+        # 按需对比图服务的缓存：内存和磁盘LRU容量（MB）及磁盘缓存目录
+        self.service_memory_cache_mb = int(os.getenv('SERVICE_MEMORY_CACHE_MB', '256'))
+        self.service_disk_cache_mb = int(os.getenv('SERVICE_DISK_CACHE_MB', '2048'))
+        self.service_cache_dir = os.getenv('SERVICE_CACHE_DIR', os.path.join('output', '.service_cache'))
+        # 发布到S3兼容的对象存储（需要安装 boto3，凭证使用标准的 AWS_* 环境变量），未配置桶时不发布
+        self.s3_endpoint_url = os.getenv('S3_ENDPOINT_URL') or None
+        self.s3_bucket = os.getenv('S3_BUCKET', '')
+        self.s3_prefix = os.getenv('S3_PREFIX', '')
+        self.s3_upload_downloads = os.getenv('S3_UPLOAD_DOWNLOADS', '0') == '1'
+        self.s3_upload_workers = int(os.getenv('S3_UPLOAD_WORKERS', '8'))
+        self.s3_multipart_mb = int(os.getenv('S3_MULTIPART_MB', '8'))
+        # 运行截止时间（分钟，0 表示不限制）和为渲染预留的时间，临近截止时停止下载并用已有图片生成报告
+        self.run_deadline_minutes = float(os.getenv('RUN_DEADLINE_MINUTES', '0'))
+        self.render_reserve_minutes = float(os.getenv('RENDER_RESERVE_MINUTES', '5'))
+        # 下载前的可用性探测：并发数，以及"不存在"结果的有效期（分钟），之后重新探测
+        self.availability_probe = os.getenv('AVAILABILITY_PROBE', '1') != '0'
+        self.availability_workers = int(os.getenv('AVAILABILITY_WORKERS', '16'))
+        self.availability_recheck_minutes = float(os.getenv('AVAILABILITY_RECHECK_MINUTES', '30'))
+        # 已知的"无数据"占位图sha256（逗号分隔），下载到这些内容时视为失败并重试
+        self.placeholder_hashes = set(item.strip().lower() for item in os.getenv('PLACEHOLDER_SHA256', '').split(',')
+                                      if item.strip())
+        # 对比图使用的中文字体文件，为空时按内置候选列表查找（Linux runner 可安装 fonts-noto-cjk 或 fonts-wqy-zenhei）
+        self.font_path = os.getenv('WEATHER_SPIDER_FONT', '')
+        # 网格布局：每行的子地区数、画布宽度（0 表示默认的3200）和每格图片的放大倍数（0 表示默认的2.5）
+        self.grid_columns = int(os.getenv('GRID_COLUMNS', '1'))
+        self.grid_width = int(os.getenv('GRID_WIDTH', '0'))
+        self.grid_cell_scale = float(os.getenv('GRID_CELL_SCALE', '0'))
+        # 渲染内存预算（MB），超出时降低重建并发数或缩小放大倍数，0 表示不限制
+        self.render_memory_budget_mb = int(os.getenv('RENDER_MEMORY_BUDGET_MB', '0'))
+        # 缓存代理：缓存目录和图片编号的缓存时间（秒）
+        self.proxy_cache_dir = os.getenv('PROXY_CACHE_DIR', 'proxy_cache')
+        self.proxy_numbers_ttl = int(os.getenv('PROXY_NUMBERS_TTL', '60'))
+        # 报告分组定义，可通过 JSON 文件覆盖
+        self.report_groups = load_report_groups(os.getenv('WEATHER_SPIDER_REPORT_GROUPS'))
+        # 未指定 crops 的报告分组下载的作物（逗号分隔）
+        self.default_crops = [item.strip() for item in os.getenv('WEATHER_SPIDER_CROPS', 'soybeans').split(',')
+                              if item.strip()]
 
         # 日志文件始终使用 debug.log
         # 在GitHub Actions中，日志会通过artifact上传，不需要特殊处理
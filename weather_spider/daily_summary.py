@@ -1,10 +1,22 @@
 import os
 import sys
+import argparse
 import datetime
+from collections import OrderedDict
+from .analogs import AnalogIndex
+from .availability import CACHE_DIR_NAME, AvailabilityProbe
 from .downloader import ImageDownloader
 from .parser import WeatherParser
-from .image_generator import create_image_comparison
+from .image_generator import RowStrips, create_image_comparison, render_settings
+from .build_cache import BuildCache
+from .run_report import RunReport, REPORT_NAME
+from .publish import create_publisher, publish_outputs
+from .reports import (group_crops, load_groups, missing_by_group, needed_by_groups, parse_image_filename,
+                      partition_pairs)
+from .scheduler import Deadline, create_deadline, prioritize_tasks
 from .config import config
+from .memory import MB
+from . import storage
 
 # 缓存状态（从环境变量获取）
 CACHE_STATUS = os.getenv('GITHUB_CACHE_STATUS', 'unknown')
@@ -41,36 +53,65 @@ def log(message, level="INFO"):
 class DailyWeatherSummary:
     """每日天气数据汇总模块，用于生成今天和前一天的天气对比Word文档"""
     
-    def __init__(self):
-        self.downloader = ImageDownloader()
+    def __init__(self, save_date=None, img_numbers=None, downloads_root="downloads", output_root="output",
+                 shard=None, retry_filenames=None):
+        """
+        Args:
+            save_date: 指定保存日期（datetime），为None时根据19:30截止时间判断
+            img_numbers: 已知的图片编号（get_image_numbers的返回值），为None时下载前自动获取
+            downloads_root: 下载根目录
+            output_root: 输出根目录
+            shard: 分片 (index, count)，为None时处理全部任务
+            retry_filenames: 只下载这些文件名的图片（监听模式重试上次失败的图片），运行报告在已有报告上继续记录；
+                为None时下载全部图片
+        """
+        self.downloads_root = downloads_root
+        self.shard = shard
+        self.retry_filenames = retry_filenames
+        self.downloader = ImageDownloader(save_root=downloads_root)
         self.parser = WeatherParser()
+        self.img_numbers = img_numbers
+        self.report_groups = load_groups(config.report_groups)
+        # 对象存储发布器，运行时按配置创建，渲染出的图片立即提交后台上传
+        self.publisher = None
+        # 运行截止时间，run() 开始时按配置创建；默认没有截止时间
+        self.deadline = Deadline()
 
         # 使用配置获取当前时间
         now = config.get_current_time()
 
-        # 判断是否应该下载前一天的数据
-        if config.should_download_previous_day(now):
+        if save_date is not None:
+            # 显式指定日期（监听模式等），直接与前一天对比
+            self.save_date = save_date
+        elif config.should_download_previous_day(now):
             # 七点半前，下载昨天的数据，保存到昨天的文件夹
             self.save_date = now - datetime.timedelta(days=1)
-            self.compare_dates = {
-                'previous': (now - datetime.timedelta(days=2)).strftime('%Y%m%d'),
-                'current': self.save_date.strftime('%Y%m%d')
-            }
         else:
             # 七点半后，下载今天的数据，保存到今天的文件夹
             self.save_date = now
-            self.compare_dates = {
-                'previous': (now - datetime.timedelta(days=1)).strftime('%Y%m%d'),
-                'current': self.save_date.strftime('%Y%m%d')
-            }
+
+        self.compare_dates = {
+            'previous': (self.save_date - datetime.timedelta(days=1)).strftime('%Y%m%d'),
+            'current': self.save_date.strftime('%Y%m%d')
+        }
 
         self.save_date_str = self.save_date.strftime('%Y%m%d')
-        self.output_dir = os.path.join('output', self.save_date_str)
+        self.output_dir = os.path.join(output_root, self.save_date_str)
 
         # 创建输出目录
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
+        # 增量构建缓存，输入未变化的输出文件不重新生成
+        self.build_cache = BuildCache(self.output_dir, enabled=config.build_cache_enabled)
+
+        shard_spec = f"{shard[0]}/{shard[1]}" if shard else None
+        report_path = os.path.join(self.output_dir, REPORT_NAME)
+        if retry_filenames is not None and os.path.exists(report_path):
+            self.report = RunReport.load(report_path)
+        else:
+            self.report = RunReport(self.save_date_str, self.compare_dates, shard=shard_spec)
+
         # 打印启动信息
         log("=" * 50)
         log(f"启动时间: {now.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -82,74 +123,138 @@ class DailyWeatherSummary:
 
     def _check_cache_status(self):
         """检查缓存状态并打印"""
-        previous_pcp_path = os.path.join("downloads", "pcp", self.compare_dates['previous'])
-        previous_tmp_path = os.path.join("downloads", "tmp", self.compare_dates['previous'])
-        current_pcp_path = os.path.join("downloads", "pcp", self.compare_dates['current'])
-        current_tmp_path = os.path.join("downloads", "tmp", self.compare_dates['current'])
+        previous_pcp_path = self._previous_day_path("pcp")
+        previous_tmp_path = self._previous_day_path("tmp")
+        current_pcp_path = os.path.join(self.downloads_root, "pcp", self.compare_dates['current'])
+        current_tmp_path = os.path.join(self.downloads_root, "tmp", self.compare_dates['current'])
 
-        # 检查前一天数据
-        pcp_prev_exists = os.path.exists(previous_pcp_path)
-        tmp_prev_exists = os.path.exists(previous_tmp_path)
+        # 检查前一天数据（目录或打包文件均可）
+        pcp_prev_exists = storage.day_exists(previous_pcp_path)
+        tmp_prev_exists = storage.day_exists(previous_tmp_path)
 
         if pcp_prev_exists and tmp_prev_exists:
-            pcp_count = len(os.listdir(previous_pcp_path)) if pcp_prev_exists else 0
-            tmp_count = len(os.listdir(previous_tmp_path)) if tmp_prev_exists else 0
+            pcp_count = len(storage.list_day(previous_pcp_path)) if pcp_prev_exists else 0
+            tmp_count = len(storage.list_day(previous_tmp_path)) if tmp_prev_exists else 0
             log(f"缓存状态: 前一天数据存在 (pcp:{pcp_count}张, tmp:{tmp_count}张)", "SUCCESS")
         else:
             log(f"缓存状态: 前一天数据不存在 (首次运行)", "WARN")
 
         # 检查当天数据
-        pcp_curr_exists = os.path.exists(current_pcp_path)
-        tmp_curr_exists = os.path.exists(current_tmp_path)
+        pcp_curr_exists = storage.day_exists(current_pcp_path)
+        tmp_curr_exists = storage.day_exists(current_tmp_path)
 
         if pcp_curr_exists or tmp_curr_exists:
-            pcp_count = len(os.listdir(current_pcp_path)) if pcp_curr_exists else 0
-            tmp_count = len(os.listdir(current_tmp_path)) if tmp_curr_exists else 0
+            pcp_count = len(storage.list_day(current_pcp_path)) if pcp_curr_exists else 0
+            tmp_count = len(storage.list_day(current_tmp_path)) if tmp_curr_exists else 0
             log(f"缓存状态: 当天数据已存在 (pcp:{pcp_count}张, tmp:{tmp_count}张)", "INFO")
 
     def process_weather_data(self, weather_type):
-        """处理指定类型的天气数据"""
-        # 查找需要对比的图片对
-        image_pairs = self.find_image_pairs(weather_type)
+        """处理指定类型的天气数据
+
+        Returns:
+            list: 生成（或因输入未变化而保留）的图片路径
+        """
+        return self.render_groups([weather_type])
 
-        if not image_pairs:
-            return
+    def render_groups(self, weather_types):
+        """按分组顺序生成对比图片，每个分组依次生成各天气变量
 
-        # 为美国创建对比文档
-        self.create_comparison_document(weather_type, image_pairs, "usa")
+        分组顺序即用户阅读的优先顺序；到达截止时间后跳过剩余的分组。
+        每个天气变量的行条带只渲染一次，由各分组（包括 all）共用。
 
-        # 为巴西创建对比文档
-        self.create_comparison_document(weather_type, image_pairs, "brazil")
+        Returns:
+            list: 生成（或因输入未变化而保留）的图片路径
+        """
+        partitions = {}
+        missing = {}
+        for weather_type in weather_types:
+            # 查找需要对比的图片对
+            image_pairs = self.find_image_pairs(weather_type)
+            if not image_pairs:
+                continue
+            # 一次遍历把图片对分配到所有分组
+            partitions[weather_type] = partition_pairs(image_pairs, self.report_groups, self.parser)
+            missing[weather_type] = self.find_missing(weather_type, image_pairs)
+
+        # 需要重新生成的分组图片对的并集，共用同一次测量和行条带；
+        # 输出可以跳过的分组不参与测量，其地图不会为检测共享图例而被解码
+        strips = {}
+        for weather_type, partition in partitions.items():
+            stale = []
+            for group in self.report_groups:
+                pairs = partition[group.name]
+                if pairs and not self._output_plan(weather_type, group, pairs, missing[weather_type].get(group.name))[3]:
+                    stale.extend(pairs)
+            union = list(OrderedDict.fromkeys(stale))
+            strips[weather_type] = RowStrips(union, max_bytes=config.render_memory_budget_mb * MB)
+
+        outputs = []
+        skipped = []
+        for group in self.report_groups:
+            for weather_type in weather_types:
+                if weather_type not in partitions:
+                    continue
+                # 至少生成第一个报告，超过截止时间时也用磁盘上已有的图片产出最优先的结果
+                if self.deadline.expired() and outputs:
+                    skipped.append(f"{weather_type}/{group.name}")
+                    continue
+                img_path = self.render_group(weather_type, group, partitions[weather_type][group.name],
+                                             missing=missing[weather_type].get(group.name),
+                                             strips=strips[weather_type])
+                if img_path:
+                    outputs.append(img_path)
+
+        for weather_type, row_strips in strips.items():
+            if row_strips.hits:
+                log(f"{weather_type}: 复用行条带 {row_strips.hits} 次，渲染 {row_strips.misses} 次")
+            row_strips.clear()
+
+        if skipped:
+            log(f"已到截止时间，跳过 {len(skipped)} 个报告: {', '.join(skipped)}", "WARN")
+            self.report.record_deadline(skipped_reports=skipped)
+        return outputs
+
+    def find_missing(self, weather_type, image_pairs):
+        """本次运行应有但没有配对的图片（下载失败或因截止时间未下载），按分组归类
 
-        # 为阿根廷创建对比文档
-        self.create_comparison_document(weather_type, image_pairs, "argentina")
+        Returns:
+            dict: 分组名 -> [(地区, 子地区), ...]
+        """
+        present = set(pair["filename"] for pair in image_pairs)
+        expected = [self.task_filename(task) for task in self.plan_tasks() if task.vrbl == weather_type]
+        return missing_by_group([name for name in expected if name not in present], self.report_groups)
 
-        # 为其他国家创建对比文档
-        self.create_comparison_document(weather_type, image_pairs, "others")
+    def _previous_day_path(self, weather_type):
+        """前一天的图片目录
 
-        # 为所有国家创建对比文档
-        self.create_comparison_document(weather_type, image_pairs, "all")
+        分片运行时下载根目录中只有当天的新图片，前一天的数据从标准 downloads/ 目录读取
+        """
+        previous_path = os.path.join(self.downloads_root, weather_type, self.compare_dates['previous'])
+        fallback_path = os.path.join("downloads", weather_type, self.compare_dates['previous'])
+        if not storage.day_exists(previous_path) and storage.day_exists(fallback_path):
+            return fallback_path
+        return previous_path
 
     def find_image_pairs(self, weather_type):
         """查找需要对比的图片对"""
         pairs = []
 
         # 构建两天的图片路径（使用项目相对路径）
-        previous_path = os.path.join("downloads", weather_type, self.compare_dates['previous'])
-        current_path = os.path.join("downloads", weather_type, self.compare_dates['current'])
+        previous_path = self._previous_day_path(weather_type)
+        current_path = os.path.join(self.downloads_root, weather_type, self.compare_dates['current'])
 
-        # 检查路径是否存在
-        if not os.path.exists(previous_path):
+        # 检查路径是否存在（目录或打包文件均可）
+        if not storage.day_exists(previous_path):
             log(f"前一天路径不存在，将使用当天路径", "WARN")
             previous_path = current_path
 
-        if not os.path.exists(current_path):
+        if not storage.day_exists(current_path):
             log(f"当天路径不存在: {current_path}", "ERROR")
             return pairs
 
         # 获取两天的图片文件列表
-        previous_files = os.listdir(previous_path) if os.path.exists(previous_path) else []
-        current_files = os.listdir(current_path)
+        previous_files = storage.list_day(previous_path)
+        current_files = set(storage.list_day(current_path))
 
         # 查找匹配的图片对
         for prev_file in previous_files:
@@ -163,62 +268,74 @@ class DailyWeatherSummary:
 
         return pairs
 
+    def get_report_group(self, group_type):
+        """根据分组名获取分组定义"""
+        for group in self.report_groups:
+            if group.name == group_type:
+                return group
+        raise ValueError(f"未定义的报告分组: {group_type}")
+
     def create_comparison_document(self, vrbl, image_pairs, group_type="all"):
         """创建对比图片（左右结构）
 
         Args:
             vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
             image_pairs: 图片对列表
-            group_type: 分组类型（"usa"表示美国，"brazil"表示巴西，"argentina"表示阿根廷，"others"表示其他国家，"all"表示全部）
+            group_type: 分组名，对应配置中的报告分组（默认有 usa、brazil、argentina、others、all）
 
         Returns:
             str: 生成的图片路径
         """
-        # 筛选图片对
-        filtered_pairs = []
-        for pair in image_pairs:
-            today_path = pair["current"]
-            yesterday_path = pair["previous"]
-            filename = pair["filename"]
-
-            # 从文件名中提取region和subregion信息
-            # 格式: vrbl_soybeans_region_subregion_forecast.png
-            parts = filename.split("_")
-            if len(parts) >= 5:
-                region = parts[2]
-                subregion = parts[3]
-
-                # 根据group_type筛选
-                if group_type == "usa" and region == "usa":
-                    filtered_pairs.append((today_path, yesterday_path, region, subregion))
-                elif group_type == "brazil" and region == "brazil":
-                    filtered_pairs.append((today_path, yesterday_path, region, subregion))
-                elif group_type == "argentina" and region == "argentina":
-                    filtered_pairs.append((today_path, yesterday_path, region, subregion))
-                elif group_type == "others" and region not in ["usa", "brazil", "argentina"]:
-                    filtered_pairs.append((today_path, yesterday_path, region, subregion))
-                elif group_type == "all":
-                    filtered_pairs.append((today_path, yesterday_path, region, subregion))
+        group = self.get_report_group(group_type)
+        filtered_pairs = partition_pairs(image_pairs, [group], self.parser)[group.name]
+        return self.render_group(vrbl, group, filtered_pairs)
+
+    def _output_plan(self, vrbl, group, filtered_pairs, missing=None):
+        """分组对比图的输出路径、指纹和瓦片目录，以及输出是否可以跳过（输入图片、分组和渲染参数都没有变化）
 
+        Returns:
+            tuple: (图片路径, 指纹, 瓦片目录或None, 是否可以跳过)
+        """
+        img_path = os.path.join(self.output_dir, group.output_filename(vrbl, self.save_date_str))
+        fingerprint = self.build_cache.fingerprint(
+            filtered_pairs,
+            vrbl=vrbl,
+            group_type=group.name,
+            group_desc=group.display_name,
+            group_definition=group.to_dict(),
+            compare_dates=self.compare_dates,
+            missing=missing or [],
+            settings=render_settings()
+        )
+        tile_dir = os.path.join(self.output_dir, "tiles") if config.tile_pyramid else None
+        tiles_ready = tile_dir is None or os.path.exists(
+            os.path.join(tile_dir, os.path.splitext(os.path.basename(img_path))[0] + ".dzi"))
+        return img_path, fingerprint, tile_dir, tiles_ready and self.build_cache.is_fresh(img_path, fingerprint)
+
+    def render_group(self, vrbl, group, filtered_pairs, missing=None, strips=None):
+        """为一个报告分组生成对比图片
+
+        Args:
+            vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
+            group: ReportGroup
+            filtered_pairs: 该分组的图片对，格式为[(today_path, yesterday_path, region, subregion), ...]
+            missing: 该分组缺失的地区 [(地区, 子地区), ...]，会标注在图片中并写入运行报告
+            strips: RowStrips，同一天气变量各分组共用的行条带
+
+        Returns:
+            str: 生成的图片路径
+        """
+        if missing:
+            self.report.record_missing(vrbl, group.name, missing)
         if not filtered_pairs:
             return None
 
-        # 生成图片文件路径
-        if group_type == "usa":
-            img_path = os.path.join(self.output_dir, f"weather_summary_{vrbl}_{group_type}_{self.save_date_str}.png")
-            group_desc = "美国"
-        elif group_type == "brazil":
-            img_path = os.path.join(self.output_dir, f"weather_summary_{vrbl}_{group_type}_{self.save_date_str}.png")
-            group_desc = "巴西"
-        elif group_type == "argentina":
-            img_path = os.path.join(self.output_dir, f"weather_summary_{vrbl}_{group_type}_{self.save_date_str}.png")
-            group_desc = "阿根廷"
-        elif group_type == "others":
-            img_path = os.path.join(self.output_dir, f"weather_summary_{vrbl}_{group_type}_{self.save_date_str}.png")
-            group_desc = "其他国家"
-        else:
-            img_path = os.path.join(self.output_dir, f"weather_summary_{vrbl}_{self.save_date_str}.png")
-            group_desc = "所有国家"
+        group_desc = group.display_name
+        img_path, fingerprint, tile_dir, fresh = self._output_plan(vrbl, group, filtered_pairs, missing)
+        if fresh:
+            log(f"跳过: {os.path.basename(img_path)} (输入未变化)")
+            self._publish(img_path)
+            return img_path
 
         # 使用新的图片生成器直接创建对比图片
         try:
@@ -228,8 +345,13 @@ class DailyWeatherSummary:
                 weather_type=vrbl,
                 group_desc=group_desc,
                 compare_dates=self.compare_dates,
-                save_date_str=self.save_date_str
+                save_date_str=self.save_date_str,
+                tile_dir=tile_dir,
+                missing=missing,
+                strips=strips
             )
+            self.build_cache.record(img_path, fingerprint)
+            self._publish(img_path)
             # 简化日志，只显示文件名
             filename = os.path.basename(img_path)
             log(f"生成: {filename} ({len(filtered_pairs)}个地区)", "SUCCESS")
@@ -238,55 +360,436 @@ class DailyWeatherSummary:
             log(f"生成失败 {group_desc}: {e}", "ERROR")
             return None
 
-
-    def run(self):
-        """运行每日天气总结的主要流程"""
+    def _publish(self, img_path):
+        """提交后台上传（未配置发布时忽略），与后续分组的渲染并行"""
+        if self.publisher is not None:
+            self.publisher.submit(img_path)
+
+    def publish(self):
+        """上传本次输出（以及可选的当天下载数据），等待所有上传完成"""
+        download_days = []
+        if config.s3_upload_downloads:
+            download_days = [os.path.join(self.downloads_root, vrbl, self.compare_dates['current'])
+                             for vrbl in ("pcp", "tmp")]
+        stats = publish_outputs(self.publisher, self.output_dir, download_days)
+        self.report.data["publish"] = stats
+        log(f"发布完成: 上传 {stats['uploaded']} 个, 跳过 {stats['skipped']} 个（远端内容相同）, "
+            f"失败 {stats['failed']} 个", "SUCCESS" if not stats["failed"] else "WARN")
+        return stats
+
+    def task_filename(self, task):
+        """下载任务对应的图片文件名"""
+        return os.path.basename(self.parser.generate_save_path(
+            task.crop_index, task.region_index, task.subregion_index, task.vrbl, task.nday))
+
+    def plan_tasks(self):
+        """本次运行需要下载的图片任务（分片运行时只包含本分片的任务）
+
+        作物和地区由报告分组决定：只下载至少属于一个分组的图片，未指定 crops 的分组使用
+        WEATHER_SPIDER_CROPS 中的作物（默认大豆）；默认使用15天预报。
+        """
+        crops = self.parser.get_supported_crops()
+        wanted = group_crops(self.report_groups, config.default_crops)
+        unknown = sorted(wanted - set(crops))
+        if unknown:
+            log(f"报告分组中的作物不受支持，已忽略: {', '.join(unknown)}", "WARN")
+        crop_indices = [crop_index for crop_index, crop in enumerate(crops) if crop in wanted]
+        tasks = []
+        for task in self.parser.iter_image_tasks(crop_indices=crop_indices, vrbls=["pcp", "tmp"], ndays=[15]):
+            region = self.parser.get_regions_by_crop(task.crop_index)[task.region_index]
+            subregion = self.parser.get_subregions_by_crop_and_region(task.crop_index, task.region_index)[task.subregion_index]
+            if needed_by_groups(self.report_groups, config.default_crops, crops[task.crop_index], region, subregion):
+                tasks.append(task)
+        if self.shard is not None:
+            from .sharding import select_shard
+            tasks = select_shard(tasks, *self.shard)
+        return tasks
+
+    def download(self):
+        """下载当前保存日期的数据，返回下载结果"""
         log("开始下载天气数据...")
 
-        # 大豆的crop_index是1
-        soybean_crop_index = 1
-        # 默认使用15天预报
-        forecast_days = 15
-
         # 只下载当前需要保存日期的数据
         target_date = self.compare_dates['current']
 
-        # 下载降水数据
-        log("[1/2] 下载降水数据 (pcp)...")
-        self.downloader.download_all_images_by_crop(
-            crop_index=soybean_crop_index,
-            vrbl="pcp",
-            nday=forecast_days,
-            date_str=target_date
-        )
-
-        # 下载温度数据
-        log("[2/2] 下载温度数据 (tmp)...")
-        self.downloader.download_all_images_by_crop(
-            crop_index=soybean_crop_index,
-            vrbl="tmp",
-            nday=forecast_days,
-            date_str=target_date
-        )
+        # 图片编号对所有图片都相同，只获取一次
+        if self.img_numbers is None:
+            self.img_numbers = self.downloader.network.get_image_numbers()
+        if not self.img_numbers:
+            log("获取图片编号失败，跳过下载", "ERROR")
+        self.report.set_image_numbers(self.img_numbers)
+
+        tasks = self.plan_tasks()
+        if self.shard is not None:
+            log(f"分片 {self.shard[0]}/{self.shard[1]}: {len(tasks)} 个下载任务")
+        if self.retry_filenames is not None:
+            tasks = [task for task in tasks if self.task_filename(task) in self.retry_filenames]
+            log(f"重试上次未成功的 {len(tasks)} 张图片")
+        if self.deadline.downloads_closed():
+            # 剩余时间已不足渲染预留时间（例如获取图片编号很慢，或预留时间不小于截止时间）
+            log(f"剩余时间 {max(0, self.deadline.remaining()) / 60:.1f} 分钟，少于渲染预留的 "
+                f"{self.deadline.reserve_minutes:g} 分钟，跳过全部 {len(tasks)} 张图片的下载，用已下载的图片生成报告", "WARN")
+            self.report.record_deadline(minutes=self.deadline.minutes, skipped_downloads=len(tasks))
+            return {}
+        if self.img_numbers and config.availability_probe:
+            tasks = self.probe_availability(tasks)
+
+        results = {}
+        if self.deadline.enabled:
+            # 有截止时间时按优先级一次下载所有天气变量，临近截止时停止
+            log(f"按优先级下载 {len(tasks)} 张图片（截止时间 {self.deadline.minutes:g} 分钟）...")
+            results = self.downloader.download_tasks(
+                prioritize_tasks(tasks, self.parser, self.report_groups),
+                date_str=target_date,
+                img_numbers=self.img_numbers,
+                deadline=self.deadline
+            )
+            self.report.record_deadline(minutes=self.deadline.minutes, skipped_downloads=len(tasks) - len(results))
+        else:
+            vrbl_names = {"pcp": "降水", "tmp": "温度"}
+            vrbls = [vrbl for vrbl in ("pcp", "tmp") if any(task.vrbl == vrbl for task in tasks)]
+            for step, vrbl in enumerate(vrbls, start=1):
+                log(f"[{step}/{len(vrbls)}] 下载{vrbl_names[vrbl]}数据 ({vrbl})...")
+                results.update(self.downloader.download_tasks(
+                    [task for task in tasks if task.vrbl == vrbl],
+                    date_str=target_date,
+                    img_numbers=self.img_numbers
+                ))
 
         log("数据下载完成", "SUCCESS")
+        self.report.record_downloads(results)
+        return results
+
+    def probe_availability(self, tasks):
+        """并发探测图片是否存在，只返回需要下载的任务；确认不存在的图片记录到运行报告"""
+        probe = AvailabilityProbe(self.downloader.network, self.parser,
+                                  cache_root=os.path.join(self.downloads_root, CACHE_DIR_NAME))
+        available, unavailable, probed = probe.filter_tasks(tasks, self.img_numbers)
+        log(f"可用性探测: {len(available)}/{len(tasks)} 张图片可下载（探测 {probed} 个，其余来自缓存）")
+        if unavailable:
+            names = [self.task_filename(task) for task in unavailable]
+            log(f"网站上不存在 {len(unavailable)} 张图片，跳过下载", "WARN")
+            self.report.record_unavailable(names)
+        return available
+
+    def update_analog_index(self):
+        """为当天下载的地图计算感知哈希，加入历史相似预报索引"""
+        try:
+            added = AnalogIndex(self.downloads_root).update(dates={self.compare_dates['current']})
+            if added:
+                log(f"相似预报索引: 新增 {added} 张地图")
+        except Exception as e:
+            log(f"更新相似预报索引失败: {e}", "WARN")
+
+    def render(self):
+        """生成所有对比图片（按分组顺序，每个分组依次生成降水和温度）"""
+        log("生成降水和温度对比图片...")
+        self.render_groups(["pcp", "tmp"])
+
+    def close(self):
+        """释放下载使用的网络资源（对冲请求的线程池、磁带索引）"""
+        self.downloader.network.close()
 
-        # 处理降水数据
-        log("生成降水对比图片...")
-        self.process_weather_data("pcp")
+    def run(self, render=True, download=True):
+        """运行每日天气总结的主要流程
+
+        Args:
+            render: 是否生成对比图片（分片运行时可只下载）
+            download: 是否下载（监听模式的重试已单独下载时只需重新生成）
 
-        # 处理温度数据
-        log("生成温度对比图片...")
-        self.process_weather_data("tmp")
+        Returns:
+            dict: 下载结果，键为图片保存路径，值为布尔值表示下载是否成功
+        """
+        self.deadline = create_deadline()
+        results = {}
+        if download:
+            with self.report.stage("download"):
+                results = self.download()
+        with self.report.stage("analogs"):
+            self.update_analog_index()
+
+        if render:
+            self.publisher = create_publisher()
+            with self.report.stage("render"):
+                self.render()
+            if self.publisher is not None:
+                with self.report.stage("publish"):
+                    self.publish()
+
+        report_path = self.report.save(self.output_dir)
+        if self.publisher is not None:
+            self.publisher.upload(report_path)
+            self.publisher.close()
 
         log("=" * 50)
         log("任务完成!", "SUCCESS")
 
+        return results
+
+
+def _run_merge(args):
+    """合并分片结果"""
+    from .sharding import merge_shards
+
+    merged = merge_shards(args.shard_root)
+    if merged is None or args.no_render:
+        return
+
+    save_date = datetime.datetime.strptime(merged.data["save_date"], '%Y%m%d')
+    summary = DailyWeatherSummary(save_date=save_date, img_numbers=merged.data["image_numbers"])
+    # 渲染耗时记录到合并后的运行报告中
+    summary.report = merged
+    with merged.stage("render"):
+        summary.render()
+    merged.save(summary.output_dir)
+    log("合并完成!", "SUCCESS")
+
+
+def _run_timelapse(args):
+    """生成多日动图"""
+    from .timelapse import create_timelapses
+
+    end_date = args.end_date or config.get_current_time().strftime('%Y%m%d')
+    for vrbl in args.vrbl:
+        outputs = create_timelapses(
+            crop_index=args.crop,
+            vrbl=vrbl,
+            end_date_str=end_date,
+            days=args.days,
+            fmt=args.format
+        )
+        log(f"生成 {vrbl} 动图: {len(outputs)}个", "SUCCESS")
+
+
+def _run_watch(args):
+    """监听新预报发布并自动运行"""
+    from .watcher import ForecastWatcher
+
+    watcher = ForecastWatcher(interval=args.interval)
+    watcher.watch(max_runs=args.max_runs)
+
 
-def main():
-    """主函数，用于支持命令行调用"""
-    summary = DailyWeatherSummary()
-    summary.run()
+def _run_backfill(args):
+    """回填历史数据"""
+    from .backfill import backfill, parse_image_numbers
+
+    anchor_numbers = parse_image_numbers(args.anchor_numbers) if args.anchor_numbers else None
+    backfill(
+        start_date_str=args.start,
+        end_date_str=args.end,
+        anchor_date_str=args.anchor_date,
+        anchor_numbers=anchor_numbers,
+        crop_indices=args.crop,
+        vrbls=args.vrbl,
+        ndays=args.nday,
+        step=args.step,
+        workers=args.workers,
+        rate=args.rate
+    )
+
+
+def _run_compact(args):
+    """打包过去的下载数据并清理超出保留期的日期"""
+    retention_days = config.retention_days if args.retention_days is None else args.retention_days
+    keyframe_interval = config.delta_keyframe_interval if args.keyframe_interval is None else args.keyframe_interval
+    stats = storage.compact_downloads(
+        today_str=config.get_current_time().strftime('%Y%m%d'),
+        retention_days=retention_days,
+        pack=not args.no_pack,
+        keyframe_interval=keyframe_interval
+    )
+    log(f"压缩完成: 打包 {stats['packed']} 天, 删除 {stats['removed']} 天, "
+        f"{stats['rekeyed']} 张差分图片转为关键帧", "SUCCESS")
+
+
+def _run_serve(args):
+    """启动按需对比图服务"""
+    from .server import serve
+
+    serve(host=args.host, port=args.port)
+
+
+def _run_regenerate(args):
+    """用已有下载数据并行重新生成日期范围内的对比图"""
+    from .regenerate import regenerate
+
+    regenerate(args.start, args.end, vrbls=args.vrbl, workers=args.workers, force=args.force)
+
+
+def _run_publish(args):
+    """上传已有的输出目录到对象存储"""
+    publisher = create_publisher()
+    if publisher is None:
+        log("未配置 S3_BUCKET 或未安装 boto3，无法发布", "ERROR")
+        return
+
+    output_dir = os.path.join("output", args.date)
+    download_days = [os.path.join("downloads", vrbl, args.date) for vrbl in ("pcp", "tmp")] if args.downloads else []
+    stats = publish_outputs(publisher, output_dir, download_days)
+    publisher.close()
+    log(f"发布完成: 上传 {stats['uploaded']} 个, 跳过 {stats['skipped']} 个, 失败 {stats['failed']} 个",
+        "SUCCESS" if not stats["failed"] else "WARN")
+
+
+def _run_analogs(args):
+    """查找与某一天预报形态最相似的历史日期
+
+    Returns:
+        int: 退出码，索引中没有匹配的地图或该日期没有索引时为1
+    """
+    index = AnalogIndex("downloads")
+    if not args.no_update:
+        added = index.update(vrbls=[args.vrbl])
+        if added:
+            log(f"相似预报索引: 新增 {added} 张地图")
+
+    names = index.names(vrbl=args.vrbl, subregions=args.subregion)
+    if not names:
+        log("索引中没有匹配的地图", "ERROR")
+        return 1
+    date_str = args.date or index.latest_date(names)
+
+    found = False
+    for name in names:
+        analogs = index.find_analogs(name, date_str, top=args.top)
+        if analogs is None:
+            continue
+        found = True
+        info = parse_image_filename(name)
+        matches = ", ".join(f"{analog_date} (距离 {distance})" for distance, analog_date in analogs) or "无历史数据"
+        print(f"{info['region']}/{info['subregion']} {info['horizon']} {date_str}: {matches}")
+
+    if not found:
+        hint = "去掉 --no-update 更新索引" if args.no_update else "确认已下载该日期的数据"
+        log(f"{date_str} 没有索引的地图，请{hint}", "ERROR")
+        return 1
+    return 0
+
+
+def _run_proxy(args):
+    """以缓存代理模式运行"""
+    from .proxy import run_proxy
+
+    run_proxy(host=args.host, port=args.port, upstream=args.upstream, cache_dir=args.cache_dir)
+
+
+def build_arg_parser():
+    """构建命令行参数解析器，不带子命令时执行每日任务"""
+    arg_parser = argparse.ArgumentParser(prog="weather-spider", description="全球农业天气数据爬虫")
+    arg_parser.add_argument("--shard", help="只执行第i个分片（格式 i/N，i从0开始），结果写入 --shard-root")
+    arg_parser.add_argument("--shard-root", default="shards", help="分片输出根目录，默认 shards")
+    arg_parser.add_argument("--no-render", action="store_true", help="只下载，不生成对比图片")
+    arg_parser.add_argument("--image-numbers",
+                            help="指定图片编号（格式 fcst|pastpcp|pasttmp），多个分片应使用相同编号")
+    subparsers = arg_parser.add_subparsers(dest="command")
+
+    merge_parser = subparsers.add_parser("merge", help="合并各分片的下载数据和运行报告，并生成对比图片")
+    merge_parser.add_argument("--shard-root", default="shards", help="分片输出根目录，默认 shards")
+    merge_parser.add_argument("--no-render", action="store_true", help="只合并，不生成对比图片")
+    merge_parser.set_defaults(handler=_run_merge)
+
+    timelapse_parser = subparsers.add_parser("timelapse", help="生成最近N天的多日动图")
+    timelapse_parser.add_argument("--end-date", help="最后一天日期（YYYYMMDD），默认今天")
+    timelapse_parser.add_argument("--days", type=int, default=7, help="包含的天数，默认7")
+    timelapse_parser.add_argument("--crop", type=int, default=1, help="作物索引，默认1（大豆）")
+    timelapse_parser.add_argument("--vrbl", nargs="+", default=["pcp", "tmp"], choices=["pcp", "tmp"],
+                                  help="天气变量，默认pcp和tmp")
+    timelapse_parser.add_argument("--format", default="webp", choices=["webp", "apng"], help="输出格式")
+    timelapse_parser.set_defaults(handler=_run_timelapse)
+
+    watch_parser = subparsers.add_parser("watch", help="轮询图片编号，新预报发布后立即下载并生成对比图")
+    watch_parser.add_argument("--interval", type=int, default=None,
+                              help="轮询间隔（秒），默认使用 WATCH_INTERVAL 环境变量")
+    watch_parser.add_argument("--max-runs", type=int, default=None, help="触发指定次数后退出，默认一直运行")
+    watch_parser.set_defaults(handler=_run_watch)
+
+    backfill_parser = subparsers.add_parser("backfill", help="并发回填日期范围内缺失的历史图片")
+    backfill_parser.add_argument("--start", required=True, help="开始日期（YYYYMMDD）")
+    backfill_parser.add_argument("--end", required=True, help="结束日期（YYYYMMDD，包含）")
+    backfill_parser.add_argument("--anchor-date", help="锚点日期（YYYYMMDD），默认今天")
+    backfill_parser.add_argument("--anchor-numbers",
+                                 help="锚点日期的图片编号，格式 fcst|pastpcp|pasttmp，默认从网站获取当前编号")
+    backfill_parser.add_argument("--step", type=int, default=1, help="每天图片编号的增量，默认1")
+    backfill_parser.add_argument("--crop", type=int, nargs="+", default=[1], help="作物索引，默认1（大豆）")
+    backfill_parser.add_argument("--vrbl", nargs="+", default=["pcp", "tmp"], choices=["pcp", "tmp"])
+    backfill_parser.add_argument("--nday", type=int, nargs="+", default=[15], choices=[15, 60, 180])
+    backfill_parser.add_argument("--workers", type=int, default=None, help="并发线程数，默认 BACKFILL_WORKERS")
+    backfill_parser.add_argument("--rate", type=float, default=None, help="每秒请求数上限，默认 BACKFILL_RATE")
+    backfill_parser.set_defaults(handler=_run_backfill)
+
+    compact_parser = subparsers.add_parser("compact", help="把过去每天的下载数据打包为单个文件，并删除过期数据")
+    compact_parser.add_argument("--retention-days", type=int, default=None,
+                                help="保留天数，默认 DOWNLOADS_RETENTION_DAYS，0表示不删除")
+    compact_parser.add_argument("--no-pack", action="store_true", help="只按保留天数删除，不打包")
+    compact_parser.add_argument("--keyframe-interval", type=int, default=None,
+                                help="差分存储的关键帧间隔（天），默认 DELTA_KEYFRAME_INTERVAL，0 表示不使用差分")
+    compact_parser.set_defaults(handler=_run_compact)
+
+    regenerate_parser = subparsers.add_parser("regenerate", help="用已有下载数据并行重新生成日期范围内的对比图")
+    regenerate_parser.add_argument("--start", required=True, help="开始日期（YYYYMMDD）")
+    regenerate_parser.add_argument("--end", required=True, help="结束日期（YYYYMMDD，包含）")
+    regenerate_parser.add_argument("--vrbl", nargs="+", default=["pcp", "tmp"], choices=["pcp", "tmp"])
+    regenerate_parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用全部CPU")
+    regenerate_parser.add_argument("--force", action="store_true", help="忽略增量构建缓存，强制重新生成")
+    regenerate_parser.set_defaults(handler=_run_regenerate)
+
+    serve_parser = subparsers.add_parser("serve", help="启动按需生成对比图的HTTP服务")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认 127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000, help="监听端口，默认 8000")
+    serve_parser.set_defaults(handler=_run_serve)
+
+    publish_parser = subparsers.add_parser("publish", help="上传某一天的输出到S3兼容的对象存储")
+    publish_parser.add_argument("--date", required=True, help="日期（YYYYMMDD），上传 output/{date}/")
+    publish_parser.add_argument("--downloads", action="store_true", help="同时上传当天的下载数据")
+    publish_parser.set_defaults(handler=_run_publish)
+
+    proxy_parser = subparsers.add_parser("proxy", help="以读穿透缓存代理模式运行，供其他实例共享")
+    proxy_parser.add_argument("--host", default="0.0.0.0", help="监听地址，默认 0.0.0.0")
+    proxy_parser.add_argument("--port", type=int, default=8080, help="监听端口，默认 8080")
+    proxy_parser.add_argument("--upstream", default=None, help="上游地址，默认 WEATHER_SPIDER_BASE_URL")
+    proxy_parser.add_argument("--cache-dir", default=None, help="缓存目录，默认 PROXY_CACHE_DIR")
+    proxy_parser.set_defaults(handler=_run_proxy)
+
+    analogs_parser = subparsers.add_parser("analogs", help="按感知哈希查找与某一天预报形态最相似的历史日期")
+    analogs_parser.add_argument("--date", help="查询日期（YYYYMMDD），默认索引中最新的日期")
+    analogs_parser.add_argument("--vrbl", default="pcp", choices=["pcp", "tmp"], help="天气变量，默认pcp")
+    analogs_parser.add_argument("--subregion", nargs="+", default=None, help="子地区（如 iowa illinois），默认全部")
+    analogs_parser.add_argument("--top", type=int, default=5, help="每个子地区返回的日期数，默认5")
+    analogs_parser.add_argument("--no-update", action="store_true", help="不扫描下载目录更新索引，只查询")
+    analogs_parser.set_defaults(handler=_run_analogs)
+
+    return arg_parser
+
+
+def main(argv=None):
+    """主函数，用于支持命令行调用
+
+    Returns:
+        int: 退出码（子命令返回的退出码，未返回时为0）
+    """
+    args = build_arg_parser().parse_args(argv)
+
+    if args.command is None:
+        img_numbers = None
+        if args.image_numbers:
+            from .backfill import parse_image_numbers
+            img_numbers = parse_image_numbers(args.image_numbers)
+
+        if args.shard:
+            from .sharding import parse_shard, shard_root
+            shard = parse_shard(args.shard)
+            root = shard_root(args.shard_root, *shard)
+            summary = DailyWeatherSummary(img_numbers=img_numbers, shard=shard,
+                                          downloads_root=os.path.join(root, "downloads"),
+                                          output_root=os.path.join(root, "output"))
+        else:
+            summary = DailyWeatherSummary(img_numbers=img_numbers)
+        try:
+            summary.run(render=not args.no_render)
+        finally:
+            summary.close()
+        return 0
+    return args.handler(args) or 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相邻两天图片的像素差分编码
+同一子地区相邻两天的预报图只有部分区域不同，差分（逐像素按256取模相减）后大部分为0，zlib压缩后远小于PNG。
+调色板图片（P模式）在调色板相同时直接对调色板索引差分，还原结果与原图逐像素一致；
+调色板不同时按RGB(A)像素差分，还原为颜色一致的RGB(A)图片。
+
+差分数据格式: MAGIC + 头部长度(4字节) + JSON头部 + zlib(差分像素)
+头部包含基准日期 base、链深度 depth（距最近关键帧的天数）、模式 mode、尺寸 size，
+P模式图片还可能包含 transparency（单个索引，或每个调色板索引的透明度列表）
+"""
+
+import json
+import zlib
+import struct
+from PIL import Image, ImageChops
+
+MAGIC = b"WSD1"
+
+
+def _has_alpha(image):
+    return "A" in image.getbands() or "transparency" in image.info
+
+
+def _index_plane(image):
+    """把P模式图片的调色板索引按L模式解释"""
+    return Image.frombytes("L", image.size, image.tobytes())
+
+
+def _plane(image, mode):
+    """返回用于差分的像素平面：P模式为调色板索引，其他为 L/RGB/RGBA 像素"""
+    if mode == "P":
+        return _index_plane(image)
+    return image if image.mode == mode else image.convert(mode)
+
+
+def _delta_mode(image, base_image):
+    """选择差分使用的模式：调色板相同的P模式图片直接比较索引，否则比较RGB(A)像素"""
+    if image.mode == "P" and base_image.mode == "P" and image.getpalette() == base_image.getpalette():
+        return "P"
+    if image.mode == "L" and base_image.mode == "L":
+        return "L"
+    return "RGBA" if _has_alpha(image) or _has_alpha(base_image) else "RGB"
+
+
+def encode(image, base_image, base_date, depth):
+    """编码 image 相对 base_image 的差分
+
+    Args:
+        image: 当天图片
+        base_image: 前一天还原后的图片
+        base_date: 前一天日期（YYYYMMDD）
+        depth: 链深度
+
+    Returns:
+        bytes: 差分数据，两张图片尺寸不一致时返回None（应保存为关键帧）
+    """
+    if image.size != base_image.size:
+        return None
+
+    mode = _delta_mode(image, base_image)
+    difference = ImageChops.subtract_modulo(_plane(image, mode), _plane(base_image, mode))
+    header = {
+        "base": base_date,
+        "depth": depth,
+        "mode": mode,
+        "size": list(image.size),
+    }
+    if mode == "P" and "transparency" in image.info:
+        transparency = image.info["transparency"]
+        # 带 tRNS 块的调色板图片每个索引一个透明度（bytes），JSON中保存为整数列表
+        header["transparency"] = list(transparency) if isinstance(transparency, bytes) else transparency
+
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    return MAGIC + struct.pack(">I", len(header_bytes)) + header_bytes + zlib.compress(difference.tobytes(), 6)
+
+
+def read_header(payload):
+    """读取差分数据的头部，返回 (头部, 压缩像素的起始偏移)"""
+    if payload[:4] != MAGIC:
+        raise ValueError("不是有效的差分数据")
+    (length,) = struct.unpack(">I", payload[4:8])
+    return json.loads(payload[8:8 + length].decode("utf-8")), 8 + length
+
+
+def apply(base_image, payload):
+    """用前一天还原后的图片和差分数据还原当天图片"""
+    header, offset = read_header(payload)
+    mode, size = header["mode"], tuple(header["size"])
+    base_plane = _plane(base_image, mode)
+    difference = Image.frombytes(base_plane.mode, size, zlib.decompress(payload[offset:]))
+    plane = ImageChops.add_modulo(base_plane, difference)
+
+    if mode != "P":
+        return plane
+    image = Image.frombytes("P", size, plane.tobytes())
+    image.putpalette(base_image.getpalette())
+    if "transparency" in header:
+        transparency = header["transparency"]
+        image.info["transparency"] = bytes(transparency) if isinstance(transparency, list) else transparency
+    return image
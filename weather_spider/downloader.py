@@ -2,19 +2,38 @@ import os
 from .network import NetworkRequest
 from .parser import WeatherParser
 
+def select_image_number(img_numbers, vrbl, nday):
+    """根据天气变量和天数从图片编号中选择对应的编号
+
+    Args:
+        img_numbers: get_image_numbers的返回值
+        vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
+        nday: 天数（15, 60, 180）
+
+    Returns:
+        str: 图片编号
+    """
+    if nday == 15:
+        return img_numbers["forecast"]  # 预报降水/温度
+    if vrbl == "pcp":
+        return img_numbers["past_pcp"]  # 历史降水
+    return img_numbers["past_tmp"]  # 历史温度
+
+
 class ImageDownloader:
     """图片下载器，用于按国家和地区分类下载降水和温度图片"""
     
-    def __init__(self):
-        self.network = NetworkRequest()
+    def __init__(self, network=None, save_root='downloads'):
+        self.network = network or NetworkRequest()
         self.parser = WeatherParser()
+        self.save_root = save_root
     
     def ensure_directory_exists(self, directory):
         """确保目录存在，如果不存在则创建"""
         if not os.path.exists(directory):
             os.makedirs(directory)
     
-    def download_all_images_by_crop(self, crop_index, vrbl, nday=15, date_str=None):
+    def download_all_images_by_crop(self, crop_index, vrbl, nday=15, date_str=None, img_numbers=None):
         """下载指定作物的所有国家和地区的图片
 
         Args:
@@ -22,6 +41,7 @@ class ImageDownloader:
             vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
             nday: 天数（15, 60, 180），默认是15
             date_str: 日期字符串（格式：YYYYMMDD），如果为None则使用当前日期
+            img_numbers: 图片编号，为None时每张图片单独获取
 
         Returns:
             dict: 下载结果，键为图片保存路径，值为布尔值表示下载是否成功
@@ -43,7 +63,8 @@ class ImageDownloader:
 
             for subregion_index, subregion in enumerate(subregions):
                 # 下载该子地区的图片
-                result = self.download_image(crop_index, region_index, subregion_index, vrbl, nday, date_str)
+                result = self.download_image(crop_index, region_index, subregion_index, vrbl, nday, date_str,
+                                             img_numbers=img_numbers)
                 results.update(result)
                 total_count += 1
                 for path, success in result.items():
@@ -53,7 +74,39 @@ class ImageDownloader:
         log(f"  {crop_name} {vrbl}: {success_count}/{total_count} 下载成功")
         return results
     
-    def download_all_images_by_region(self, crop_index, region_index, vrbl, nday=15, date_str=None):
+    def download_tasks(self, tasks, date_str=None, img_numbers=None, deadline=None):
+        """按顺序下载一组图片
+
+        Args:
+            tasks: ImageTask列表（WeatherParser.iter_image_tasks的返回值或其子集）
+            date_str: 日期字符串（格式：YYYYMMDD），如果为None则使用当前日期
+            img_numbers: 图片编号，为None时每张图片单独获取
+            deadline: scheduler.Deadline，临近截止时间时停止下载剩余任务
+
+        Returns:
+            dict: 下载结果，键为图片保存路径，值为布尔值表示下载是否成功（未下载的任务不在结果中）
+        """
+        from .daily_summary import log
+        results = {}
+        counts = {}
+        crops = self.parser.get_supported_crops()
+
+        for done, task in enumerate(tasks):
+            if deadline is not None and deadline.downloads_closed():
+                log(f"临近截止时间，停止下载，跳过剩余 {len(tasks) - done} 张图片", "WARN")
+                break
+            result = self.download_image(task.crop_index, task.region_index, task.subregion_index,
+                                         task.vrbl, task.nday, date_str, img_numbers=img_numbers)
+            results.update(result)
+            key = (crops[task.crop_index], task.vrbl)
+            total, success = counts.get(key, (0, 0))
+            counts[key] = (total + 1, success + sum(1 for ok in result.values() if ok))
+
+        for (crop_name, vrbl), (total, success) in counts.items():
+            log(f"  {crop_name} {vrbl}: {success}/{total} 下载成功")
+        return results
+
+    def download_all_images_by_region(self, crop_index, region_index, vrbl, nday=15, date_str=None, img_numbers=None):
         """下载指定作物和地区的所有子地区的图片
 
         Args:
@@ -62,6 +115,7 @@ class ImageDownloader:
             vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
             nday: 天数（15, 60, 180），默认是15
             date_str: 日期字符串（格式：YYYYMMDD），如果为None则使用当前日期
+            img_numbers: 图片编号，为None时每张图片单独获取
 
         Returns:
             dict: 下载结果，键为图片保存路径，值为布尔值表示下载是否成功
@@ -73,12 +127,13 @@ class ImageDownloader:
 
         for subregion_index, subregion in enumerate(subregions):
             # 下载该子地区的图片
-            result = self.download_image(crop_index, region_index, subregion_index, vrbl, nday, date_str)
+            result = self.download_image(crop_index, region_index, subregion_index, vrbl, nday, date_str,
+                                         img_numbers=img_numbers)
             results.update(result)
 
         return results
 
-    def download_image(self, crop_index, region_index, subregion_index, vrbl, nday=15, date_str=None):
+    def download_image(self, crop_index, region_index, subregion_index, vrbl, nday=15, date_str=None, img_numbers=None):
         """下载指定作物、地区和子地区的图片
 
         Args:
@@ -88,6 +143,7 @@ class ImageDownloader:
             vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
             nday: 天数（15, 60, 180），默认是15
             date_str: 日期字符串（格式：YYYYMMDD），如果为None则使用当前日期
+            img_numbers: 图片编号，为None时从网站获取
 
         Returns:
             dict: 下载结果，键为图片保存路径，值为布尔值表示下载是否成功
@@ -96,22 +152,14 @@ class ImageDownloader:
 
         try:
             # 获取图片编号
-            img_numbers = self.network.get_image_numbers()
+            if img_numbers is None:
+                img_numbers = self.network.get_image_numbers()
 
             if not img_numbers:
                 return result
 
             # 根据vrbl选择对应的图片编号
-            if vrbl == "pcp":
-                if nday == 15:
-                    img_number = img_numbers["forecast"]  # 预报降水
-                else:
-                    img_number = img_numbers["past_pcp"]  # 历史降水
-            else:
-                if nday == 15:
-                    img_number = img_numbers["forecast"]  # 预报温度
-                else:
-                    img_number = img_numbers["past_tmp"]  # 历史温度
+            img_number = select_image_number(img_numbers, vrbl, nday)
 
             # 构建图片URL
             image_url = self.parser.build_image_url(
@@ -120,7 +168,8 @@ class ImageDownloader:
                 subregion_index=subregion_index,
                 vrbl=vrbl,
                 nday=nday,
-                fcstimgnum=img_number
+                fcstimgnum=img_number,
+                base_url=self.network.base_url
             )
 
             if not image_url:
@@ -133,6 +182,7 @@ class ImageDownloader:
                 subregion_index=subregion_index,
                 vrbl=vrbl,
                 nday=nday,
+                save_root=self.save_root,
                 date_str=date_str
             )
 
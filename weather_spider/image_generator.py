@@ -6,205 +6,709 @@
 """
 
 import os
-from PIL import Image, ImageDraw, ImageFont
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+from . import storage
+from .memory import MB, PixelTracker, image_bytes
+
+# 配置参数：可以调整这些值来改变图片大小
+IMAGE_SCALE_FACTOR = 2.5  # 图片放大倍数
+CANVAS_WIDTH = 3200  # 画布宽度
+GAP_BETWEEN_IMAGES = 20  # 图片之间的间距
+GAP_BETWEEN_CELLS = 40  # 网格布局中相邻两格之间的间距
+MIN_SCALE_FACTOR = 1.0  # 超出内存预算时允许降低到的最小放大倍数
+SCALE_STEP = 0.25  # 每次降低的放大倍数
+
+# 版面尺寸
+TOP_HEIGHT = 160  # 顶部标题和日期信息
+ROW_TITLE_HEIGHT = 50  # 每行的地区标题
+ROW_GAP = 20  # 图片下方的间距
+BOTTOM_MARGIN = 60  # 底部边距
+ERROR_ROW_HEIGHT = 80  # 图片加载失败时错误信息占用的高度
+NOTICE_LINE_HEIGHT = 60  # 缺失地区提示每行的高度
+
+# 网格布局：每行 columns 格，每格为一个子地区的前一天/当天图片对；width 为画布宽度，scale 为每格图片的放大倍数。
+# 默认每行一格，与原来的版面相同
+Grid = namedtuple("Grid", ["columns", "width", "scale"])
+DEFAULT_GRID = Grid(1, CANVAS_WIDTH, IMAGE_SCALE_FACTOR)
+
+# 自动裁剪：与背景色（左上角像素）的差异超过阈值视为内容，裁剪后保留少量边距
+CROP_THRESHOLD = 16
+CROP_PADDING = 4
+
+# 共享图例：同一天气变量各地图底部完全相同的图例条只在对比图顶部绘制一次
+MIN_LEGEND_IMAGES = 4  # 至少有这么多张同版面的图片才检测
+MIN_LEGEND_HEIGHT = 10  # 图例条的最小高度
+MAX_LEGEND_FRACTION = 0.4  # 图例条最多占内容区域高度的比例
+LEGEND_CACHE_SIZE = 256
+
+# 渲染逻辑版本号，修改布局或绘制方式时递增，使增量构建缓存失效
+RENDER_VERSION = 5
+
+# 中文字体候选，按顺序尝试：WEATHER_SPIDER_FONT 指定的字体，Windows 黑体，macOS 苹方，
+# Linux 上常见的 Noto Sans CJK、文泉驿和 Droid Sans Fallback
+FONT_CANDIDATES = [
+    "simhei.ttf",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wenquanyi/wqy-zenhei/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+]
+
+# 字体大小：主标题60，地区标题48
+TITLE_FONT_SIZE = 60
+HEADER_FONT_SIZE = 48
+
+# 渲染器缓存的文字栅格数量
+TEXT_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=None)
+def resolve_font_path():
+    """返回第一个可以加载的字体路径，都不可用时返回None（使用默认字体）。结果在进程内缓存"""
+    from .config import config
+
+    candidates = ([config.font_path] if config.font_path else []) + FONT_CANDIDATES
+    for font_path in candidates:
+        try:
+            ImageFont.truetype(font_path, 12)
+            return font_path
+        except Exception:
+            continue
+    return None
+
 
+def load_fonts():
+    """加载标题和地区标题字体
 
+    Returns:
+        tuple: (title_font, title_font_bold, header_font, header_font_bold)
+    """
+    font_path = resolve_font_path()
+    if font_path is None:
+        # 使用默认字体
+        default_font = ImageFont.load_default()
+        return default_font, default_font, default_font, default_font
 
+    title_font = ImageFont.truetype(font_path, TITLE_FONT_SIZE)
+    header_font = ImageFont.truetype(font_path, HEADER_FONT_SIZE)
+    return title_font, title_font, header_font, header_font
+
+
+# 一行的布局：box / today_box 为前一天和当天图片的内容区域（去掉共享图例后），display_size 为缩放后的显示尺寸
+RowLayout = namedtuple("RowLayout", ["today_path", "yesterday_path", "region", "subregion", "box", "today_box",
+                                     "display_size"])
+
+# 对比图布局：legend 为共享图例 (图片, 显示尺寸)，没有共享图例时为None；grid 为网格布局
+Layout = namedtuple("Layout", ["rows", "scale", "legend", "grid"])
+
+# 测量结果：legend 为共享图例图片，legend_keys 为去掉了图例条的行 (today_path, yesterday_path)
+MeasuredRows = namedtuple("MeasuredRows", ["rows", "legend", "legend_keys"])
+
+# 内容区域缓存：(文件名, 尺寸) -> box。同一子地区的地图版面每天相同，只在第一次遇到时解码像素
+_content_boxes = {}
+
+# 共享图例检测结果：((路径, 签名, box), ...) -> (图例起始行, 图例图片) 或 None
+_legend_cache = {}
 
-def create_image_comparison(image_pairs, output_path, weather_type, group_desc, compare_dates, save_date_str):
-    """直接创建图片对比
+
+def content_bbox(image):
+    """检测地图的内容区域（去掉四周空白边距）
+
+    Returns:
+        tuple: (left, top, right, bottom)，整张图片都是背景时返回整张图片
+    """
+    rgb = image.convert("RGB")
+    background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+    difference = ImageChops.difference(rgb, background).convert("L")
+    box = difference.point(lambda value: 255 if value > CROP_THRESHOLD else 0).getbbox()
+    if box is None:
+        return (0, 0) + image.size
+
+    left, top, right, bottom = box
+    return (max(0, left - CROP_PADDING), max(0, top - CROP_PADDING),
+            min(image.width, right + CROP_PADDING), min(image.height, bottom + CROP_PADDING))
+
+
+def get_content_box(path):
+    """按图片版面缓存的内容区域，缓存命中时只读取文件头"""
+    with storage.open_image(path) as image:
+        key = (os.path.basename(path), image.size)
+        box = _content_boxes.get(key)
+        if box is None:
+            box = content_bbox(image)
+            _content_boxes[key] = box
+    return box
+
+
+def detect_shared_legend(items):
+    """检测一组同尺寸内容区域底部完全相同的图例条
+
+    逐张解码并与第一张比较，所有差异的最低行以下即为共同的图例条；
+    差异延伸到底部、图例过矮或过高（地图本身大面积相同）时认为没有共享图例。
 
     Args:
-        image_pairs: 图片对列表，格式为[(today_path, yesterday_path, region, subregion), ...]
-        output_path: 输出图片路径
-        weather_type: 天气类型（'pcp'或'tmp'）
-        group_desc: 组描述（如'美国'、'巴西'等）
-        compare_dates: 对比日期字典，包含'previous'和'current'
-        save_date_str: 保存日期字符串
+        items: [(图片路径, 内容区域box), ...]，所有box尺寸相同
+
+    Returns:
+        tuple: (图例在内容区域中的起始行, 图例图片)，未检测到时返回None
     """
-    from datetime import datetime
-    from .parser import WeatherParser
-
-    # 初始化parser以使用get_chinese_region_name方法
-    parser = WeatherParser()
-
-    # 设置天气变量文本描述
-    if weather_type == "pcp":
-        weather_text = "降水预报"
-    else:
-        weather_text = "温度预报"
-
-    # 配置参数：可以调整这些值来改变图片大小
-    IMAGE_SCALE_FACTOR = 2.5  # 图片放大倍数
-    CANVAS_WIDTH = 3200  # 画布宽度
-    GAP_BETWEEN_IMAGES = 20  # 图片之间的间距
-
-    # 计算画布大小
-    # 首先计算每行的实际高度
-    # 需要加载第一张图片来获取大致尺寸
-    sample_row_height = 400  # 默认高度
-    if image_pairs:
-        try:
-            sample_img = Image.open(image_pairs[0][0])
-            sample_width, sample_height = sample_img.size
-            # 使用配置的放大倍数计算样本高度
-            sample_row_height = int(sample_height * IMAGE_SCALE_FACTOR)
-        except:
-            pass
-
-    # 减小间距，让布局更紧凑
-    # 每行高度：标题(40) + 图片(sample_row_height) + 间距(20) + 标签(25)
-    row_height = 40 + sample_row_height + 20 + 25
-    top_title_height = 100  # 减小顶部标题高度
-    bottom_info_height = 60  # 减小底部信息高度
-    margin = 30  # 减小边距
-
-    # 使用配置的画布宽度
-    canvas_width = CANVAS_WIDTH
-    canvas_height = top_title_height + bottom_info_height + len(image_pairs) * row_height + margin * 2
-
-    # 创建白色背景画布
-    canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
-    draw = ImageDraw.Draw(canvas)
-
-    # 尝试加载字体，支持中文
+    if len(items) < MIN_LEGEND_IMAGES:
+        return None
+    key = tuple((path, storage.stat_signature(path), box) for path, box in items)
+    if key in _legend_cache:
+        return _legend_cache[key]
+
+    reference = None
+    differing_bottom = 0
+    for path, box in items:
+        with storage.open_image(path) as image:
+            content = image.crop(box).convert("RGB")
+        if reference is None:
+            reference = content
+            continue
+        difference_box = ImageChops.difference(reference, content).getbbox()
+        content.close()
+        if difference_box is not None:
+            differing_bottom = max(differing_bottom, difference_box[3])
+
+    result = None
+    legend_height = reference.height - differing_bottom
+    if MIN_LEGEND_HEIGHT <= legend_height <= reference.height * MAX_LEGEND_FRACTION:
+        result = (differing_bottom, reference.crop((0, differing_bottom, reference.width, reference.height)))
+    reference.close()
+
+    if len(_legend_cache) >= LEGEND_CACHE_SIZE:
+        _legend_cache.clear()
+    _legend_cache[key] = result
+    return result
+
+
+def _box_size(box):
+    return box[2] - box[0], box[3] - box[1]
+
+
+def _canvas_height(row_heights, legend_height=0, notice_height=0):
+    """画布高度：顶部标题 + [缺失地区提示] + [共享图例 + 间距] + 每行[地区标题 + 图片 + 间距] + 底部边距"""
+    legend = legend_height + ROW_GAP if legend_height else 0
+    rows = sum(ROW_TITLE_HEIGHT + height + ROW_GAP for height in row_heights)
+    return TOP_HEIGHT + notice_height + legend + rows + BOTTOM_MARGIN
+
+
+def _wrap_items(prefix, items, font, max_width, separator="、"):
+    """把 前缀 + 项目列表 按宽度折行，项目不会被拆开"""
+    lines = []
+    line = prefix
+    for index, item in enumerate(items):
+        candidate = line + (separator if index else "") + item
+        if line and font.getlength(candidate) > max_width:
+            lines.append(line)
+            line = item
+        else:
+            line = candidate
+    lines.append(line)
+    return lines
+
+
+def grid_from_config():
+    """配置中的网格布局（GRID_COLUMNS、GRID_WIDTH、GRID_CELL_SCALE）"""
+    from .config import config
+
+    return Grid(max(1, config.grid_columns), config.grid_width or CANVAS_WIDTH,
+                config.grid_cell_scale or IMAGE_SCALE_FACTOR)
+
+
+def cell_width(grid):
+    """网格中每格的宽度"""
+    return (grid.width - (grid.columns - 1) * GAP_BETWEEN_CELLS) // grid.columns
+
+
+def _grid_rows(items, columns):
+    """把按顺序排列的格子分成网格的各行"""
+    return [items[start:start + columns] for start in range(0, len(items), columns)]
+
+
+def _display_size(image_size, scale, width=CANVAS_WIDTH):
+    """图片按放大倍数缩放后的显示尺寸，不超过格子（默认为整个画布）的一半宽度"""
+    original_width, original_height = image_size
+    display_width = int(original_width * scale)
+    display_height = int(original_height * scale)
+    max_possible_width = (width - GAP_BETWEEN_IMAGES) // 2
+    if display_width > max_possible_width:
+        display_width = max_possible_width
+        display_height = int(original_height * (display_width / original_width))
+    return display_width, display_height
+
+
+def estimate_render_bytes(row_count, image_size, scale=None, tiles=False, grid=None):
+    """估算渲染一张对比图时像素缓冲区的峰值字节数
+
+    同时存活的是画布和当前一格的两张原图与两张缩放后的图片；生成瓦片时还有逐级缩小的画布（约为画布的1/3）
+    """
+    grid = grid or grid_from_config()
+    width = cell_width(grid)
+    display_size = _display_size(image_size, grid.scale if scale is None else scale, width)
+    grid_rows = -(-row_count // grid.columns)
+    canvas = image_bytes((grid.width, _canvas_height([display_size[1]] * grid_rows)))
+    strip = image_bytes((width, ROW_TITLE_HEIGHT + display_size[1] + ROW_GAP))
+    row = 2 * image_bytes(image_size) + 2 * image_bytes(display_size) + strip
+    return canvas + row + (canvas // 3 if tiles else 0)
+
+
+def choose_scale_factor(row_count, image_size, budget_mb, tiles=False, grid=None):
+    """在内存预算内选择最大的放大倍数，预算为0时使用网格的放大倍数"""
+    grid = grid or grid_from_config()
+    scale = grid.scale
+    if not budget_mb or budget_mb <= 0:
+        return scale
+    while scale > MIN_SCALE_FACTOR and estimate_render_bytes(row_count, image_size, scale, tiles, grid) > budget_mb * MB:
+        scale = max(MIN_SCALE_FACTOR, scale - SCALE_STEP)
+    return scale
+
+
+def render_settings():
+    """影响输出结果的渲染参数，用于增量构建的指纹计算"""
+    from .config import config
+
+    grid = grid_from_config()
+    return {
+        "tiles": [config.tile_size, config.tile_format] if config.tile_pyramid else None,
+        "memory_budget_mb": config.render_memory_budget_mb or None,
+        "version": RENDER_VERSION,
+        "scale": grid.scale,
+        "canvas_width": grid.width,
+        "columns": grid.columns,
+        "gap": GAP_BETWEEN_IMAGES,
+        "font": resolve_font_path(),
+    }
+
+
+def _extract_shared_legend(rows):
+    """在最多行使用的内容区域尺寸中检测共享图例，从这些行的内容区域中去掉图例条
+
+    前一天和当天的图片都参与比较，保证被去掉的图例条在每张图片中都完全相同。
+
+    Returns:
+        tuple: (新的行布局列表, 图例图片或None, 去掉了图例条的行下标集合)
+    """
+    by_size = {}
+    for index, row in enumerate(rows):
+        if row.box is not None and _box_size(row.box) == _box_size(row.today_box):
+            by_size.setdefault(_box_size(row.box), []).append(index)
+    if not by_size:
+        return rows, None, set()
+
+    group = set(max(by_size.values(), key=len))
+    items = [item for index in sorted(group)
+             for item in ((rows[index].yesterday_path, rows[index].box), (rows[index].today_path, rows[index].today_box))]
     try:
-        # Windows系统 - 增大字体大小并加粗
-        title_font = ImageFont.truetype("simhei.ttf", 60)  # 进一步增大主标题
-        # 尝试加载粗体版本
-        try:
-            title_font_bold = ImageFont.truetype("simhei.ttf", 60, weight="bold")
-        except:
-            title_font_bold = title_font
+        legend = detect_shared_legend(items)
+    except Exception as e:
+        print(f"警告: 检测共享图例失败 - {e}")
+        legend = None
+    if legend is None:
+        return rows, None, set()
 
-        header_font = ImageFont.truetype("simhei.ttf", 48)  # 增大地区标题
-        try:
-            header_font_bold = ImageFont.truetype("simhei.ttf", 48, weight="bold")
-        except:
-            header_font_bold = header_font
+    legend_top, legend_image = legend
 
-    except:
-        try:
-            # macOS/Linux系统 - 增大字体大小并加粗
-            title_font = ImageFont.truetype("/System/Library/Fonts/PingFang.ttc", 60)
-            try:
-                title_font_bold = ImageFont.truetype("/System/Library/Fonts/PingFang.ttc", 60)
-            except:
-                title_font_bold = title_font
-
-            header_font = ImageFont.truetype("/System/Library/Fonts/PingFang.ttc", 48)
-            try:
-                header_font_bold = ImageFont.truetype("/System/Library/Fonts/PingFang.ttc", 48)
-            except:
-                header_font_bold = header_font
-        except:
-            # 使用默认字体
-            title_font = ImageFont.load_default()
-            title_font_bold = title_font
-            header_font = ImageFont.load_default()
-            header_font_bold = header_font
-
-    # 获取当前时间
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # 绘制顶部标题 - 简化标题，更加醒目
-    title_text = f"{group_desc}{weather_text}对比"
-    title_bbox = draw.textbbox((0, 0), title_text, font=title_font_bold)
-    title_width = title_bbox[2] - title_bbox[0]
-    title_x = (canvas_width - title_width) // 2
-    draw.text((title_x, 40), title_text, fill='black', font=title_font_bold)  # 使用加粗字体
-
-    # 绘制生成时间
-    time_text = f"生成时间: {current_time}"
-    time_bbox = draw.textbbox((0, 0), time_text, font=header_font)
-    time_width = time_bbox[2] - time_bbox[0]
-    time_x = canvas_width - time_width - 50  # 右对齐，留50px边距
-    draw.text((time_x, 110), time_text, fill='black', font=header_font)
-
-    # 绘制日期信息
-    date_text = f"当前数据日期: {compare_dates.get('current', save_date_str)}  前一期数据日期: {compare_dates.get('previous', '')}"
-    date_bbox = draw.textbbox((0, 0), date_text, font=header_font)
-    date_width = date_bbox[2] - date_bbox[0]
-    date_x = (canvas_width - date_width) // 2  # 居中对齐
-    draw.text((date_x, 110), date_text, fill='black', font=header_font)
-
-    y_offset = 160  # 跳过日期信息，直接开始地区标题
+    def strip(box):
+        return box[0], box[1], box[2], box[1] + legend_top
+
+    rows = [row._replace(box=strip(row.box), today_box=strip(row.today_box))
+            if index in group else row for index, row in enumerate(rows)]
+    return rows, legend_image, group
+
+
+def measure_rows(image_pairs):
+    """测量：确定每行的内容区域，不缩放、不绘制任何像素
+
+    缺失的图片对被跳过；两张图片各自裁剪，缩放到以前一天图片内容区域为基准的相同尺寸。
+    各地图底部相同的图例条被去掉，由对比图统一绘制一次。
 
+    Returns:
+        MeasuredRows: 行布局列表（display_size 为None）、共享图例和去掉了图例条的行
+    """
+    rows = []
     for today_path, yesterday_path, region, subregion in image_pairs:
         # 检查图片是否存在
-        if not os.path.exists(today_path) or not os.path.exists(yesterday_path):
+        if not storage.image_exists(today_path) or not storage.image_exists(yesterday_path):
             print(f"警告: 图片不存在 - {today_path} 或 {yesterday_path}")
             continue
-
-        # 绘制地区标题 - 使用加粗字体
-        region_name = f"{parser.get_chinese_region_name(region)} - {parser.get_chinese_region_name(subregion)}"
-        title = f"{region_name} {weather_text}"
-        title_bbox = draw.textbbox((0, 0), title, font=header_font_bold)
-        title_width = title_bbox[2] - title_bbox[0]
-        title_x = (canvas_width - title_width) // 2
-        draw.text((title_x, y_offset), title, fill='black', font=header_font_bold)
-        y_offset += 50  # 减少间距，因为没有标签了
-
-        # 加载并调整图片大小
         try:
-            # 加载图片
-            img_yesterday = Image.open(yesterday_path)
-            img_today = Image.open(today_path)
+            box = get_content_box(yesterday_path)
+            today_box = get_content_box(today_path)
+        except Exception as e:
+            print(f"错误: 读取图片失败 - {e}")
+            box = today_box = None
+        rows.append(RowLayout(today_path, yesterday_path, region, subregion, box, today_box, None))
+
+    rows, legend_image, legend_indexes = _extract_shared_legend(rows)
+    legend_keys = set((rows[index].today_path, rows[index].yesterday_path) for index in legend_indexes)
+    return MeasuredRows(rows, legend_image, legend_keys)
 
-            # 获取原始图片尺寸
-            yest_width, yest_height = img_yesterday.size
-            today_width, today_height = img_today.size
 
-            # 使用昨天图片的尺寸作为基准（假设两张图尺寸相同）
-            original_width = yest_width
-            original_height = yest_height
+def select_rows(measured, image_pairs):
+    """从测量结果中按 image_pairs 的顺序选出一个分组的行，只有选中的行去掉了图例条时才保留共享图例"""
+    by_key = {(row.today_path, row.yesterday_path): row for row in measured.rows}
+    keys = [(today_path, yesterday_path) for today_path, yesterday_path, _, _ in image_pairs]
+    rows = [by_key[key] for key in keys if key in by_key]
+    legend_image = measured.legend if any(key in measured.legend_keys for key in keys) else None
+    return rows, legend_image
 
-            # 使用配置的放大倍数，让图片更大更清晰
-            img_display_width = int(original_width * IMAGE_SCALE_FACTOR)
-            img_display_height = int(original_height * IMAGE_SCALE_FACTOR)
 
-            # 确保不会超出画布宽度
-            max_possible_width = (canvas_width - GAP_BETWEEN_IMAGES) // 2
-            if img_display_width > max_possible_width:
-                img_display_width = max_possible_width
-                img_display_height = int(original_height * (img_display_width / original_width))
+def scale_rows(rows, legend_image, scale=None, budget_mb=0, tiles=False, grid=None):
+    """缩放：按网格的格子宽度和放大倍数（或内存预算）确定每个图片对和共享图例的显示尺寸
 
-            # 调整图片大小，保持宽高比
-            img_yesterday = img_yesterday.resize((img_display_width, img_display_height), Image.Resampling.LANCZOS)
-            img_today = img_today.resize((img_display_width, img_display_height), Image.Resampling.LANCZOS)
+    只使用内容区域的尺寸，不解码像素。
 
-            # 计算图片位置（左右布局），居中分布
-            gap_between = GAP_BETWEEN_IMAGES  # 使用配置的间距
+    Returns:
+        Layout: 行布局列表、放大倍数、共享图例和网格
+    """
+    grid = grid or grid_from_config()
+    width = cell_width(grid)
+    boxes = [row.box for row in rows if row.box is not None]
+    if scale is None:
+        scale = grid.scale
+        if boxes:
+            # 超出内存预算时降低放大倍数
+            largest = (max(box[2] - box[0] for box in boxes), max(box[3] - box[1] for box in boxes))
+            scale = choose_scale_factor(len(rows), largest, budget_mb, tiles=tiles, grid=grid)
+
+    laid_out = []
+    for row in rows:
+        if row.box is None:
+            display_size = (0, ERROR_ROW_HEIGHT)
+        else:
+            display_size = _display_size(_box_size(row.box), scale, width)
+        laid_out.append(row._replace(display_size=display_size))
+
+    legend = None
+    if legend_image is not None:
+        # 图例与地图使用相同的缩放比例，宽度不超过画布
+        legend_scale = min(scale, (grid.width - 2 * GAP_BETWEEN_IMAGES) / legend_image.width)
+        legend = (legend_image, (int(legend_image.width * legend_scale), int(legend_image.height * legend_scale)))
+    return Layout(laid_out, scale, legend, grid)
+
+
+def layout_rows(image_pairs, scale=None, budget_mb=0, tiles=False, grid=None):
+    """布局：确定每行的内容区域和显示尺寸，不绘制任何像素
+
+    Returns:
+        Layout: 行布局列表、放大倍数、共享图例和网格
+    """
+    measured = measure_rows(image_pairs)
+    return scale_rows(measured.rows, measured.legend, scale=scale, budget_mb=budget_mb, tiles=tiles, grid=grid)
 
-            # 计算总宽度：两张图片 + 间距
-            total_width = img_display_width * 2 + gap_between
 
-            # 计算起始位置，让整个组合居中
-            start_x = (canvas_width - total_width) // 2
+class RowStrips:
+    """一个天气变量的行条带缓存：每个子地区的条带（地区标题 + 两张缩放后的图片）只渲染一次
 
-            # 左边图片位置
-            left_x = start_x
+    各分组报告（包括 all）从同一次测量中选取自己的行，共享图例和内容区域一致，
+    条带可以直接拼接，合成报告只需要内存拷贝和编码。
 
-            # 右边图片位置：左边图片宽度 + 间距
-            right_x = start_x + img_display_width + gap_between
+    Args:
+        image_pairs: 所有分组图片对的并集，格式为[(today_path, yesterday_path, region, subregion), ...]
+        max_bytes: 缓存条带像素缓冲区的上限，超出时淘汰最早使用的条带；0 表示不限制
+    """
 
-            # 粘贴图片
-            canvas.paste(img_yesterday, (left_x, y_offset))
-            canvas.paste(img_today, (right_x, y_offset))
+    def __init__(self, image_pairs, max_bytes=0):
+        self.image_pairs = image_pairs
+        self.max_bytes = max_bytes
+        self.measured = None
+        self.strips = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def layout(self, image_pairs, budget_mb=0, tiles=False, grid=None):
+        """一个分组的布局，第一次调用时测量所有图片对"""
+        if self.measured is None:
+            self.measured = measure_rows(self.image_pairs)
+        rows, legend_image = select_rows(self.measured, image_pairs)
+        return scale_rows(rows, legend_image, budget_mb=budget_mb, tiles=tiles, grid=grid)
+
+    def get(self, key):
+        strip = self.strips.get(key)
+        if strip is None:
+            self.misses += 1
+            return None
+        self.strips.move_to_end(key)
+        self.hits += 1
+        return strip
+
+    def put(self, key, strip):
+        size = image_bytes(strip.size, strip.mode)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        self.strips[key] = strip
+        self.bytes += size
+        while self.max_bytes and self.bytes > self.max_bytes:
+            _, evicted = self.strips.popitem(last=False)
+            self.bytes -= image_bytes(evicted.size, evicted.mode)
+            evicted.close()
+
+    def clear(self):
+        for strip in self.strips.values():
+            strip.close()
+        self.strips.clear()
+        self.bytes = 0
+
+
+class ComparisonRenderer:
+    """对比图渲染器，在一次运行（或一个服务进程）中复用
+
+    字体只解析和加载一次，地区名称映射使用同一个 WeatherParser；
+    标题等文字按 (文字, 字体) 栅格化为灰度遮罩并缓存，绘制时按颜色粘贴，不同分组和天气变量共用。
+    """
 
-            # 不再绘制"前一天"和"今天"标签，让图片更大更清晰
+    def __init__(self):
+        from .parser import WeatherParser
+
+        self.parser = WeatherParser()
+        self.title_font, self.title_font_bold, self.header_font, self.header_font_bold = load_fonts()
+        self.text_masks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def text_mask(self, text, font):
+        """文字的灰度遮罩（从绘制原点开始）和宽度（同 textbbox 的宽度）"""
+        key = (text, id(font))
+        with self.lock:
+            cached = self.text_masks.get(key)
+            if cached is not None:
+                self.text_masks.move_to_end(key)
+                return cached
+
+            bbox = font.getbbox(text)
+            mask = Image.new("L", (max(1, bbox[2]), max(1, bbox[3])), 0)
+            ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=font)
+            cached = (mask, bbox[2] - bbox[0])
+            self.text_masks[key] = cached
+            if len(self.text_masks) > TEXT_CACHE_SIZE:
+                self.text_masks.popitem(last=False)
+            return cached
+
+    def text_width(self, text, font):
+        return self.text_mask(text, font)[1]
+
+    def draw_text(self, image, position, text, font, fill="black", cache=True):
+        """在 position（绘制原点）处绘制文字，cache=False 用于只出现一次的文字（如生成时间）"""
+        if not cache:
+            ImageDraw.Draw(image).text(position, text, fill=fill, font=font)
+            return
+        mask, _ = self.text_mask(text, font)
+        x, y = position
+        image.paste(fill, (x, y, x + mask.width, y + mask.height), mask)
+
+    def draw_centered(self, image, y, text, font, fill="black"):
+        """在整个宽度上水平居中绘制文字"""
+        x = (image.width - self.text_width(text, font)) // 2
+        self.draw_text(image, (x, y), text, font, fill)
+
+    def region_title(self, region, subregion, weather_text):
+        return (f"{self.parser.get_chinese_region_name(region)} - "
+                f"{self.parser.get_chinese_region_name(subregion)} {weather_text}")
+
+    def render_strip(self, row, weather_text, tracker, width=CANVAS_WIDTH):
+        """渲染一格条带：地区标题 + 左右两张裁剪缩放后的图片 + 间距，宽度为格子宽度（每行一格时为画布宽度）
+
+        Returns:
+            tuple: (条带图片, 是否渲染成功)，图片加载失败时条带中绘制错误信息
+        """
+        img_display_width, img_display_height = row.display_size
+        strip = Image.new('RGB', (width, ROW_TITLE_HEIGHT + img_display_height + ROW_GAP), 'white')
+        tracker.allocate(image_bytes(strip.size, strip.mode))
 
-            y_offset += img_display_height + 20  # 减小图片下方的间距
+        # 绘制地区标题 - 使用加粗字体
+        self.draw_centered(strip, 0, self.region_title(row.region, row.subregion, weather_text),
+                           self.header_font_bold)
+        y_offset = ROW_TITLE_HEIGHT
+
+        try:
+            if row.box is None:
+                raise ValueError("无法确定图片内容区域")
+
+            # 加载图片，只缩放内容区域，缩放后立即关闭原图释放解码缓冲区
+            with storage.open_image(row.yesterday_path) as source_yesterday, \
+                    storage.open_image(row.today_path) as source_today:
+                source_bytes = (image_bytes(source_yesterday.size, source_yesterday.mode)
+                                + image_bytes(source_today.size, source_today.mode))
+                tracker.allocate(source_bytes)
+
+                # 调整图片大小，保持宽高比
+                img_yesterday = source_yesterday.resize((img_display_width, img_display_height),
+                                                        Image.Resampling.LANCZOS, box=row.box)
+                img_today = source_today.resize((img_display_width, img_display_height),
+                                                Image.Resampling.LANCZOS, box=row.today_box)
+                resized_bytes = (image_bytes(img_yesterday.size, img_yesterday.mode)
+                                 + image_bytes(img_today.size, img_today.mode))
+                tracker.allocate(resized_bytes)
+            tracker.release(source_bytes)
+
+            # 计算图片位置（左右布局），让两张图片和间距整体居中
+            total_width = img_display_width * 2 + GAP_BETWEEN_IMAGES
+            left_x = (width - total_width) // 2
+            right_x = left_x + img_display_width + GAP_BETWEEN_IMAGES
+
+            # 粘贴图片
+            strip.paste(img_yesterday, (left_x, y_offset))
+            strip.paste(img_today, (right_x, y_offset))
+            img_yesterday.close()
+            img_today.close()
+            tracker.release(resized_bytes)
+            return strip, True
 
         except Exception as e:
             print(f"错误: 处理图片失败 - {e}")
             # 绘制错误信息
-            error_text = f"图片加载失败: {region} - {subregion}"
-            draw.text((100, y_offset), error_text, fill='red', font=text_font)
-            y_offset += 100
-
-    # 保存图片
-    canvas.save(output_path, 'PNG', quality=95)
-    print(f"成功生成对比图片: {output_path}")
+            error_text = f"图片加载失败: {row.region} - {row.subregion}"
+            self.draw_text(strip, (100, y_offset), error_text, self.header_font, fill='red')
+            return strip, False
+
+    def render(self, image_pairs, output_path, weather_type, group_desc, compare_dates, save_date_str,
+               tile_dir=None, missing=None, strips=None):
+        """创建图片对比，参数同 create_image_comparison"""
+        from datetime import datetime
+        from .config import config
+
+        # 设置天气变量文本描述
+        if weather_type == "pcp":
+            weather_text = "降水预报"
+        else:
+            weather_text = "温度预报"
+
+        # 第一步：布局。裁掉四周空白后按内容区域计算每行高度和画布大小
+        if strips is not None:
+            layout = strips.layout(image_pairs, budget_mb=config.render_memory_budget_mb, tiles=tile_dir is not None)
+        else:
+            layout = layout_rows(image_pairs, budget_mb=config.render_memory_budget_mb, tiles=tile_dir is not None)
+        rows, scale, legend, grid = layout
+        if scale < grid.scale:
+            print(f"警告: 超出内存预算 {config.render_memory_budget_mb}MB，放大倍数降低为 {scale}")
+
+        # 使用网格配置的画布宽度，每行 grid.columns 格
+        canvas_width = grid.width
+        width = cell_width(grid)
+        grid_rows = _grid_rows(rows, grid.columns)
+
+        # 缺失地区提示（下载失败或因截止时间未下载），按画布宽度折行
+        notice_lines = []
+        if missing:
+            names = [f"{self.parser.get_chinese_region_name(region)} - {self.parser.get_chinese_region_name(subregion)}"
+                     for region, subregion in missing]
+            notice_lines = _wrap_items(f"缺失地区（{len(names)}）: ", names, self.header_font, canvas_width - 100)
+
+        legend_height = legend[1][1] if legend else 0
+        canvas_height = _canvas_height([max(row.display_size[1] for row in cells) for cells in grid_rows],
+                                       legend_height, len(notice_lines) * NOTICE_LINE_HEIGHT)
+
+        # 创建白色背景画布
+        tracker = PixelTracker()
+        canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
+        tracker.allocate(image_bytes(canvas.size, canvas.mode))
+
+        # 获取当前时间
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # 绘制顶部标题 - 简化标题，更加醒目
+        self.draw_centered(canvas, 40, f"{group_desc}{weather_text}对比", self.title_font_bold)
+
+        # 绘制生成时间，右对齐，留50px边距（每次都不同，不缓存）
+        time_text = f"生成时间: {current_time}"
+        time_bbox = self.header_font.getbbox(time_text)
+        time_x = canvas_width - (time_bbox[2] - time_bbox[0]) - 50
+        self.draw_text(canvas, (time_x, 110), time_text, self.header_font, cache=False)
+
+        # 绘制日期信息，居中对齐
+        date_text = f"当前数据日期: {compare_dates.get('current', save_date_str)}  前一期数据日期: {compare_dates.get('previous', '')}"
+        self.draw_centered(canvas, 110, date_text, self.header_font)
+
+        # 第二步：绘制。按布局逐行渲染（或取已缓存的）条带并粘贴
+        y_offset = TOP_HEIGHT  # 跳过日期信息
+
+        for line in notice_lines:
+            self.draw_text(canvas, (50, y_offset), line, self.header_font, fill='red')
+            y_offset += NOTICE_LINE_HEIGHT
+
+        # 共享图例只绘制一次，放在所有地区之前
+        if legend is not None:
+            legend_image, (legend_width, legend_height) = legend
+            legend_resized = legend_image.resize((legend_width, legend_height), Image.Resampling.LANCZOS)
+            canvas.paste(legend_resized, ((canvas_width - legend_width) // 2, y_offset))
+            legend_resized.close()
+            y_offset += legend_height + ROW_GAP
+
+        for cells in grid_rows:
+            row_height = 0
+            for column, row in enumerate(cells):
+                position = (column * (width + GAP_BETWEEN_CELLS), y_offset)
+                key = (row, weather_text, width)
+                strip = strips.get(key) if strips is not None else None
+                if strip is not None:
+                    canvas.paste(strip, position)
+                    row_height = max(row_height, strip.height)
+                    continue
+
+                strip, rendered = self.render_strip(row, weather_text, tracker, width)
+                canvas.paste(strip, position)
+                row_height = max(row_height, strip.height)
+                tracker.release(image_bytes(strip.size, strip.mode))
+                if strips is not None and rendered:
+                    strips.put(key, strip)
+                else:
+                    strip.close()
+            y_offset += row_height
+
+        # 保存图片
+        canvas.save(output_path, 'PNG', quality=95)
+        print(f"成功生成对比图片: {output_path}（像素缓冲区峰值约 {tracker.peak_mb}MB）")
+
+        # 从同一张画布生成瓦片金字塔
+        if tile_dir is not None:
+            from .tiles import write_tile_pyramid
+
+            name = os.path.splitext(os.path.basename(output_path))[0]
+            write_tile_pyramid(canvas, tile_dir, name, tile_size=config.tile_size, fmt=config.tile_format)
+
+        canvas.close()
+        return output_path
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """进程内共享的渲染器，第一次调用时创建"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ComparisonRenderer()
+        return _renderer
+
+
+def create_image_comparison(image_pairs, output_path, weather_type, group_desc, compare_dates, save_date_str,
+                            tile_dir=None, missing=None, strips=None, renderer=None):
+    """直接创建图片对比
 
-    return output_path
\ No newline at end of file
+    Args:
+        image_pairs: 图片对列表，格式为[(today_path, yesterday_path, region, subregion), ...]
+        output_path: 输出图片路径
+        weather_type: 天气类型（'pcp'或'tmp'）
+        group_desc: 组描述（如'美国'、'巴西'等）
+        compare_dates: 对比日期字典，包含'previous'和'current'
+        save_date_str: 保存日期字符串
+        tile_dir: 瓦片金字塔输出目录，为None时不生成瓦片
+        missing: 缺失的地区 [(region, subregion), ...]，在标题下方以红字标注
+        strips: RowStrips，多个分组共用已渲染的行条带，为None时每行单独渲染
+        renderer: ComparisonRenderer，为None时使用进程内共享的渲染器
+    """
+    renderer = renderer or get_renderer()
+    return renderer.render(image_pairs, output_path, weather_type, group_desc, compare_dates, save_date_str,
+                           tile_dir=tile_dir, missing=missing, strips=strips)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载图片的完整性校验
+网站偶尔返回被截断的PNG，或在数据未就绪时返回"无数据"占位图，HTTP状态码仍是200。
+校验在写入文件之前进行：检查PNG签名、每个块的长度和CRC、IHDR在最前、IEND在最后，
+同时计算sha256与已知的占位图比较。只读一遍字节，不需要解码像素。
+
+已知占位图的sha256通过 PLACEHOLDER_SHA256（逗号分隔）配置，可用 `python -m weather_spider.integrity 文件...` 计算。
+"""
+
+import sys
+import zlib
+import struct
+import hashlib
+
+from .config import config
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# 单个块的长度上限（PNG规范为 2^31-1），超过时认为数据已损坏
+MAX_CHUNK_LENGTH = 2 ** 31 - 1
+
+
+class InvalidImageError(Exception):
+    """下载的图片不完整、已损坏或是占位图"""
+
+
+class PNGValidator:
+    """增量PNG校验器：按到达顺序 feed 字节，最后调用 finish
+
+    不缓存块数据，CRC和sha256都是流式计算的，内存占用与图片大小无关。
+
+    Args:
+        placeholder_hashes: 已知占位图的sha256集合，为None时使用配置
+    """
+
+    def __init__(self, placeholder_hashes=None):
+        self.placeholder_hashes = config.placeholder_hashes if placeholder_hashes is None else placeholder_hashes
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.pending = b""  # 未处理完的签名、块头或CRC字节
+        self.signature_checked = False
+        self.chunk_type = None  # 当前块的类型，None 表示等待块头
+        self.remaining = 0  # 当前块剩余的数据字节
+        self.crc = 0
+        self.chunks = []  # 已完成的块类型
+        self.image_size = None
+
+    def _fail(self, reason):
+        raise InvalidImageError(reason)
+
+    def feed(self, data):
+        """处理一段字节，发现结构错误时立即抛出 InvalidImageError"""
+        self.digest.update(data)
+        self.size += len(data)
+        data = self.pending + data if self.pending else data
+        self.pending = b""
+        offset = 0
+        view = memoryview(data)
+
+        while offset < len(data):
+            if not self.signature_checked:
+                if len(data) - offset < len(PNG_SIGNATURE):
+                    break
+                if data[offset:offset + len(PNG_SIGNATURE)] != PNG_SIGNATURE:
+                    self._fail("不是PNG文件")
+                self.signature_checked = True
+                offset += len(PNG_SIGNATURE)
+                continue
+
+            if self.chunk_type is None:
+                if self.chunks and self.chunks[-1] == b"IEND":
+                    self._fail("IEND 之后还有数据")
+                if len(data) - offset < 8:
+                    break
+                length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+                if length > MAX_CHUNK_LENGTH or not chunk_type.isalpha():
+                    self._fail(f"块头损坏（偏移 {self.size - len(data) + offset}）")
+                if not self.chunks and chunk_type != b"IHDR":
+                    self._fail("第一个块不是 IHDR")
+                self.chunk_type = chunk_type
+                self.remaining = length
+                self.crc = zlib.crc32(chunk_type)
+                if chunk_type == b"IHDR" and length != 13:
+                    self._fail("IHDR 长度错误")
+                offset += 8
+                continue
+
+            if self.remaining:
+                if self.chunk_type == b"IHDR" and self.image_size is None:
+                    # 宽高在 IHDR 数据的前8字节，数据不完整时等下一段
+                    if len(data) - offset < 13:
+                        break
+                    self.image_size = struct.unpack(">II", data[offset:offset + 8])
+                take = min(self.remaining, len(data) - offset)
+                self.crc = zlib.crc32(view[offset:offset + take], self.crc)
+                self.remaining -= take
+                offset += take
+                continue
+
+            if len(data) - offset < 4:
+                break
+            (expected,) = struct.unpack(">I", data[offset:offset + 4])
+            if expected != self.crc & 0xFFFFFFFF:
+                self._fail(f"{self.chunk_type.decode('ascii')} 块CRC校验失败")
+            self.chunks.append(self.chunk_type)
+            self.chunk_type = None
+            offset += 4
+
+        self.pending = data[offset:]
+
+    def finish(self):
+        """数据结束时调用，检查文件完整并且不是占位图
+
+        Returns:
+            str: 内容的sha256
+        """
+        if self.size == 0:
+            self._fail("响应为空")
+        if self.pending or self.chunk_type is not None or not self.chunks or self.chunks[-1] != b"IEND":
+            self._fail(f"PNG不完整（{self.size} 字节，缺少 IEND）")
+        if b"IDAT" not in self.chunks:
+            self._fail("PNG没有图像数据")
+        if not self.image_size or 0 in self.image_size:
+            self._fail("PNG尺寸无效")
+        sha256 = self.digest.hexdigest()
+        if sha256 in self.placeholder_hashes:
+            self._fail("网站返回了无数据占位图")
+        return sha256
+
+
+def validate_png_bytes(content, placeholder_hashes=None):
+    """校验一段完整的PNG内容，返回sha256，无效时抛出 InvalidImageError"""
+    validator = PNGValidator(placeholder_hashes)
+    validator.feed(content)
+    return validator.finish()
+
+
+def validate_png_file(path, placeholder_hashes=None, chunk_size=64 * 1024):
+    """逐块读取并校验PNG文件，返回sha256，无效时抛出 InvalidImageError"""
+    validator = PNGValidator(placeholder_hashes)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            validator.feed(chunk)
+    return validator.finish()
+
+
+if __name__ == "__main__":
+    # 输出文件的sha256和校验结果，用于把网站的占位图加入 PLACEHOLDER_SHA256
+    for file_path in sys.argv[1:]:
+        try:
+            print(f"{validate_png_file(file_path, placeholder_hashes=set())}  {file_path}")
+        except (OSError, InvalidImageError) as e:
+            print(f"无效: {file_path} - {e}")
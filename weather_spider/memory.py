@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存统计
+读取进程的峰值常驻内存（RSS），并估算渲染时像素缓冲区占用的内存，用于遵守 RENDER_MEMORY_BUDGET_MB 预算
+"""
+
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块
+    resource = None
+
+MB = 1024 * 1024
+
+# PIL 中 RGB/RGBA/P 等常见模式在内存中的每像素字节数（RGB 按4字节对齐存储）
+BYTES_PER_PIXEL = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I": 4, "F": 4}
+DEFAULT_BYTES_PER_PIXEL = 4
+
+
+def _read_status_kb(field):
+    """读取 /proc/self/status 中的字段（单位kB），不可用时返回None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """重置峰值RSS统计，使下一次读取只反映之后的峰值
+
+    Returns:
+        bool: 是否重置成功（仅 Linux 支持，其他平台的峰值从进程启动开始累计）
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """进程的峰值RSS（MB），无法获取时返回None"""
+    peak_kb = _read_status_kb("VmHWM")
+    if peak_kb is not None:
+        return round(peak_kb / 1024, 1)
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位是字节，Linux 是kB
+    divisor = MB if sys.platform == "darwin" else 1024
+    return round(max_rss / divisor, 1)
+
+
+def image_bytes(size, mode="RGB"):
+    """估算一张图片解码后像素缓冲区的字节数"""
+    width, height = size
+    return width * height * BYTES_PER_PIXEL.get(mode, DEFAULT_BYTES_PER_PIXEL)
+
+
+class PixelTracker:
+    """跟踪渲染过程中同时存活的像素缓冲区，记录估算的峰值"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def allocate(self, nbytes):
+        self.current += nbytes
+        self.peak = max(self.peak, self.current)
+
+    def release(self, nbytes):
+        self.current -= nbytes
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / MB, 1)
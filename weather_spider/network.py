@@ -1,14 +1,115 @@
+import os
 import requests
+import threading
 import time
+from requests.adapters import HTTPAdapter
+
+from .config import config
+from .integrity import InvalidImageError, validate_png_bytes
+from .sources import HedgedFetcher, create_sources
+from .transport import create_transport
+
+
+def create_session(pool_size=10):
+    """创建带连接池的会话，多线程下载时共享同一个会话以复用连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimiter:
+    """令牌桶限速器，线程安全，用于限制并发下载对源站的请求频率"""
+
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate: 每秒允许的请求数，<=0 表示不限速
+            burst: 桶容量（允许的突发请求数），默认等于rate
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def write_validated_image(content, save_path):
+    """校验图片内容，通过后写入临时文件并原子地替换为 save_path
+
+    响应经过对冲请求和记录/回放传输层，到达这里时已完整读入内存；占位图需要完整内容的sha256才能识别，
+    因此直接校验内存中的字节。无效的内容（截断、CRC错误、占位图）不会写入磁盘。
+
+    Returns:
+        str: 内容的sha256
+    """
+    digest = validate_png_bytes(content)
+    tmp_path = f"{save_path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, save_path)
+        return digest
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 class NetworkRequest:
     """网络请求模块，负责获取图片编号和下载图片"""
     
-    def __init__(self):
-        self.base_url = 'http://www.worldagweather.com'
+    def __init__(self, session=None, rate_limiter=None, transport=None, base_url=None):
+        """
+        Args:
+            session: 共享的requests会话，为None时创建新会话
+            rate_limiter: 共享的限速器，为None时不限速
+            transport: 传输层，为None时根据 WEATHER_SPIDER_TRANSPORT 创建（live/record/replay）
+            base_url: 主站地址，为None时使用 WEATHER_SPIDER_BASE_URL
+        """
+        self.base_url = (base_url or config.base_url).rstrip('/')
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.session = session or create_session()
+        self.rate_limiter = rate_limiter
+        self.transport = transport or create_transport(self.session)
+        # 主站加镜像，按优先级对冲请求
+        sources = create_sources([self.base_url] + config.mirrors, self.transport)
+        self.fetcher = HedgedFetcher(sources, percentile=config.hedge_percentile,
+                                     initial_delay_ms=config.hedge_initial_delay_ms)
+
+    def close(self):
+        """关闭对冲请求的线程池，并写入记录模式下尚未保存的磁带索引"""
+        self.fetcher.close()
+        close_transport = getattr(self.transport, "close", None)
+        if close_transport is not None:
+            close_transport()
+
+    def _get(self, url, timeout=30, headers=None):
+        """发送GET请求（经过限速器，主站地址下的请求会在各数据源之间对冲），headers 为额外的请求头"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        headers = dict(self.headers, **headers) if headers else self.headers
+        if not url.startswith(self.base_url):
+            return self.transport.get(url, headers=headers, timeout=timeout)
+        path = url[len(self.base_url):]
+        return self.fetcher.get(path, headers=headers, timeout=timeout)
     
     def get_image_numbers(self):
         """获取图片编号
@@ -17,7 +118,7 @@ class NetworkRequest:
         url = f'{self.base_url}/cgi-bin/ag/getcropimglabs.pl'
         
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._get(url)
             response.raise_for_status()
             
             # 解析响应内容，格式为：fcstimgnum|pastpcpimgnum|pasttmpimgnum
@@ -49,19 +150,27 @@ class NetworkRequest:
         """
         for i in range(retry):
             try:
-                response = requests.get(image_url, headers=self.headers, timeout=30)
+                response = self._get(image_url)
                 response.raise_for_status()
                 
-                # 保存图片
-                with open(save_path, 'wb') as f:
-                    f.write(response.content)
+                # 校验并保存图片，截断、损坏或占位图会进入重试
+                write_validated_image(response.content, save_path)
                 
                 print(f"图片下载成功: {save_path}")
                 return True
                 
+            except InvalidImageError as e:
+                print(f"图片校验失败 (尝试 {i+1}/{retry}): {image_url}")
+                print(f"错误信息: {e}")
+                if i < retry - 1:
+                    print("等待2秒后重试...")
+                    time.sleep(2)
             except requests.RequestException as e:
                 print(f"下载图片失败 (尝试 {i+1}/{retry}): {image_url}")
                 print(f"错误信息: {e}")
+                # 404表示该图片不存在，重试没有意义
+                if getattr(e.response, 'status_code', None) == 404:
+                    break
                 if i < retry - 1:
                     print("等待2秒后重试...")
                     time.sleep(2)
@@ -1,3 +1,9 @@
+from collections import namedtuple
+
+# 一张待下载图片的描述：作物、地区、子地区索引以及天气变量和天数
+ImageTask = namedtuple("ImageTask", ["crop_index", "region_index", "subregion_index", "vrbl", "nday"])
+
+
 class WeatherParser:
     """天气数据解析模块，负责管理国家和地区列表、构建图片URL以及生成图片保存路径"""
     
@@ -147,6 +153,27 @@ class WeatherParser:
                 return self.subregions1[crop_index][region_index]
         return []
         
+    def iter_image_tasks(self, crop_indices, vrbls=("pcp", "tmp"), ndays=(15,)):
+        """按固定顺序列出所有需要下载的图片
+
+        Args:
+            crop_indices: 作物索引列表
+            vrbls: 天气变量列表
+            ndays: 天数列表
+
+        Returns:
+            list: ImageTask列表，顺序为 作物 -> 天气变量 -> 天数 -> 地区 -> 子地区
+        """
+        tasks = []
+        for crop_index in crop_indices:
+            for vrbl in vrbls:
+                for nday in ndays:
+                    for region_index in range(len(self.get_regions_by_crop(crop_index))):
+                        subregions = self.get_subregions_by_crop_and_region(crop_index, region_index)
+                        for subregion_index in range(len(subregions)):
+                            tasks.append(ImageTask(crop_index, region_index, subregion_index, vrbl, nday))
+        return tasks
+
     def get_chinese_region_name(self, english_name):
         """获取英文地区名称对应的中文名称
         
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读穿透缓存代理
+一个爬虫实例以代理模式运行，对外提供与网站相同的 getcropimglabs.pl 和 crops/...png 路径：
+命中本地缓存时直接返回，未命中时向上游请求一次并写入缓存；同一URL的并发请求合并为一次上游请求。
+其他实例把 WEATHER_SPIDER_BASE_URL 指向代理即可，上游流量变为每张图片每天一次。
+
+缓存目录结构与网站路径一致，也可以直接作为 WEATHER_SPIDER_MIRRORS 中的本地目录数据源使用。
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from .config import config
+from .integrity import InvalidImageError
+from .network import NetworkRequest, write_validated_image
+
+IMAGE_NUMBERS_PATH = "/cgi-bin/ag/getcropimglabs.pl"
+IMAGE_PREFIX = "/crops/"
+
+# 只缓存明确表示不存在的状态码，暂时性错误（5xx、429、408）直接透传
+NEGATIVE_STATUS = (404, 410)
+NEGATIVE_CACHE_SIZE = 4096  # 不存在路径的最大记录数
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时间只有一个调用真正执行，其余调用等待并共享结果"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self.calls[key] = call
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = func()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["event"].set()
+
+
+class CachingProxy:
+    """缓存代理的核心逻辑（与HTTP服务器分离）
+
+    Args:
+        cache_dir: 缓存目录
+        upstream: 上游地址，默认使用 WEATHER_SPIDER_BASE_URL
+        numbers_ttl: 图片编号的缓存时间（秒），编号会随新预报发布而变化
+    """
+
+    def __init__(self, cache_dir=None, upstream=None, numbers_ttl=None):
+        self.cache_dir = cache_dir or config.proxy_cache_dir
+        self.numbers_ttl = config.proxy_numbers_ttl if numbers_ttl is None else numbers_ttl
+        self.network = NetworkRequest(base_url=upstream)
+        self.flight = SingleFlight()
+        # 上游确认不存在的路径（404/410）短时间内不再重复请求：路径 -> (过期时间, 状态码)，按插入顺序淘汰
+        self.negative = OrderedDict()
+        self.negative_lock = threading.Lock()
+        self.stats = {"hit": 0, "miss": 0, "upstream": 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def cache_path(self, path):
+        return os.path.join(self.cache_dir, *path.strip("/").split("/"))
+
+    def _is_fresh(self, cache_path, path):
+        if not os.path.isfile(cache_path):
+            return False
+        if path == IMAGE_NUMBERS_PATH:
+            return time.time() - os.path.getmtime(cache_path) < self.numbers_ttl
+        # 图片文件名中包含图片编号，内容不会变化
+        return True
+
+    def _remember_missing(self, path, status_code):
+        """记录不存在的路径，超过上限时先删除过期的记录，再删除最早的记录"""
+        now = time.time()
+        with self.negative_lock:
+            self.negative.pop(path, None)
+            self.negative[path] = (now + self.numbers_ttl, status_code)
+            if len(self.negative) > NEGATIVE_CACHE_SIZE:
+                for expired in [key for key, (expires_at, _) in self.negative.items() if expires_at <= now]:
+                    del self.negative[expired]
+            while len(self.negative) > NEGATIVE_CACHE_SIZE:
+                self.negative.popitem(last=False)
+
+    def _fetch_upstream(self, path, cache_path):
+        """向上游请求并写入缓存，返回 (状态码, 内容)"""
+        # 等待期间其他请求可能已经写入缓存
+        if self._is_fresh(cache_path, path):
+            with open(cache_path, "rb") as f:
+                return 200, f.read()
+
+        self._count("upstream")
+        response = self.network._get(f"{self.network.base_url}{path}", timeout=config.request_timeout)
+        if response.status_code in NEGATIVE_STATUS:
+            self._remember_missing(path, response.status_code)
+            return response.status_code, b""
+        if response.status_code >= 400:
+            # 5xx、429、408 等暂时性错误不缓存，下一个请求会重新访问上游
+            return response.status_code, response.content
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        if path.endswith(".png"):
+            # 图片永久缓存，截断、损坏或占位图不写入缓存，客户端会重试
+            try:
+                write_validated_image(response.content, cache_path)
+            except InvalidImageError as e:
+                return 502, f"上游图片无效: {e}".encode("utf-8")
+            return 200, response.content
+
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, cache_path)
+        return 200, response.content
+
+    def get(self, path):
+        """获取路径对应的内容
+
+        Returns:
+            tuple: (状态码, 内容)
+        """
+        if path != IMAGE_NUMBERS_PATH and not (path.startswith(IMAGE_PREFIX) and path.endswith(".png")):
+            return 404, b""
+        if ".." in path.split("/"):
+            return 400, b""
+
+        cache_path = self.cache_path(path)
+        if self._is_fresh(cache_path, path):
+            self._count("hit")
+            with open(cache_path, "rb") as f:
+                return 200, f.read()
+
+        with self.negative_lock:
+            negative = self.negative.get(path)
+            if negative and negative[0] <= time.time():
+                del self.negative[path]
+                negative = None
+        if negative:
+            return negative[1], b""
+
+        self._count("miss")
+        return self.flight.do(path, lambda: self._fetch_upstream(path, cache_path))
+
+
+def _make_handler(proxy):
+    class ProxyHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            try:
+                status, body = proxy.get(path)
+            except Exception as e:
+                status, body = 502, str(e).encode("utf-8")
+
+            self.send_response(status)
+            content_type = "image/png" if path.endswith(".png") else "text/plain; charset=utf-8"
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ProxyHandler
+
+
+def run_proxy(host="0.0.0.0", port=8080, upstream=None, cache_dir=None):
+    """启动缓存代理（阻塞运行）"""
+    from .daily_summary import log
+
+    proxy = CachingProxy(cache_dir=cache_dir, upstream=upstream)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(proxy))
+    log(f"缓存代理已启动: http://{host}:{port} -> {proxy.network.base_url}，缓存目录 {proxy.cache_dir}")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        proxy.network.close()
+        log(f"缓存代理统计: 命中 {proxy.stats['hit']}，未命中 {proxy.stats['miss']}，上游请求 {proxy.stats['upstream']}")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发布到对象存储
+把 output/{date}/（以及可选的当天下载数据）并发上传到 S3 兼容的对象存储（AWS S3、MinIO 等）。
+对象的 sha256 保存在元数据 x-amz-meta-sha256 中，远端已有相同内容的对象会跳过；大文件使用分片上传。
+渲染时每生成一张对比图就提交上传，上传与后续分组的渲染并行进行。
+
+boto3 是可选依赖，未安装或未配置 S3_BUCKET 时不发布。
+"""
+
+import os
+import hashlib
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import config
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+HASH_METADATA_KEY = "sha256"
+
+
+def file_sha256(path):
+    """计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_key(path, prefix=""):
+    """本地路径对应的对象键：前缀 + 相对当前目录的路径（使用 / 分隔）"""
+    relative = os.path.relpath(path).replace(os.sep, "/")
+    return f"{prefix.strip('/')}/{relative}" if prefix.strip("/") else relative
+
+
+class Publisher:
+    """并发上传文件到S3兼容的对象存储
+
+    Args:
+        bucket: 存储桶
+        prefix: 对象键前缀
+        endpoint_url: 服务地址（MinIO等），为None时使用AWS默认地址
+        workers: 并发上传的文件数
+        multipart_mb: 超过该大小（MB）的文件使用分片上传，分片大小相同
+        client: 已创建的S3客户端，为None时用boto3创建（凭证来自标准的 AWS_* 环境变量）
+    """
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, workers=8, multipart_mb=8, client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client or boto3.client("s3", endpoint_url=endpoint_url)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_mb * 1024 * 1024,
+            multipart_chunksize=multipart_mb * 1024 * 1024,
+        )
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+        self.submitted = set()
+        self.lock = threading.Lock()
+        self.stats = {"uploaded": 0, "skipped": 0, "failed": 0, "bytes": 0}
+
+    def _remote_hash(self, key):
+        """远端对象的sha256元数据，对象不存在时返回None"""
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return response.get("Metadata", {}).get(HASH_METADATA_KEY)
+
+    def upload(self, path, key=None):
+        """上传一个文件，远端已有相同内容时跳过
+
+        Returns:
+            str: "uploaded"、"skipped" 或 "failed"
+        """
+        from .daily_summary import log
+
+        key = key or object_key(path, self.prefix)
+        try:
+            digest = file_sha256(path)
+            if self._remote_hash(key) == digest:
+                result = "skipped"
+            else:
+                extra_args = {"Metadata": {HASH_METADATA_KEY: digest}}
+                content_type = mimetypes.guess_type(path)[0]
+                if content_type:
+                    extra_args["ContentType"] = content_type
+                self.client.upload_file(path, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+                result = "uploaded"
+        except Exception as e:
+            log(f"上传失败 {key}: {e}", "ERROR")
+            result = "failed"
+
+        with self.lock:
+            self.stats[result] += 1
+            if result == "uploaded":
+                self.stats["bytes"] += os.path.getsize(path)
+        return result
+
+    def submit(self, path, key=None):
+        """提交后台上传，同一路径只提交一次"""
+        with self.lock:
+            if path in self.submitted:
+                return None
+            self.submitted.add(path)
+        future = self.executor.submit(self.upload, path, key)
+        self.futures.append(future)
+        return future
+
+    def submit_tree(self, directory):
+        """提交目录下的所有文件（跳过以 . 开头的内部文件，如构建缓存清单）"""
+        count = 0
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            for name in sorted(files):
+                if not name.startswith("."):
+                    self.submit(os.path.join(root, name))
+                    count += 1
+        return count
+
+    def wait(self):
+        """等待所有已提交的上传完成，返回统计"""
+        for future in list(self.futures):
+            future.result()
+        return dict(self.stats)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def publish_outputs(publisher, output_dir, download_days=()):
+    """提交输出目录和下载数据并等待上传完成
+
+    Args:
+        publisher: Publisher
+        output_dir: 输出目录 output/{date}
+        download_days: 需要一起发布的下载日期目录（目录或打包文件）
+
+    Returns:
+        dict: 上传统计
+    """
+    from . import storage
+
+    publisher.submit_tree(output_dir)
+    for day_path in download_days:
+        if os.path.isdir(day_path):
+            publisher.submit_tree(day_path)
+        if os.path.exists(storage.pack_path_for(day_path)):
+            publisher.submit(storage.pack_path_for(day_path))
+    return publisher.wait()
+
+
+def create_publisher():
+    """根据配置创建发布器，未配置 S3_BUCKET 或未安装 boto3 时返回None"""
+    if not config.s3_bucket:
+        return None
+    if boto3 is None:
+        from .daily_summary import log
+
+        log("已配置 S3_BUCKET 但未安装 boto3，跳过发布（pip install boto3）", "WARN")
+        return None
+    return Publisher(
+        bucket=config.s3_bucket,
+        prefix=config.s3_prefix,
+        endpoint_url=config.s3_endpoint_url,
+        workers=config.s3_upload_workers,
+        multipart_mb=config.s3_multipart_mb,
+    )
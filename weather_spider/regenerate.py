@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量重新生成对比图
+修改布局或字体后，用已有的下载数据重建一段日期范围内的 output/，
+每个日期作为一个任务在进程池中并行渲染（同一日期的各天气变量共用一个输出目录和构建缓存清单，
+在同一个进程中依次渲染，避免并行写清单时互相覆盖）；
+设置 RENDER_MEMORY_BUDGET_MB 时按单个任务的估算内存减少进程数，预算平分给各个进程
+"""
+
+import os
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .config import config
+from . import storage
+from .memory import MB
+
+
+def _date_range(start_date_str, end_date_str):
+    date = datetime.datetime.strptime(start_date_str, "%Y%m%d")
+    end_date = datetime.datetime.strptime(end_date_str, "%Y%m%d")
+    dates = []
+    while date <= end_date:
+        dates.append(date)
+        date += datetime.timedelta(days=1)
+    return dates
+
+
+def _estimate_job_mb(dates, vrbls, downloads_root="downloads"):
+    """估算单个任务的峰值像素内存（MB）：按最大的"all"分组（当天所有图片各占一行）估算
+
+    只读取一张图片的文件头获取尺寸，没有可用数据时返回None
+    """
+    from .image_generator import estimate_render_bytes
+
+    estimate = None
+    for save_date in dates:
+        for vrbl in vrbls:
+            day_path = os.path.join(downloads_root, vrbl, save_date.strftime("%Y%m%d"))
+            if not storage.day_exists(day_path):
+                continue
+            names = [name for name in storage.list_day(day_path) if name.endswith(".png")]
+            if not names:
+                continue
+            with storage.open_image(os.path.join(day_path, names[0])) as sample:
+                size = sample.size
+            job_bytes = estimate_render_bytes(len(names), size, tiles=config.tile_pyramid)
+            estimate = max(estimate or 0, job_bytes / MB)
+    return estimate
+
+
+def _render_job(save_date, vrbls, force, memory_budget_mb=0):
+    """子进程中执行：渲染某一天各天气变量的所有分组
+
+    Returns:
+        dict: 天气变量 -> 生成的图片路径列表
+    """
+    from .daily_summary import DailyWeatherSummary
+
+    if force:
+        config.build_cache_enabled = False
+    config.render_memory_budget_mb = memory_budget_mb
+    summary = DailyWeatherSummary(save_date=save_date)
+    return {vrbl: summary.process_weather_data(vrbl) for vrbl in vrbls}
+
+
+def regenerate(start_date_str, end_date_str, vrbls=("pcp", "tmp"), workers=None, force=False):
+    """并行重新生成日期范围内的对比图
+
+    Args:
+        start_date_str: 开始日期（YYYYMMDD）
+        end_date_str: 结束日期（YYYYMMDD，包含）
+        vrbls: 天气变量列表
+        workers: 进程数，默认使用全部CPU
+        force: 忽略增量构建缓存，强制重新生成
+
+    Returns:
+        dict: (日期, 天气变量) -> 生成的图片路径列表
+    """
+    from .daily_summary import log
+
+    dates = _date_range(start_date_str, end_date_str)
+    workers = workers or os.cpu_count() or 1
+
+    # 内存预算：先减少进程数，每个进程仍超出预算时由渲染器降低放大倍数
+    budget_mb = config.render_memory_budget_mb
+    worker_budget_mb = 0
+    if budget_mb > 0:
+        job_mb = _estimate_job_mb(dates, vrbls)
+        if job_mb:
+            max_workers = max(1, int(budget_mb // job_mb))
+            if max_workers < workers:
+                log(f"单个任务估算需要 {job_mb:.0f}MB，内存预算 {budget_mb}MB，进程数降为 {max_workers}", "WARN")
+                workers = max_workers
+        worker_budget_mb = budget_mb // workers
+
+    log(f"重新生成 {start_date_str} - {end_date_str}: {len(dates)} 个任务，{workers} 个进程")
+
+    # 估算内存时在主进程中打开的打包文件不能被子进程继承（fork 后共享读取位置）
+    storage.close_packs()
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_job, save_date, vrbls, force, worker_budget_mb): save_date.strftime("%Y%m%d")
+                   for save_date in dates}
+        for future in as_completed(futures):
+            date_str = futures[future]
+            try:
+                for vrbl, paths in future.result().items():
+                    results[(date_str, vrbl)] = paths
+            except Exception as e:
+                log(f"重新生成失败 {date_str}: {e}", "ERROR")
+                for vrbl in vrbls:
+                    results[(date_str, vrbl)] = []
+
+    generated = sum(len(paths) for paths in results.values())
+    log(f"重新生成完成: {generated} 张图片", "SUCCESS")
+    return results
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告分组模块
+根据配置中的分组定义，一次遍历把图片对分配到所有分组
+"""
+
+from .parser import WeatherParser
+
+
+def parse_image_filename(filename):
+    """解析下载图片的文件名
+
+    格式: vrbl_crop_region_subregion_forecast.png 或 vrbl_crop_region_subregion_{nday}day.png
+
+    Returns:
+        dict: 包含 vrbl、crop、region、subregion、horizon，格式不正确时返回None
+    """
+    stem = filename.rsplit(".", 1)[0]
+    parts = stem.split("_")
+    if len(parts) < 5:
+        return None
+    return {
+        "vrbl": parts[0],
+        "crop": parts[1],
+        "region": parts[2],
+        "subregion": parts[3],
+        "horizon": parts[4],
+    }
+
+
+class ReportGroup:
+    """一个报告分组的定义"""
+
+    def __init__(self, name, display_name=None, regions=None, exclude_regions=None,
+                 subregions=None, crops=None, order="source", in_filename=True):
+        self.name = name
+        self.display_name = display_name or name
+        # 过滤条件统一转为集合，匹配时为O(1)查找
+        self.regions = set(regions) if regions else None
+        self.exclude_regions = set(exclude_regions) if exclude_regions else set()
+        self.subregions = set(subregions) if subregions else None
+        self.crops = set(crops) if crops else None
+        self.order = order
+        self.in_filename = in_filename
+
+    @classmethod
+    def from_dict(cls, definition):
+        return cls(**definition)
+
+    def to_dict(self):
+        """分组定义（可JSON序列化），用于增量构建指纹"""
+        def _sorted(values):
+            return sorted(values) if values is not None else None
+
+        return {
+            "name": self.name,
+            "display_name": self.display_name,
+            "regions": _sorted(self.regions),
+            "exclude_regions": sorted(self.exclude_regions),
+            "subregions": _sorted(self.subregions),
+            "crops": _sorted(self.crops),
+            "order": self.order,
+            "in_filename": self.in_filename,
+        }
+
+    def matches(self, crop, region, subregion):
+        """判断图片是否属于该分组"""
+        if self.crops is not None and crop not in self.crops:
+            return False
+        if self.regions is not None and region not in self.regions:
+            return False
+        if region in self.exclude_regions:
+            return False
+        if self.subregions is not None and subregion not in self.subregions:
+            return False
+        return True
+
+    def output_filename(self, vrbl, date_str):
+        """输出文件名"""
+        if self.in_filename:
+            return f"weather_summary_{vrbl}_{self.name}_{date_str}.png"
+        return f"weather_summary_{vrbl}_{date_str}.png"
+
+
+def load_groups(definitions):
+    """把配置中的分组定义转换为 ReportGroup 列表"""
+    return [ReportGroup.from_dict(definition) for definition in definitions]
+
+
+def group_crops(groups, default_crops):
+    """报告分组需要下载的作物：指定了 crops 的分组使用自己的作物，未指定的使用默认作物"""
+    crops = set()
+    for group in groups:
+        crops.update(group.crops if group.crops is not None else default_crops)
+    return crops
+
+
+def needed_by_groups(groups, default_crops, crop, region, subregion):
+    """图片是否属于至少一个报告分组（未指定 crops 的分组只需要默认作物）"""
+    for group in groups:
+        if group.crops is None and crop not in default_crops:
+            continue
+        if group.matches(crop, region, subregion):
+            return True
+    return False
+
+
+def _source_order(parser):
+    """网站列表中的顺序：(作物索引, 地区索引, 子地区索引)"""
+    positions = {}
+    for crop_index, crop in enumerate(parser.get_supported_crops()):
+        for region_index, region in enumerate(parser.get_regions_by_crop(crop_index)):
+            subregions = parser.get_subregions_by_crop_and_region(crop_index, region_index)
+            for subregion_index, subregion in enumerate(subregions):
+                positions[(crop, region, subregion)] = (crop_index, region_index, subregion_index)
+    return positions
+
+
+def missing_by_group(filenames, groups):
+    """把缺失的图片按分组归类
+
+    Args:
+        filenames: 应该存在但没有配对的图片文件名
+        groups: ReportGroup 列表
+
+    Returns:
+        dict: 分组名 -> [(地区, 子地区), ...]，没有缺失的分组不出现
+    """
+    missing = {}
+    for filename in filenames:
+        info = parse_image_filename(filename)
+        if info is None:
+            continue
+        for group in groups:
+            if group.matches(info["crop"], info["region"], info["subregion"]):
+                missing.setdefault(group.name, []).append((info["region"], info["subregion"]))
+    return missing
+
+
+def partition_pairs(image_pairs, groups, parser=None):
+    """一次遍历把图片对分配到所有分组
+
+    Args:
+        image_pairs: find_image_pairs 返回的图片对列表
+        groups: ReportGroup 列表
+        parser: WeatherParser，用于确定网站列表顺序
+
+    Returns:
+        dict: 分组名 -> [(today_path, yesterday_path, region, subregion), ...]
+    """
+    parser = parser or WeatherParser()
+    positions = _source_order(parser)
+    unknown_position = (len(positions),) * 3
+
+    partitions = {group.name: [] for group in groups}
+    # 同一 (作物, 地区, 子地区) 的匹配结果只计算一次
+    membership = {}
+
+    for pair in image_pairs:
+        info = parse_image_filename(pair["filename"])
+        if info is None:
+            continue
+
+        key = (info["crop"], info["region"], info["subregion"])
+        if key not in membership:
+            membership[key] = [group.name for group in groups if group.matches(*key)]
+
+        row = (pair["current"], pair["previous"], info["region"], info["subregion"])
+        sort_key = (positions.get(key, unknown_position), info["horizon"])
+        name_key = (info["region"], info["subregion"], info["horizon"])
+        for group_name in membership[key]:
+            partitions[group_name].append((sort_key, name_key, row))
+
+    orders = {group.name: group.order for group in groups}
+    result = {}
+    for group_name, entries in partitions.items():
+        if orders[group_name] == "name":
+            entries.sort(key=lambda entry: entry[1])
+        else:
+            entries.sort(key=lambda entry: entry[0])
+        result[group_name] = [entry[2] for entry in entries]
+    return result
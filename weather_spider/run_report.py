@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行报告
+记录每次运行的日期、图片编号、各阶段耗时与峰值内存和下载结果，保存为 output/{date}/run_report.json
+"""
+
+import os
+import json
+import time
+from contextlib import contextmanager
+
+from . import memory
+
+REPORT_NAME = "run_report.json"
+
+
+class RunReport:
+    """一次运行的报告"""
+
+    def __init__(self, save_date_str=None, compare_dates=None, shard=None):
+        self.data = {
+            "save_date": save_date_str,
+            "compare_dates": compare_dates,
+            "image_numbers": None,
+            "shard": shard,
+            "stages": {},
+            "downloads": {},
+        }
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的耗时和峰值RSS（MB）
+
+        不支持重置峰值的平台上，peak_rss_mb 为进程启动以来的峰值
+        """
+        memory.reset_peak_rss()
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            self.data["stages"][name] = {
+                "seconds": round(time.time() - started_at, 3),
+                "peak_rss_mb": memory.peak_rss_mb(),
+            }
+
+    def set_image_numbers(self, img_numbers):
+        self.data["image_numbers"] = img_numbers
+
+    def record_downloads(self, results):
+        """记录下载结果：保存路径 -> 是否成功"""
+        self.data["downloads"].update(results)
+
+    def record_missing(self, vrbl, group_name, regions):
+        """记录分组中缺失的地区：[(地区, 子地区), ...]"""
+        self.data.setdefault("missing", {}).setdefault(vrbl, {})[group_name] = [
+            f"{region}/{subregion}" for region, subregion in regions]
+
+    def record_unavailable(self, filenames):
+        """记录可用性探测确认网站上不存在的图片文件名"""
+        self.data["unavailable"] = sorted(set(self.data.get("unavailable", [])) | set(filenames))
+
+    def record_deadline(self, **values):
+        """记录截止时间相关的信息（截止分钟数、跳过的下载和分组）"""
+        self.data.setdefault("deadline", {}).update(values)
+
+    def summary(self):
+        downloads = self.data["downloads"]
+        return {"total": len(downloads), "success": sum(1 for success in downloads.values() if success)}
+
+    def save(self, output_dir):
+        """保存到输出目录，返回报告路径"""
+        self.data["summary"] = self.summary()
+        os.makedirs(output_dir, exist_ok=True)
+        report_path = os.path.join(output_dir, REPORT_NAME)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1, sort_keys=True)
+        return report_path
+
+    @classmethod
+    def load(cls, report_path):
+        report = cls()
+        with open(report_path, "r", encoding="utf-8") as f:
+            report.data.update(json.load(f))
+        return report
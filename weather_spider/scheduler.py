@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截止时间感知的调度
+网站很慢时整个任务可能超过 runner 的时限而什么都没有产出。设置 RUN_DEADLINE_MINUTES 后：
+下载按优先级进行（各地区的国家级图片优先，其次是用户先看的分组），距截止时间不足 RENDER_RESERVE_MINUTES
+时停止下载，用已经下载的图片生成报告；渲染也按分组顺序进行，到达截止时间后跳过剩余分组。
+"""
+
+import time
+
+from .config import config
+
+
+class Deadline:
+    """一次运行的截止时间
+
+    Args:
+        minutes: 从开始到截止的分钟数，<=0 表示没有截止时间
+        reserve_minutes: 为渲染预留的分钟数，剩余时间少于它时停止下载
+    """
+
+    def __init__(self, minutes=0, reserve_minutes=0, started_at=None):
+        self.minutes = minutes
+        self.reserve_minutes = reserve_minutes
+        self.started_at = time.monotonic() if started_at is None else started_at
+
+    @property
+    def enabled(self):
+        return self.minutes > 0
+
+    def remaining(self):
+        """距截止时间的秒数，没有截止时间时为无穷大"""
+        if not self.enabled:
+            return float("inf")
+        return self.minutes * 60 - (time.monotonic() - self.started_at)
+
+    def downloads_closed(self):
+        """是否应停止下载、开始渲染"""
+        return self.enabled and self.remaining() < self.reserve_minutes * 60
+
+    def expired(self):
+        return self.enabled and self.remaining() <= 0
+
+
+def create_deadline():
+    """根据配置创建截止时间（从调用时开始计时）"""
+    return Deadline(config.run_deadline_minutes, config.render_reserve_minutes)
+
+
+def group_rank(groups, crop, region, subregion):
+    """图片所属的第一个分组在配置中的位置，分组顺序即用户阅读的优先顺序"""
+    for rank, group in enumerate(groups):
+        if group.matches(crop, region, subregion):
+            return rank
+    return len(groups)
+
+
+def prioritize_tasks(tasks, parser, groups):
+    """按优先级排列下载任务：国家级图片（每个地区的第一个子地区）优先，其次按分组顺序，最后保持原有顺序
+
+    Args:
+        tasks: ImageTask 列表
+        parser: WeatherParser
+        groups: ReportGroup 列表
+
+    Returns:
+        list: 排序后的 ImageTask 列表
+    """
+    crops = parser.get_supported_crops()
+    ranks = {}
+
+    def priority(item):
+        index, task = item
+        key = (task.crop_index, task.region_index, task.subregion_index)
+        if key not in ranks:
+            region = parser.get_regions_by_crop(task.crop_index)[task.region_index]
+            subregion = parser.get_subregions_by_crop_and_region(task.crop_index, task.region_index)[task.subregion_index]
+            ranks[key] = group_rank(groups, crops[task.crop_index], region, subregion)
+        return (task.subregion_index != 0, ranks[key], index)
+
+    return [task for _, task in sorted(enumerate(tasks), key=priority)]
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按需对比图服务
+提供一个小型HTTP服务，根据查询参数（作物、分组或子地区列表、天气变量、日期）生成对比图，
+渲染结果按输入缓存在内存和磁盘两级LRU中，重复请求直接返回缓存
+
+    GET /compare?vrbl=pcp&group=usa&previous=20250101&current=20250105
+    GET /compare?vrbl=tmp&crop=soybeans&subregions=iowa,illinois
+    GET /groups
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from .config import config
+from .image_generator import create_image_comparison, render_settings
+from .proxy import SingleFlight
+from .reports import ReportGroup, load_groups, parse_image_filename, partition_pairs
+from . import storage
+
+
+# 渲染中的临时文件后缀（保留 .png 扩展名，保存时据此确定格式）
+TMP_SUFFIX = ".tmp.png"
+
+
+class MemoryLRU:
+    """按字节数限制容量的内存LRU缓存，线程安全"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= len(self.items.pop(key))
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskLRU:
+    """磁盘LRU缓存，按文件修改时间淘汰（命中时更新修改时间）"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        os.utime(path)
+        return data
+
+    def commit(self, key, tmp_path):
+        """把渲染好的临时文件放入缓存，超出容量时淘汰最久未使用的文件"""
+        os.replace(tmp_path, self.path_for(key))
+        with self.lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                # 正在渲染的临时文件不计入容量
+                if not name.endswith(".png") or name.endswith(TMP_SUFFIX):
+                    continue
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+                total += stat.st_size
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+
+
+class ComparisonService:
+    """按需生成对比图，带两级缓存"""
+
+    def __init__(self, downloads_root="downloads", cache_dir=None, memory_mb=None, disk_mb=None):
+        self.downloads_root = downloads_root
+        self.groups = {group.name: group for group in load_groups(config.report_groups)}
+        self.memory = MemoryLRU((memory_mb or config.service_memory_cache_mb) * 1024 * 1024)
+        self.disk = DiskLRU(cache_dir or config.service_cache_dir, (disk_mb or config.service_disk_cache_mb) * 1024 * 1024)
+        # 相同输入的并发请求只渲染一次
+        self._flights = SingleFlight()
+
+    def _latest_dates(self, vrbl):
+        dates = sorted(storage.iter_day_entries(os.path.join(self.downloads_root, vrbl)))
+        if not dates:
+            raise ValueError(f"没有 {vrbl} 的下载数据")
+        return (dates[-2] if len(dates) > 1 else dates[-1]), dates[-1]
+
+    def resolve(self, params):
+        """把查询参数解析为渲染所需的图片对和描述
+
+        只根据文件名筛选，不打开任何图片，冷请求只读取实际需要的图片。
+
+        Returns:
+            dict: 包含 pairs、vrbl、group_desc、compare_dates
+        """
+        vrbl = params.get("vrbl", "pcp")
+        if vrbl not in ("pcp", "tmp"):
+            raise ValueError(f"不支持的天气变量: {vrbl}")
+        crop = params.get("crop", "soybeans")
+        nday = int(params.get("nday", "15"))
+        horizon = "forecast" if nday == 15 else f"{nday}day"
+
+        if "subregions" in params:
+            subregions = [item for item in params["subregions"].split(",") if item]
+            group = ReportGroup("custom", display_name="、".join(subregions), subregions=subregions)
+        else:
+            group_name = params.get("group", "all")
+            if group_name not in self.groups:
+                raise ValueError(f"未定义的报告分组: {group_name}")
+            group = self.groups[group_name]
+
+        previous, current = params.get("previous"), params.get("current")
+        # 日期会拼接进下载目录路径，只接受 YYYYMMDD，防止 ../ 之类的路径穿越
+        for date_str in (previous, current):
+            if date_str and not storage.DATE_DIR_PATTERN.fullmatch(date_str):
+                raise ValueError(f"日期格式应为 YYYYMMDD: {date_str}")
+        if not previous or not current:
+            latest_previous, latest_current = self._latest_dates(vrbl)
+            previous = previous or latest_previous
+            current = current or latest_current
+
+        previous_path = os.path.join(self.downloads_root, vrbl, previous)
+        current_path = os.path.join(self.downloads_root, vrbl, current)
+        current_files = set(storage.list_day(current_path))
+        pairs = []
+        for filename in storage.list_day(previous_path):
+            info = parse_image_filename(filename)
+            if filename not in current_files or info is None:
+                continue
+            if info["crop"] != crop or info["horizon"] != horizon:
+                continue
+            pairs.append({
+                "previous": os.path.join(previous_path, filename),
+                "current": os.path.join(current_path, filename),
+                "filename": filename,
+            })
+
+        rows = partition_pairs(pairs, [group])[group.name]
+        return {
+            "pairs": rows,
+            "vrbl": vrbl,
+            "group_desc": group.display_name,
+            "group": group.to_dict(),
+            "compare_dates": {"previous": previous, "current": current},
+        }
+
+    def cache_key(self, request):
+        """缓存键：请求内容、渲染参数和各输入图片的签名"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps({
+            "vrbl": request["vrbl"],
+            "group": request["group"],
+            "compare_dates": request["compare_dates"],
+            "settings": render_settings(),
+        }, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        for today_path, yesterday_path, region, subregion in request["pairs"]:
+            entry = [today_path, storage.stat_signature(today_path),
+                     yesterday_path, storage.stat_signature(yesterday_path)]
+            digest.update(json.dumps(entry).encode("utf-8"))
+        return digest.hexdigest()
+
+    def render(self, params):
+        """生成（或从缓存读取）对比图
+
+        Returns:
+            tuple: (PNG字节, 缓存来源 "memory"/"disk"/"render")
+        """
+        request = self.resolve(params)
+        if not request["pairs"]:
+            raise LookupError("没有符合条件的图片")
+
+        key = self.cache_key(request)
+        data = self.memory.get(key)
+        if data is not None:
+            return data, "memory"
+        # 并发的相同请求等待同一次读取或渲染，共享结果
+        return self._flights.do(key, lambda: self._load_or_render(key, request))
+
+    def _load_or_render(self, key, request):
+        data = self.memory.get(key)
+        if data is not None:
+            return data, "memory"
+
+        source = "disk"
+        data = self.disk.get(key)
+        if data is None:
+            source = "render"
+            tmp_path = os.path.join(self.disk.directory, f"{key}.{threading.get_ident()}{TMP_SUFFIX}")
+            try:
+                create_image_comparison(
+                    image_pairs=request["pairs"],
+                    output_path=tmp_path,
+                    weather_type=request["vrbl"],
+                    group_desc=request["group_desc"],
+                    compare_dates=request["compare_dates"],
+                    save_date_str=request["compare_dates"]["current"]
+                )
+                with open(tmp_path, "rb") as f:
+                    data = f.read()
+                self.disk.commit(key, tmp_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        self.memory.put(key, data)
+        return data, source
+
+
+def _make_handler(service):
+    class ComparisonHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                       "application/json; charset=utf-8")
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+            if parts.path == "/groups":
+                self._send_json(200, [group.to_dict() for group in service.groups.values()])
+            elif parts.path == "/compare":
+                try:
+                    data, source = service.render(params)
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                except LookupError as e:
+                    self._send_json(404, {"error": str(e)})
+                except Exception as e:
+                    # 损坏的下载或打包文件等渲染错误返回500，不让连接在没有响应的情况下断开
+                    from .daily_summary import log
+                    log(f"生成对比图失败 {self.path}: {e!r}", "ERROR")
+                    self._send_json(500, {"error": f"生成对比图失败: {e}"})
+                else:
+                    self._send(200, data, "image/png", {"X-Cache": source})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            from .daily_summary import log
+            log(f"{self.address_string()} {format % args}")
+
+    return ComparisonHandler
+
+
+def serve(host="127.0.0.1", port=8000, downloads_root="downloads"):
+    """启动对比图服务（阻塞运行）"""
+    from .daily_summary import log
+
+    service = ComparisonService(downloads_root=downloads_root)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(service))
+    log(f"对比图服务已启动: http://{host}:{port}/compare")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
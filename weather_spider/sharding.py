@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片执行
+把 WeatherParser 生成的下载任务确定性地拆分为 N 个分片，由多个 runner 并行执行，
+每个分片的下载结果和运行报告写入独立目录，最后由 merge 合并回标准的
+downloads/ 和 output/{date}/ 目录结构
+"""
+
+import os
+import shutil
+import filecmp
+
+from .analogs import AnalogIndex
+from .run_report import RunReport, REPORT_NAME
+
+
+def parse_shard(spec):
+    """解析 "i/N" 格式的分片参数（i 从0开始）
+
+    Returns:
+        tuple: (index, count)
+    """
+    try:
+        index, count = (int(value) for value in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"分片参数格式应为 i/N: {spec}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片序号超出范围: {spec}")
+    return index, count
+
+
+def select_shard(tasks, index, count):
+    """按任务顺序轮流分配，得到第 index 个分片的任务
+
+    任务列表的顺序由 WeatherParser 的配置决定，相同配置下各 runner 的划分完全一致；
+    轮流分配使每个分片都包含各国家的全国图片，单个分片失败时影响较分散。
+    """
+    return tasks[index::count]
+
+
+def shard_root(root, index, count):
+    """分片的输出根目录，下面包含 downloads/ 和 output/"""
+    return os.path.join(root, f"shard-{index}-of-{count}")
+
+
+def _find_shard_roots(root):
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, name) for name in os.listdir(root)
+                  if name.startswith("shard-") and os.path.isdir(os.path.join(root, name)))
+
+
+def _copy_downloads(source_root, target_root):
+    """把分片下载的图片复制到标准目录，已存在且内容相同的文件跳过
+
+    以 "." 开头的元数据（哈希索引、可用性表、图片编号状态等）只描述分片自己的数据，不复制，
+    否则会覆盖标准目录中更完整的版本
+    """
+    copied = 0
+    for directory, dirnames, filenames in os.walk(source_root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        relative = os.path.relpath(directory, source_root)
+        target_dir = os.path.normpath(os.path.join(target_root, relative))
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            source = os.path.join(directory, filename)
+            target = os.path.join(target_dir, filename)
+            if os.path.exists(target) and filecmp.cmp(source, target, shallow=False):
+                continue
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.copy2(source, target)
+            copied += 1
+    return copied
+
+
+def merge_shards(root, downloads_root="downloads", output_root="output"):
+    """合并所有分片的下载数据和运行报告
+
+    Args:
+        root: 分片根目录（包含 shard-i-of-N 子目录）
+        downloads_root: 标准下载目录
+        output_root: 标准输出目录
+
+    Returns:
+        RunReport: 合并后的运行报告，没有找到分片时返回None
+    """
+    from .daily_summary import log
+
+    shard_roots = _find_shard_roots(root)
+    if not shard_roots:
+        log(f"没有找到分片目录: {root}", "ERROR")
+        return None
+
+    merged = None
+    analog_index = AnalogIndex(downloads_root)
+    analogs_added = 0
+    for path in shard_roots:
+        shard_downloads = os.path.join(path, "downloads")
+        copied = _copy_downloads(shard_downloads, downloads_root) if os.path.isdir(shard_downloads) else 0
+        analogs_added += analog_index.merge(AnalogIndex(shard_downloads))
+
+        reports = []
+        shard_output = os.path.join(path, "output")
+        if os.path.isdir(shard_output):
+            for date_dir in sorted(os.listdir(shard_output)):
+                report_path = os.path.join(shard_output, date_dir, REPORT_NAME)
+                if os.path.exists(report_path):
+                    reports.append(RunReport.load(report_path))
+
+        for report in reports:
+            data = report.data
+            if merged is None:
+                merged = RunReport(data["save_date"], data["compare_dates"])
+                merged.set_image_numbers(data["image_numbers"])
+                merged.data["shards"] = {}
+            elif data["image_numbers"] != merged.data["image_numbers"]:
+                log(f"分片 {data['shard']} 的图片编号与其他分片不一致: {data['image_numbers']}", "WARN")
+
+            # 分片中的路径改写为标准下载目录中的路径
+            downloads = {}
+            for save_path, success in data["downloads"].items():
+                relative = os.path.relpath(save_path, shard_downloads)
+                downloads[os.path.join(downloads_root, relative).replace(os.sep, "/")] = success
+            for save_path, success in downloads.items():
+                merged.data["downloads"][save_path] = merged.data["downloads"].get(save_path, False) or success
+
+            merged.data["shards"][data["shard"] or os.path.basename(path)] = {
+                "stages": data["stages"],
+                "summary": report.summary(),
+            }
+
+        log(f"合并分片 {os.path.basename(path)}: 复制 {copied} 张图片")
+
+    if analogs_added:
+        analog_index.save()
+    if merged is not None:
+        merged.save(os.path.join(output_root, merged.data["save_date"]))
+    return merged
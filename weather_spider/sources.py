@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据源和对冲请求
+同一个路径（如 crops/fcstwx/xxx.png）可以从多个数据源获取：主站、内部镜像或本地缓存目录。
+对冲请求先向第一个数据源发请求，若在近期延迟的某个百分位内还没有返回，就向下一个数据源
+再发一个请求，先成功返回的响应胜出；请求失败时立即切换到下一个数据源。
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .transport import build_response
+
+
+class HTTPSource:
+    """HTTP数据源（主站或镜像），请求经过传输层，因此同样支持记录和回放"""
+
+    def __init__(self, base_url, transport):
+        self.base_url = base_url.rstrip("/")
+        self.transport = transport
+        self.name = self.base_url
+
+    def fetch(self, path, headers=None, timeout=30):
+        return self.transport.get(f"{self.base_url}{path}", headers=headers, timeout=timeout)
+
+
+class LocalDirectorySource:
+    """本地缓存目录数据源，目录结构与网站路径一致（如 crops/fcstwx/xxx.png）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.name = directory
+
+    def fetch(self, path, headers=None, timeout=30):
+        file_path = os.path.join(self.directory, *path.split("?", 1)[0].strip("/").split("/"))
+        url = f"file://{os.path.abspath(file_path)}"
+        if not os.path.isfile(file_path):
+            return build_response(url, 404, b"")
+        with open(file_path, "rb") as f:
+            return build_response(url, 200, f.read())
+
+
+def create_sources(locations, transport):
+    """根据配置创建数据源列表
+
+    Args:
+        locations: 数据源地址列表，http(s):// 开头的是网站，file:// 开头或其他的视为本地目录
+        transport: HTTP数据源使用的传输层
+    """
+    sources = []
+    for location in locations:
+        location = location.strip()
+        if not location:
+            continue
+        if location.startswith(("http://", "https://")):
+            sources.append(HTTPSource(location, transport))
+        elif location.startswith("file://"):
+            sources.append(LocalDirectorySource(location[len("file://"):]))
+        else:
+            sources.append(LocalDirectorySource(location))
+    return sources
+
+
+class HedgedFetcher:
+    """对冲请求：超过延迟百分位仍未返回时向下一个数据源补发请求，先成功者胜出
+
+    Args:
+        sources: 数据源列表，按优先级排列
+        percentile: 触发对冲的延迟百分位（0-100）
+        initial_delay_ms: 延迟样本不足时使用的对冲等待时间
+        min_delay_ms: 对冲等待时间下限，避免对冲过于频繁
+        window: 用于计算百分位的最近延迟样本数量
+    """
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, sources, percentile=95, initial_delay_ms=2000, min_delay_ms=100, window=200):
+        if not sources:
+            raise ValueError("至少需要一个数据源")
+        self.sources = sources
+        self.percentile = percentile
+        self.initial_delay = initial_delay_ms / 1000.0
+        self.min_delay = min_delay_ms / 1000.0
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=8 * len(self.sources))
+        return self._executor
+
+    def close(self):
+        """关闭对冲请求使用的线程池（不等待仍在进行的请求）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @staticmethod
+    def _discard(futures):
+        """放弃未胜出的请求：尚未开始的取消，已经开始的在完成后关闭响应，释放连接池中的连接"""
+        def close_response(future):
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(close_response)
+
+    def hedge_delay(self):
+        """当前的对冲等待时间：最近成功请求延迟的指定百分位"""
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < self.MIN_SAMPLES:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100.0))
+        return max(self.min_delay, samples[index])
+
+    def _attempt(self, source, path, headers, timeout):
+        started_at = time.monotonic()
+        response = source.fetch(path, headers=headers, timeout=timeout)
+        if response.status_code < 400:
+            with self.lock:
+                self.latencies.append(time.monotonic() - started_at)
+        return response
+
+    def get(self, path, headers=None, timeout=30):
+        """获取路径对应的响应
+
+        Returns:
+            requests.Response: 第一个成功的响应；全部失败时返回第一个数据源的失败响应
+        """
+        if len(self.sources) == 1:
+            return self._attempt(self.sources[0], path, headers, timeout)
+
+        pending = {}
+        responses = {}
+        errors = []
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            future = self.executor.submit(self._attempt, self.sources[next_index], path, headers, timeout)
+            pending[future] = next_index
+            next_index += 1
+
+        launch()
+        delay = self.hedge_delay()
+        while pending:
+            # 还有后备数据源时只等待对冲时间，否则一直等到有结果
+            wait_timeout = delay if next_index < len(self.sources) else None
+            done, _ = wait(list(pending), timeout=wait_timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if response.status_code < 400:
+                    self._discard(pending)
+                    for failed in responses.values():
+                        failed.close()
+                    return response
+                responses[index] = response
+
+            # 失败后立即切换到下一个数据源
+            if not pending and next_index < len(self.sources):
+                launch()
+
+        if responses:
+            first = min(responses)
+            for index, response in responses.items():
+                if index != first:
+                    response.close()
+            return responses[first]
+        raise errors[0]
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载目录存储模块
+downloads/{vrbl}/{date}/ 既可以是普通目录，也可以被压缩为同级的 {date}.pack 打包文件。
+打包文件是不压缩的 zip（PNG 本身已压缩），通过中央目录按需随机读取单个文件，无需解压。
+其他模块统一使用原有的目录路径 downloads/{vrbl}/{date}/{filename}，由本模块透明地定位到
+目录或打包文件中的对应成员。
+
+可选的差分存储：打包时每 K 天保留一个关键帧（原始PNG），其余日期保存为相对前一天的像素差分
+（打包文件中的 {filename}.delta 成员），读取时沿差分链还原，还原结果缓存在LRU中。
+"""
+
+import io
+import os
+import re
+import shutil
+import datetime
+import threading
+import zipfile
+from collections import OrderedDict
+from PIL import Image
+
+from . import delta
+
+PACK_SUFFIX = ".pack"
+DATE_DIR_PATTERN = re.compile(r"^\d{8}$")
+DELTA_SUFFIX = ".delta"
+DECODED_CACHE_SIZE = 64  # 缓存的已还原图片数量（关键帧和差分还原结果）
+
+# 已打开的打包文件缓存：pack路径 -> (mtime, ZipFile)
+_open_packs = {}
+_packs_lock = threading.Lock()
+
+# 已还原的图片：(路径, 签名) -> PIL图片
+_decoded_images = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def pack_path_for(day_path):
+    """日期目录对应的打包文件路径"""
+    return day_path.rstrip("/\\") + PACK_SUFFIX
+
+
+def _get_pack(pack_path):
+    """获取打开的打包文件，文件被重写后自动重新打开"""
+    try:
+        mtime = os.path.getmtime(pack_path)
+    except OSError:
+        return None
+
+    cached = _open_packs.get(pack_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    archive = zipfile.ZipFile(pack_path, "r")
+    _open_packs[pack_path] = (mtime, archive)
+    if cached:
+        cached[1].close()
+    return archive
+
+
+def _close_pack(pack_path):
+    """关闭缓存的打包文件（重写或删除前调用）"""
+    with _packs_lock:
+        cached = _open_packs.pop(pack_path, None)
+        if cached:
+            cached[1].close()
+
+
+def close_packs():
+    """关闭所有缓存的打包文件
+
+    创建子进程（fork）前调用，避免子进程继承同一个文件描述符、共享读取位置
+    """
+    with _packs_lock:
+        for _, archive in _open_packs.values():
+            archive.close()
+        _open_packs.clear()
+
+
+def _pack_members(day_path):
+    """列出打包文件中的文件名"""
+    with _packs_lock:
+        archive = _get_pack(pack_path_for(day_path))
+        return archive.namelist() if archive else []
+
+
+def day_exists(day_path):
+    """日期目录或其打包文件是否存在"""
+    return os.path.isdir(day_path) or os.path.exists(pack_path_for(day_path))
+
+
+def _strip_delta(name):
+    return name[:-len(DELTA_SUFFIX)] if name.endswith(DELTA_SUFFIX) else name
+
+
+def list_day(day_path):
+    """列出某一天的所有文件名（合并目录和打包文件，差分成员以原文件名列出）"""
+    names = set(_strip_delta(name) for name in _pack_members(day_path))
+    if os.path.isdir(day_path):
+        names.update(os.listdir(day_path))
+    return sorted(names)
+
+
+def image_exists(path):
+    """图片是否存在于目录或打包文件中"""
+    if os.path.exists(path):
+        return True
+    day_path, name = os.path.split(path)
+    members = _pack_members(day_path)
+    return name in members or name + DELTA_SUFFIX in members
+
+
+def _read_member(day_path, name):
+    """读取打包文件成员的字节，不存在时返回None"""
+    with _packs_lock:
+        archive = _get_pack(pack_path_for(day_path))
+        if archive is None:
+            return None
+        try:
+            return archive.read(name)
+        except KeyError:
+            return None
+
+
+def _read_delta(path):
+    """读取图片的差分数据，图片不是差分成员时返回None"""
+    if os.path.exists(path):
+        return None
+    day_path, name = os.path.split(path)
+    return _read_member(day_path, name + DELTA_SUFFIX)
+
+
+def read_bytes(path):
+    """读取图片的原始字节，差分成员还原后编码为PNG"""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    day_path, name = os.path.split(path)
+    data = _read_member(day_path, name)
+    if data is not None:
+        return data
+    if _read_delta(path) is None:
+        raise FileNotFoundError(path)
+
+    buffer = io.BytesIO()
+    _decoded(path).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def stat_signature(path):
+    """图片的廉价签名，内容变化时签名随之变化，不需要读取图片内容
+
+    Returns:
+        tuple: 普通文件为 (大小, 修改时间)，打包文件中的图片为 (大小, CRC32)，不存在时返回None
+    """
+    try:
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass
+
+    day_path, name = os.path.split(path)
+    with _packs_lock:
+        archive = _get_pack(pack_path_for(day_path))
+        if archive is None:
+            return None
+        for member in (name, name + DELTA_SUFFIX):
+            try:
+                info = archive.getinfo(member)
+            except KeyError:
+                continue
+            return (info.file_size, info.CRC)
+        return None
+
+
+def _decoded(path):
+    """图片还原后的像素（带LRU缓存），差分成员沿差分链递归还原前一天的图片"""
+    key = (path, stat_signature(path))
+    with _decoded_lock:
+        image = _decoded_images.get(key)
+        if image is not None:
+            _decoded_images.move_to_end(key)
+            return image
+
+    payload = _read_delta(path)
+    if payload is None:
+        image = Image.open(io.BytesIO(read_bytes(path)))
+        image.load()
+    else:
+        header, _ = delta.read_header(payload)
+        vrbl_path, name = os.path.split(os.path.dirname(path))[0], os.path.basename(path)
+        base_path = os.path.join(vrbl_path, header["base"], name)
+        image = delta.apply(_decoded(base_path), payload)
+
+    with _decoded_lock:
+        _decoded_images[key] = image
+        while len(_decoded_images) > DECODED_CACHE_SIZE:
+            _decoded_images.popitem(last=False)
+    return image
+
+
+def open_image(path):
+    """打开图片，返回PIL图片对象（调用方可以关闭）"""
+    if os.path.exists(path):
+        return Image.open(path)
+    if _read_delta(path) is not None:
+        return _decoded(path).copy()
+    return Image.open(io.BytesIO(read_bytes(path)))
+
+
+def iter_day_entries(vrbl_path):
+    """遍历天气变量目录下所有日期，返回 {日期: 日期目录路径}"""
+    entries = {}
+    if not os.path.isdir(vrbl_path):
+        return entries
+    for name in os.listdir(vrbl_path):
+        date_str = name[:-len(PACK_SUFFIX)] if name.endswith(PACK_SUFFIX) else name
+        if DATE_DIR_PATTERN.match(date_str):
+            entries[date_str] = os.path.join(vrbl_path, date_str)
+    return entries
+
+
+def _delta_depth(path):
+    """图片在差分链中的深度，关键帧为0"""
+    payload = _read_delta(path)
+    return delta.read_header(payload)[0]["depth"] if payload is not None else 0
+
+
+def _encode_delta(source_path, base_day_path, keyframe_interval):
+    """把目录中的图片编码为相对前一天的差分，应保存为关键帧时返回None"""
+    name = os.path.basename(source_path)
+    base_path = os.path.join(base_day_path, name)
+    if not name.endswith(".png") or not image_exists(base_path):
+        return None
+    depth = _delta_depth(base_path) + 1
+    if depth >= keyframe_interval:
+        return None
+
+    with open(source_path, "rb") as f:
+        raw = f.read()
+    image = Image.open(io.BytesIO(raw))
+    image.load()
+    payload = delta.encode(image, _decoded(base_path), os.path.basename(base_day_path), depth)
+    # 差分不比PNG小时（例如画面整体变化）保存为关键帧
+    if payload is None or len(payload) >= len(raw):
+        return None
+    return payload
+
+
+def _remove_tmp(tmp_path):
+    """删除写入失败的临时打包文件"""
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def _rewrite_pack(pack_path, members, replaced):
+    """重写打包文件：members 为 (成员名, 字节) 列表，replaced 为被替换掉的旧成员名集合"""
+    tmp_path = pack_path + ".tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as target:
+            if os.path.exists(pack_path):
+                with zipfile.ZipFile(pack_path, "r") as source:
+                    for info in source.infolist():
+                        if info.filename not in replaced:
+                            target.writestr(info, source.read(info.filename))
+            for name, data in members:
+                target.writestr(name, data)
+    except BaseException:
+        _remove_tmp(tmp_path)
+        raise
+
+    _close_pack(pack_path)
+    os.replace(tmp_path, pack_path)
+
+
+def pack_day(day_path, base_day_path=None, keyframe_interval=0):
+    """把一天的目录打包为单个打包文件，已有的打包文件会与目录中的新文件合并
+
+    Args:
+        day_path: 日期目录
+        base_day_path: 前一天的日期目录（差分的基准），为None时全部保存为关键帧
+        keyframe_interval: 关键帧间隔 K（天），<=1 时不使用差分存储
+
+    Returns:
+        str: 打包文件路径
+    """
+    pack_path = pack_path_for(day_path)
+    tmp_path = pack_path + ".tmp"
+    loose = set(os.listdir(day_path)) if os.path.isdir(day_path) else set()
+
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as target:
+            # 先写入旧打包文件中没有被新文件覆盖的成员
+            if os.path.exists(pack_path):
+                with zipfile.ZipFile(pack_path, "r") as source:
+                    for info in source.infolist():
+                        if _strip_delta(info.filename) not in loose:
+                            target.writestr(info, source.read(info.filename))
+            for name in sorted(loose):
+                source_path = os.path.join(day_path, name)
+                payload = None
+                if base_day_path is not None and keyframe_interval and keyframe_interval > 1:
+                    payload = _encode_delta(source_path, base_day_path, keyframe_interval)
+                if payload is None:
+                    target.write(source_path, name)
+                else:
+                    target.writestr(name + DELTA_SUFFIX, payload)
+    except BaseException:
+        # 写入失败时删除临时文件，原目录和旧打包文件保持不变
+        _remove_tmp(tmp_path)
+        raise
+
+    _close_pack(pack_path)
+    os.replace(tmp_path, pack_path)
+    if os.path.isdir(day_path):
+        shutil.rmtree(day_path)
+    return pack_path
+
+
+def rekeyframe_day(day_path, cutoff_str):
+    """把基准日期早于 cutoff_str（即将被删除）的差分成员还原为关键帧
+
+    Returns:
+        int: 转为关键帧的图片数量
+    """
+    pack_path = pack_path_for(day_path)
+    members = []
+    replaced = set()
+    for member in _pack_members(day_path):
+        if not member.endswith(DELTA_SUFFIX):
+            continue
+        header, _ = delta.read_header(_read_member(day_path, member))
+        if header["base"] >= cutoff_str:
+            continue
+        name = _strip_delta(member)
+        buffer = io.BytesIO()
+        _decoded(os.path.join(day_path, name)).save(buffer, "PNG")
+        members.append((name, buffer.getvalue()))
+        replaced.add(member)
+
+    if members:
+        _rewrite_pack(pack_path, members, replaced)
+    return len(members)
+
+
+def remove_day(day_path):
+    """删除一天的目录和打包文件"""
+    pack_path = pack_path_for(day_path)
+    _close_pack(pack_path)
+    if os.path.exists(pack_path):
+        os.remove(pack_path)
+    if os.path.isdir(day_path):
+        shutil.rmtree(day_path)
+
+
+def compact_downloads(save_root="downloads", today_str=None, retention_days=None, pack=True, keyframe_interval=0):
+    """压缩下载目录：打包过去的日期并按保留天数删除旧数据
+
+    Args:
+        save_root: 下载根目录
+        today_str: 今天的日期（YYYYMMDD），当天目录可能仍在写入，不打包
+        retention_days: 保留天数，早于 今天-保留天数 的日期被删除，为None或<=0时不删除
+        pack: 是否打包过去的日期
+        keyframe_interval: 差分存储的关键帧间隔（天），<=1 时打包为完整PNG
+
+    Returns:
+        dict: {"packed": 打包的天数, "removed": 删除的天数, "rekeyed": 因基准被删除而转为关键帧的图片数}
+    """
+    if today_str is None:
+        today_str = datetime.datetime.now().strftime("%Y%m%d")
+    cutoff_str = None
+    if retention_days and retention_days > 0:
+        today = datetime.datetime.strptime(today_str, "%Y%m%d")
+        cutoff_str = (today - datetime.timedelta(days=retention_days)).strftime("%Y%m%d")
+
+    stats = {"packed": 0, "removed": 0, "rekeyed": 0}
+    if not os.path.isdir(save_root):
+        return stats
+
+    for vrbl in sorted(os.listdir(save_root)):
+        vrbl_path = os.path.join(save_root, vrbl)
+        entries = sorted(iter_day_entries(vrbl_path).items())
+
+        # 删除旧日期之前，先把保留下来的第一天中依赖被删除日期的差分还原为关键帧
+        if cutoff_str:
+            kept = [day_path for date_str, day_path in entries if date_str >= cutoff_str]
+            if kept and len(kept) < len(entries) and os.path.exists(pack_path_for(kept[0])):
+                stats["rekeyed"] += rekeyframe_day(kept[0], cutoff_str)
+
+        base_day_path = None
+        for date_str, day_path in entries:
+            if cutoff_str and date_str < cutoff_str:
+                remove_day(day_path)
+                stats["removed"] += 1
+                continue
+            if pack and date_str < today_str and os.path.isdir(day_path):
+                pack_day(day_path, base_day_path=base_day_path, keyframe_interval=keyframe_interval)
+                stats["packed"] += 1
+            base_day_path = day_path
+
+    return stats
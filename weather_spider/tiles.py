@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+瓦片金字塔输出
+把拼接好的对比图切成固定大小的瓦片并生成多级缩放，描述文件采用 Deep Zoom（.dzi）格式，
+可直接用 OpenSeadragon 等静态查看器按需加载可见区域的瓦片
+"""
+
+import os
+import math
+import shutil
+
+TILE_FORMATS = {
+    "png": "PNG",
+    "jpg": "JPEG",
+}
+
+DZI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" Overlap="0" Format="{fmt}">
+  <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+
+def max_level(width, height):
+    """Deep Zoom 最高级别：第0级为1x1像素，每升一级边长翻倍"""
+    return int(math.ceil(math.log2(max(width, height, 1))))
+
+
+def _write_level_tiles(image, level_dir, tile_size, fmt):
+    """把一个级别的图片切成瓦片"""
+    os.makedirs(level_dir, exist_ok=True)
+    columns = int(math.ceil(image.width / tile_size))
+    rows = int(math.ceil(image.height / tile_size))
+    save_options = {"quality": 90} if fmt == "jpg" else {"compress_level": 1}
+    for col in range(columns):
+        for row in range(rows):
+            box = (col * tile_size, row * tile_size,
+                   min((col + 1) * tile_size, image.width), min((row + 1) * tile_size, image.height))
+            tile = image.crop(box)
+            tile.save(os.path.join(level_dir, f"{col}_{row}.{fmt}"), TILE_FORMATS[fmt], **save_options)
+
+
+def write_tile_pyramid(image, output_dir, name, tile_size=256, fmt="png"):
+    """生成瓦片金字塔
+
+    从原图开始逐级 2x2 盒式降采样，每一级都由上一级生成，整个金字塔只需一次降采样遍历。
+
+    Args:
+        image: 拼接好的PIL图片
+        output_dir: 输出目录
+        name: 金字塔名称，生成 {name}.dzi 和 {name}_files/
+        tile_size: 瓦片边长
+        fmt: 瓦片格式（"png" 或 "jpg"）
+
+    Returns:
+        str: 描述文件路径
+    """
+    if fmt not in TILE_FORMATS:
+        raise ValueError(f"不支持的瓦片格式: {fmt}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    files_dir = os.path.join(output_dir, f"{name}_files")
+    # 清理旧瓦片，避免尺寸变化后残留多余的瓦片
+    if os.path.isdir(files_dir):
+        shutil.rmtree(files_dir)
+
+    level_image = image.convert("RGB") if fmt == "jpg" and image.mode != "RGB" else image
+    for level in range(max_level(image.width, image.height), -1, -1):
+        _write_level_tiles(level_image, os.path.join(files_dir, str(level)), tile_size, fmt)
+        if level > 0:
+            # reduce 的输出尺寸向上取整，与 Deep Zoom 各级尺寸一致
+            level_image = level_image.reduce(2)
+
+    descriptor_path = os.path.join(output_dir, f"{name}.dzi")
+    with open(descriptor_path, "w", encoding="utf-8") as f:
+        f.write(DZI_TEMPLATE.format(tile_size=tile_size, fmt=fmt, width=image.width, height=image.height))
+    return descriptor_path
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多日动图生成器
+把 downloads/ 中同一 (作物, 子地区, 天气变量) 最近 N 天的图片合成为动画 WebP 或 APNG，
+用于查看15天预报在一周内的演变
+"""
+
+import os
+import datetime
+from PIL import Image, ImageDraw, ImageFont
+
+from .parser import WeatherParser
+from . import storage
+
+# 支持的输出格式：扩展名 -> PIL 格式名
+TIMELAPSE_FORMATS = {
+    "webp": "WEBP",
+    "apng": "PNG",
+}
+
+FRAME_DURATION_MS = 800  # 每帧停留时间
+LABEL_HEIGHT = 28  # 帧顶部日期标签高度
+GROUP_COLUMNS = 3  # 地区动图中每行放置的子地区数量
+
+
+def _load_label_font():
+    """加载日期标签字体（日期只包含数字，默认字体即可）"""
+    try:
+        return ImageFont.load_default(size=20)
+    except TypeError:
+        # Pillow < 10.1 不支持 size 参数
+        return ImageFont.load_default()
+
+
+class FrameCache:
+    """帧缓存：每张源图片只解码一次，单图动图和地区动图共用同一帧"""
+
+    def __init__(self):
+        self._frames = {}
+        self._font = _load_label_font()
+
+    def get(self, path, date_str):
+        """获取带日期标签的帧，图片不存在时返回None"""
+        key = (path, date_str)
+        if key in self._frames:
+            return self._frames[key]
+
+        frame = None
+        if storage.image_exists(path):
+            with storage.open_image(path) as img:
+                img = img.convert("RGB")
+            frame = Image.new("RGB", (img.width, img.height + LABEL_HEIGHT), "white")
+            frame.paste(img, (0, LABEL_HEIGHT))
+            draw = ImageDraw.Draw(frame)
+            label = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
+            draw.text((8, 4), label, fill="black", font=self._font)
+
+        self._frames[key] = frame
+        return frame
+
+
+def _date_range(end_date_str, days):
+    """生成从 end_date 往前 days 天的日期列表（按时间正序）"""
+    end_date = datetime.datetime.strptime(end_date_str, "%Y%m%d")
+    return [(end_date - datetime.timedelta(days=offset)).strftime("%Y%m%d")
+            for offset in range(days - 1, -1, -1)]
+
+
+def _save_animation(frames, output_path, fmt):
+    """保存动画，fmt 为 TIMELAPSE_FORMATS 中的键"""
+    first, rest = frames[0], frames[1:]
+    options = {
+        "save_all": True,
+        "append_images": rest,
+        "duration": FRAME_DURATION_MS,
+        "loop": 0,
+    }
+    if fmt == "webp":
+        # 地图以平涂色块为主，最快档的无损编码比有损编码更快且体积相当
+        options.update({"lossless": True, "quality": 0, "method": 0})
+    first.save(output_path, TIMELAPSE_FORMATS[fmt], **options)
+
+
+def _compose_group_frame(frames, cell_size, columns=GROUP_COLUMNS):
+    """把同一天多个子地区的帧拼成网格，缺失的子地区留白以保持位置不变"""
+    cell_width, cell_height = cell_size
+    rows = (len(frames) + columns - 1) // columns
+    cols = min(columns, len(frames))
+    canvas = Image.new("RGB", (cell_width * cols, cell_height * rows), "white")
+    for index, frame in enumerate(frames):
+        if frame is None:
+            continue
+        x = (index % columns) * cell_width
+        y = (index // columns) * cell_height
+        canvas.paste(frame, (x, y))
+    return canvas
+
+
+def create_timelapses(crop_index, vrbl, end_date_str, days=7, nday=15, fmt="webp",
+                      output_dir=None, save_root="downloads", include_groups=True):
+    """为指定作物所有子地区生成多日动图
+
+    Args:
+        crop_index: 作物的索引（0-4）
+        vrbl: 天气变量（"pcp"表示降水，"tmp"表示温度）
+        end_date_str: 最后一天日期（格式：YYYYMMDD）
+        days: 动图包含的天数
+        nday: 天数（15, 60, 180），默认是15
+        fmt: 输出格式（"webp" 或 "apng"）
+        output_dir: 输出目录，默认 output/{end_date}/timelapse
+        save_root: 下载根目录
+        include_groups: 是否同时生成按国家拼接的地区动图
+
+    Returns:
+        list: 生成的动图路径列表
+    """
+    if fmt not in TIMELAPSE_FORMATS:
+        raise ValueError(f"不支持的动图格式: {fmt}")
+
+    parser = WeatherParser()
+    dates = _date_range(end_date_str, days)
+    if output_dir is None:
+        output_dir = os.path.join("output", end_date_str, "timelapse")
+    os.makedirs(output_dir, exist_ok=True)
+
+    cache = FrameCache()
+    crop_name = parser.get_supported_crops()[crop_index]
+    extension = "webp" if fmt == "webp" else "png"
+    outputs = []
+
+    for region_index, region in enumerate(parser.get_regions_by_crop(crop_index)):
+        subregions = parser.get_subregions_by_crop_and_region(crop_index, region_index)
+        # 每个子地区按日期排列的帧，缺失的日期为None
+        region_frames = []
+
+        for subregion_index, subregion in enumerate(subregions):
+            frames = []
+            for date_str in dates:
+                path = parser.generate_save_path(crop_index, region_index, subregion_index,
+                                                 vrbl, nday, save_root=save_root, date_str=date_str)
+                frames.append(cache.get(path, date_str))
+            region_frames.append((subregion, frames))
+
+            available = [frame for frame in frames if frame is not None]
+            if len(available) < 2:
+                continue
+
+            output_path = os.path.join(
+                output_dir,
+                f"timelapse_{vrbl}_{crop_name}_{region}_{subregion}_{dates[0]}_{dates[-1]}.{extension}")
+            _save_animation(available, output_path, fmt)
+            outputs.append(output_path)
+
+        if not include_groups:
+            continue
+
+        # 地区动图：逐日把各子地区的帧拼接起来，复用上面已解码的帧
+        all_frames = [frame for _, frames in region_frames for frame in frames if frame is not None]
+        if not all_frames:
+            continue
+        cell_size = (max(frame.width for frame in all_frames),
+                     max(frame.height for frame in all_frames))
+
+        group_frames = []
+        for day_index in range(len(dates)):
+            day_frames = [frames[day_index] for _, frames in region_frames]
+            if any(frame is not None for frame in day_frames):
+                group_frames.append(_compose_group_frame(day_frames, cell_size))
+
+        if len(group_frames) < 2:
+            continue
+
+        output_path = os.path.join(
+            output_dir, f"timelapse_{vrbl}_{crop_name}_{region}_{dates[0]}_{dates[-1]}.{extension}")
+        _save_animation(group_frames, output_path, fmt)
+        outputs.append(output_path)
+
+    return outputs
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+网络传输层
+NetworkRequest 通过传输层发送请求，支持三种模式：
+    live   - 直接访问网站
+    record - 访问网站，同时把所有响应记录到本地磁带（cassette）目录
+    replay - 离线回放磁带中的响应，可注入延迟和失败，用于可重复的调试和性能分析
+"""
+
+import os
+import json
+import time
+import atexit
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+INDEX_NAME = "index.json"
+BODIES_DIR = "bodies"
+INDEX_FLUSH_EVERY = 100  # 记录多少个响应后写一次索引
+
+
+def cassette_key(url):
+    """磁带中的键：只使用路径和查询参数，换用镜像或代理地址时仍能回放"""
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+def build_response(url, status_code, content, content_type=None, encoding=None):
+    """构造一个与真实请求行为一致的 requests.Response"""
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = content
+    response._content_consumed = True
+    response.encoding = encoding
+    if content_type:
+        response.headers["Content-Type"] = content_type
+    return response
+
+
+class HTTPTransport:
+    """直接访问网站的传输层"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url, headers=None, timeout=30):
+        return self.session.get(url, headers=headers, timeout=timeout)
+
+
+class Cassette:
+    """磁带目录：index.json 记录每个URL的状态码和内容类型，响应体单独存放在 bodies/ 中"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.index = self._load_index()
+        # 尚未写入 index.json 的记录数
+        self.dirty = 0
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 磁带索引无法读取 {self.index_path} - {e}")
+            return {}
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, BODIES_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def save(self, url, response):
+        """记录一个响应（同一URL后记录的覆盖先记录的）
+
+        响应体立即写入；索引每 INDEX_FLUSH_EVERY 个响应写一次，结束时由 flush 写入剩余的记录
+        """
+        key = cassette_key(url)
+        body_path = self._body_path(key)
+        with self.lock:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            with open(body_path, "wb") as f:
+                f.write(response.content)
+            self.index[key] = {
+                "status": response.status_code,
+                "content_type": response.headers.get("Content-Type"),
+                "encoding": response.encoding,
+            }
+            self.dirty += 1
+            if self.dirty >= INDEX_FLUSH_EVERY:
+                self._write_index()
+
+    def flush(self):
+        """把尚未写入的记录写入 index.json"""
+        with self.lock:
+            if self.dirty:
+                self._write_index()
+
+    def _write_index(self):
+        # 合并同一目录的其他磁带实例已写入的记录，经临时文件原子替换，中断时不会留下截断的索引
+        index = self._load_index()
+        index.update(self.index)
+        self.index = index
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = 0
+
+    def load(self, url):
+        """读取记录的响应，未记录时返回None"""
+        key = cassette_key(url)
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        with open(self._body_path(key), "rb") as f:
+            content = f.read()
+        return build_response(url, entry["status"], content, entry.get("content_type"), entry.get("encoding"))
+
+
+class RecordingTransport:
+    """访问网站并把响应记录到磁带"""
+
+    def __init__(self, inner, cassette):
+        self.inner = inner
+        self.cassette = cassette
+        # 没有显式关闭时，进程退出前写入剩余的索引记录
+        atexit.register(cassette.flush)
+
+    def close(self):
+        self.cassette.flush()
+
+    def get(self, url, headers=None, timeout=30):
+        response = self.inner.get(url, headers=headers, timeout=timeout)
+        # 部分内容（可用性探测的 Range 请求）不记录，避免覆盖完整的响应
+        if response.status_code != 206:
+            self.cassette.save(url, response)
+        return response
+
+
+class ReplayTransport:
+    """离线回放磁带中的响应
+
+    Args:
+        cassette: 磁带
+        latency_ms: 每个请求注入的延迟（毫秒）
+        failure_rate: 随机注入连接失败的概率（0-1），失败会进入正常的重试流程
+        seed: 随机种子，相同种子的失败序列相同
+    """
+
+    def __init__(self, cassette, latency_ms=0, failure_rate=0.0, seed=None):
+        self.cassette = cassette
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=30):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+
+        if self.failure_rate > 0:
+            with self.lock:
+                failed = self.random.random() < self.failure_rate
+            if failed:
+                raise requests.ConnectionError(f"回放注入的失败: {url}")
+
+        response = self.cassette.load(url)
+        if response is None:
+            raise requests.ConnectionError(f"磁带中没有记录该请求: {url}")
+        return response
+
+
+def create_transport(session, mode=None):
+    """根据配置创建传输层
+
+    Args:
+        session: live/record 模式使用的requests会话
+        mode: 传输模式（live/record/replay），默认使用 WEATHER_SPIDER_TRANSPORT
+    """
+    from .config import config
+
+    mode = mode or config.transport_mode
+    if mode == "live":
+        return HTTPTransport(session)
+    if mode == "record":
+        return RecordingTransport(HTTPTransport(session), Cassette(config.cassette_dir))
+    if mode == "replay":
+        return ReplayTransport(Cassette(config.cassette_dir), latency_ms=config.replay_latency_ms,
+                               failure_rate=config.replay_failure_rate, seed=config.replay_seed)
+    raise ValueError(f"不支持的传输模式: {mode}")
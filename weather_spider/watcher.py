@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监听模式：轮询 getcropimglabs.pl 返回的图片编号，编号变化即说明新预报已发布，
+立即触发下载和对比图生成流程。部分图片下载失败时，之后的轮询只重试这些图片，全部成功后再重新生成对比图
+"""
+
+import os
+import json
+import time
+
+from .config import config
+from .network import NetworkRequest
+
+# 记录上次处理过的图片编号，进程重启后不会重复触发
+STATE_FILE = os.path.join("downloads", ".image_numbers.json")
+
+
+class ForecastWatcher:
+    """预报发布监听器"""
+
+    def __init__(self, interval=None, state_file=STATE_FILE):
+        self.interval = config.watch_interval if interval is None else interval
+        self.state_file = state_file
+        self.network = NetworkRequest()
+        # 上次触发未完成的下载：(图片编号, 保存日期, 未成功的文件名集合)，为None时没有待重试的图片
+        self.pending = None
+
+    def load_state(self):
+        """读取上次处理过的图片编号"""
+        if not os.path.exists(self.state_file):
+            return None
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_state(self, img_numbers):
+        """保存已处理的图片编号"""
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump(img_numbers, f)
+
+    def poll(self):
+        """轮询一次，返回新发布的图片编号，没有变化时返回None"""
+        img_numbers = self.network.get_image_numbers()
+        if not img_numbers:
+            return None
+
+        last = self.load_state()
+        if last and last.get("forecast") == img_numbers["forecast"] \
+                and last.get("past_pcp") == img_numbers["past_pcp"] \
+                and last.get("past_tmp") == img_numbers["past_tmp"]:
+            return None
+        return img_numbers
+
+    @staticmethod
+    def unfinished(summary, results, planned):
+        """计划下载但没有成功的文件名（下载失败或因截止时间跳过），确认网站上不存在的图片不计入"""
+        succeeded = set(os.path.basename(save_path) for save_path, success in results.items() if success)
+        unavailable = set(summary.report.data.get("unavailable", []))
+        return set(planned) - succeeded - unavailable
+
+    def trigger(self, img_numbers):
+        """对新编号执行下载和生成流程，返回是否所有图片都下载成功
+
+        同一编号上次有图片未下载成功时只重试这些图片，全部成功后才重新生成对比图，不会重新下载已有的图片。
+        """
+        from .daily_summary import DailyWeatherSummary, log
+
+        retry = None
+        if self.pending is not None and self.pending[0] == img_numbers:
+            _, save_date, retry = self.pending
+        else:
+            log(f"检测到新预报: {img_numbers['forecast']}|{img_numbers['past_pcp']}|{img_numbers['past_tmp']}")
+            # 新编号发布即属于当天的数据
+            save_date = config.get_current_time()
+
+        summary = DailyWeatherSummary(save_date=save_date, img_numbers=img_numbers, retry_filenames=retry)
+        try:
+            if retry is None:
+                planned = [summary.task_filename(task) for task in summary.plan_tasks()]
+                results = summary.run()
+            else:
+                planned = retry
+                results = summary.download()
+
+            failed = self.unfinished(summary, results, planned)
+            if failed:
+                self.pending = (img_numbers, save_date, failed)
+                return False
+            if retry is not None:
+                summary.run(download=False)
+        finally:
+            summary.close()
+        self.pending = None
+        return True
+
+    def watch(self, max_runs=None):
+        """持续轮询，直到触发 max_runs 次（为None时一直运行）"""
+        from .daily_summary import log
+
+        log(f"监听模式启动，轮询间隔 {self.interval} 秒")
+        runs = 0
+        try:
+            while max_runs is None or runs < max_runs:
+                img_numbers = self.poll()
+                if img_numbers:
+                    # 只有全部下载成功才记录编号，部分失败或出错时下次轮询会重试
+                    try:
+                        if self.trigger(img_numbers):
+                            self.save_state(img_numbers)
+                        else:
+                            log(f"新预报有 {len(self.pending[2])} 张图片未下载成功，将在下次轮询时重试", "WARN")
+                    except Exception as e:
+                        log(f"处理新预报出错，将在下次轮询时重试: {e}", "ERROR")
+                    runs += 1
+                    if max_runs is not None and runs >= max_runs:
+                        break
+                time.sleep(self.interval)
+        finally:
+            self.network.close()